@@ -1,5 +1,8 @@
+import hashlib
 import logging
 import re
+import threading
+from collections import OrderedDict
 
 from staticfiles.storage import staticfiles_storage
 from staticfiles import finders
@@ -28,6 +31,53 @@ def _url_replace_regex(prefix):
         """.format(prefix=prefix)
 
 
+class _LRUCache(object):
+    """
+    A small thread-safe least-recently-used cache
+    """
+    def __init__(self, size):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """
+        Return the value cached for key, or default
+        """
+        with self._lock:
+            try:
+                value = self._items.pop(key)
+            except KeyError:
+                return default
+            self._items[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Cache value for key, evicting the least recently used items beyond size
+        """
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = value
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Empty the cache
+        """
+        with self._lock:
+            self._items.clear()
+
+
+# The UrlRewriters by course and static paths
+_REWRITER_CACHE = _LRUCache(100)
+# The resolved urls of static assets by course and path
+_STATIC_URL_CACHE = _LRUCache(10000)
+# The rewritten html by rewriter and md5 of the original html
+_REWRITTEN_HTML_CACHE = _LRUCache(500)
+
+
 def try_staticfiles_lookup(path):
     """
     Try to lookup a path in staticfiles_storage.  If it fails, return
@@ -107,57 +157,156 @@ def replace_static_urls(text, data_directory, course_id=None, static_asset_path=
 
     def replace_static_url(match):
         original = match.group(0)
-        prefix = match.group('prefix')
         quote = match.group('quote')
         rest = match.group('rest')
 
-        # Don't mess with things that end in '?raw'
-        if rest.endswith('?raw'):
+        url = _static_url(match.group('prefix'), rest, data_directory, course_id, static_asset_path)
+        if url is None:
             return original
+        return "".join([quote, url, quote])
 
-        # In debug mode, if we can find the url as is,
-        if settings.DEBUG and finders.find(rest, True):
-            return original
-        # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
-        elif (not static_asset_path) and course_id and modulestore().get_modulestore_type(course_id) != XML_MODULESTORE_TYPE:
-            # first look in the static file pipeline and see if we are trying to reference
-            # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
+    return re.sub(
+        _url_replace_regex(_static_prefix_regex(data_directory, static_asset_path)),
+        replace_static_url,
+        text
+    )
 
-            exists_in_staticfiles_storage = False
-            try:
-                exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
 
-            if exists_in_staticfiles_storage:
+def _static_prefix_regex(data_directory, static_asset_path):
+    """
+    The regex for the prefix of static urls which haven't been replaced yet
+    """
+    return u'(?:{static_url}|/static/)(?!{data_dir})'.format(
+        static_url=settings.STATIC_URL,
+        data_dir=static_asset_path or data_directory
+    )
+
+
+def _static_url(prefix, rest, data_directory, course_id, static_asset_path):
+    """
+    Return the url to replace the static url prefix + rest with, or None to leave it as is.
+    See replace_static_urls for the arguments.
+    """
+    # Don't mess with things that end in '?raw'
+    if rest.endswith('?raw'):
+        return None
+
+    # In debug mode, if we can find the url as is,
+    if settings.DEBUG and finders.find(rest, True):
+        return None
+    # if we're running with a MongoBacked store course_namespace is not None, then use studio style urls
+    elif (not static_asset_path) and course_id and modulestore().get_modulestore_type(course_id) != XML_MODULESTORE_TYPE:
+        # first look in the static file pipeline and see if we are trying to reference
+        # a piece of static content which is in the edx-platform repo (e.g. JS associated with an xmodule)
+
+        exists_in_staticfiles_storage = False
+        try:
+            exists_in_staticfiles_storage = staticfiles_storage.exists(rest)
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+
+        if exists_in_staticfiles_storage:
+            url = staticfiles_storage.url(rest)
+        else:
+            # if not, then assume it's courseware specific content and then look in the
+            # Mongo-backed database
+            url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
+    # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
+    else:
+        course_path = "/".join((static_asset_path or data_directory, rest))
+
+        try:
+            if staticfiles_storage.exists(rest):
                 url = staticfiles_storage.url(rest)
             else:
-                # if not, then assume it's courseware specific content and then look in the
-                # Mongo-backed database
-                url = StaticContent.convert_legacy_static_url_with_course_id(rest, course_id)
-        # Otherwise, look the file up in staticfiles_storage, and append the data directory if needed
-        else:
-            course_path = "/".join((static_asset_path or data_directory, rest))
+                url = staticfiles_storage.url(course_path)
+        # And if that fails, assume that it's course content, and add manually data directory
+        except Exception as err:
+            log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
+                rest, str(err)))
+            url = "".join([prefix, course_path])
+    return url
 
-            try:
-                if staticfiles_storage.exists(rest):
-                    url = staticfiles_storage.url(rest)
-                else:
-                    url = staticfiles_storage.url(course_path)
-            # And if that fails, assume that it's course content, and add manually data directory
-            except Exception as err:
-                log.warning("staticfiles_storage couldn't find path {0}: {1}".format(
-                    rest, str(err)))
-                url = "".join([prefix, course_path])
 
+class UrlRewriter(object):
+    """
+    Does what replace_static_urls, replace_course_urls and replace_jump_to_id_urls do, in a
+    single pass over the text with one precompiled regex.
+
+    Resolved static urls are memoized per course and path, and rewritten text is memoized
+    by its md5, so use get_url_rewriter to share rewriters between renders.
+    """
+    def __init__(self, data_directory, course_id, static_asset_path='', jump_to_id_base_url=None):
+        """
+        See replace_static_urls and replace_jump_to_id_urls for the arguments. If jump_to_id_base_url
+        is None, /jump_to_id/ urls are left alone.
+        """
+        self.data_directory = data_directory
+        self.course_id = course_id
+        self.static_asset_path = static_asset_path
+        self.jump_to_id_base_url = jump_to_id_base_url
+        self.key = (data_directory, course_id, static_asset_path, jump_to_id_base_url)
+
+        prefixes = [
+            u'(?P<static>{})'.format(_static_prefix_regex(data_directory, static_asset_path)),
+            u'(?P<course>/course/)',
+        ]
+        if jump_to_id_base_url is not None:
+            prefixes.append(u'(?P<jump_to_id>/jump_to_id/)')
+        self.regex = re.compile(_url_replace_regex(u'|'.join(prefixes)))
+
+    def _static_url(self, prefix, rest):
+        """
+        Memoized version of static_replace._static_url for this rewriter's course
+        """
+        key = (self.key, prefix, rest)
+        url = _STATIC_URL_CACHE.get(key, key)
+        if url is key:
+            url = _static_url(prefix, rest, self.data_directory, self.course_id, self.static_asset_path)
+            _STATIC_URL_CACHE.set(key, url)
+        return url
+
+    def _replace_url(self, match):
+        """
+        Return the replacement for one matched url
+        """
+        quote = match.group('quote')
+        rest = match.group('rest')
+        if match.group('static') is not None:
+            url = self._static_url(match.group('prefix'), rest)
+            if url is None:
+                return match.group(0)
+        elif match.group('course') is not None:
+            url = '/courses/' + self.course_id.to_deprecated_string() + '/' + rest
+        else:
+            url = self.jump_to_id_base_url + rest
         return "".join([quote, url, quote])
 
-    return re.sub(
-        _url_replace_regex(u'(?:{static_url}|/static/)(?!{data_dir})'.format(
-            static_url=settings.STATIC_URL,
-            data_dir=static_asset_path or data_directory
-        )),
-        replace_static_url,
-        text
-    )
+    def rewrite(self, text, cache=False):
+        """
+        Return text with its urls replaced. If cache, the result is memoized by the md5 of text,
+        which pays off for content which is the same on every render (e.g. html modules).
+        """
+        if not cache:
+            return self.regex.sub(self._replace_url, text)
+
+        digest = hashlib.md5(text.encode('utf-8') if isinstance(text, unicode) else text).hexdigest()
+        key = (self.key, digest)
+        rewritten = _REWRITTEN_HTML_CACHE.get(key)
+        if rewritten is None:
+            rewritten = self.regex.sub(self._replace_url, text)
+            _REWRITTEN_HTML_CACHE.set(key, rewritten)
+        return rewritten
+
+
+def get_url_rewriter(data_directory, course_id, static_asset_path='', jump_to_id_base_url=None):
+    """
+    Return the (shared) UrlRewriter for these arguments, including the current STATIC_URL
+    """
+    key = (data_directory, course_id, static_asset_path, jump_to_id_base_url, settings.STATIC_URL)
+    rewriter = _REWRITER_CACHE.get(key)
+    if rewriter is None:
+        rewriter = UrlRewriter(data_directory, course_id, static_asset_path, jump_to_id_base_url)
+        _REWRITER_CACHE.set(key, rewriter)
+    return rewriter
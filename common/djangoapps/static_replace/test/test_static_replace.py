@@ -1,8 +1,8 @@
 import re
 
 from nose.tools import assert_equals, assert_true, assert_false  # pylint: disable=E0611
-from static_replace import (replace_static_urls, replace_course_urls,
-                            _url_replace_regex)
+from static_replace import (replace_static_urls, replace_course_urls, replace_jump_to_id_urls,
+                            _url_replace_regex, get_url_rewriter, _STATIC_URL_CACHE, _REWRITTEN_HTML_CACHE)
 from mock import patch, Mock
 
 from xmodule.modulestore.locations import SlashSeparatedCourseKey
@@ -123,3 +123,34 @@ def test_regex():
     for s in no:
         print 'Should not match: {0!r}'.format(s)
         assert_false(re.match(regex, s))
+
+
+@patch('static_replace.staticfiles_storage')
+@patch('static_replace.modulestore')
+def test_url_rewriter(mock_modulestore, mock_storage):
+    """
+    The single pass rewriter does what the three separate replacements do, and only looks up each asset once
+    """
+    _STATIC_URL_CACHE.clear()
+    _REWRITTEN_HTML_CACHE.clear()
+    mock_storage.exists.return_value = False
+    mock_modulestore.return_value = Mock(MongoModuleStore)
+    jump_to_id_base_url = '/courses/org/course/run/jump_to_id/'
+    text = (
+        '<img src="/static/file.png"/><a href="/course/info">info</a>'
+        '<a href="/jump_to_id/vertical">vertical</a><img src=\'/static/file.png\'/><a href="/static/foo.png?raw"/>'
+    )
+
+    expected = replace_jump_to_id_urls(
+        replace_course_urls(replace_static_urls(text, DATA_DIRECTORY, COURSE_KEY), COURSE_KEY),
+        COURSE_KEY,
+        jump_to_id_base_url
+    )
+    mock_storage.exists.reset_mock()
+
+    rewriter = get_url_rewriter(DATA_DIRECTORY, COURSE_KEY, jump_to_id_base_url=jump_to_id_base_url)
+    assert_true(rewriter is get_url_rewriter(DATA_DIRECTORY, COURSE_KEY, jump_to_id_base_url=jump_to_id_base_url))
+    assert_equals(expected, rewriter.rewrite(text))
+    assert_equals(expected, rewriter.rewrite(text, cache=True))
+    assert_equals(expected, rewriter.rewrite(text, cache=True))
+    mock_storage.exists.assert_called_once_with('file.png')
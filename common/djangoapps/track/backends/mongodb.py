@@ -9,6 +9,7 @@ from pymongo import MongoClient
 from pymongo.errors import PyMongoError
 
 from track.backends import BaseBackend
+from track.backends.queued import QueuedBackend
 
 
 log = logging.getLogger(__name__)
@@ -95,3 +96,61 @@ class MongoBackend(BaseBackend):
             # during the next event.
             msg = 'Error inserting to MongoDB event tracker backend'
             log.exception(msg)
+
+    def send_batch(self, events):
+        """Insert the events in to the Mongo collection at once"""
+        try:
+            self.collection.insert(events, manipulate=False)
+        except Exception:  # pylint: disable=broad-except
+            # The events will be lost in case of a connection error, or an
+            # event that can't be encoded. Batches are inserted from a
+            # background thread, which an exception would end. pymongo
+            # will re-connect/re-authenticate automatically during the
+            # next batch.
+            msg = 'Error inserting %d events to MongoDB event tracker backend'
+            log.exception(msg, len(events))
+
+
+class BufferedMongoBackend(MongoBackend):
+    """
+    MongoDB event tracker backend which inserts events in batches from a
+    background thread, so that tracking doesn't add a database round trip
+    to the request that emits an event.
+
+    Events are queued in memory and lost if the process dies before they
+    are inserted.
+    """
+
+    def __init__(self, batch_size=100, flush_interval=1.0, max_queue_size=10000,
+                 block_when_full=False, flush_on_exit=True, **kwargs):
+        """
+        Connect to a MongoDB.
+
+        Takes the parameters of MongoBackend, and those of QueuedBackend
+        controlling the batches.
+
+        """
+        super(BufferedMongoBackend, self).__init__(**kwargs)
+
+        self.queue = QueuedBackend(
+            self,
+            name='mongodb',
+            batch_size=batch_size,
+            flush_interval=flush_interval,
+            max_queue_size=max_queue_size,
+            block_when_full=block_when_full,
+            flush_on_exit=flush_on_exit,
+        )
+
+    @property
+    def dropped_events(self):
+        """Number of events dropped because the queue was full"""
+        return self.queue.dropped_events
+
+    def send(self, event):
+        """Queue the event to be inserted in to the Mongo collection"""
+        self.queue.send(event)
+
+    def close(self):
+        """Insert the events waiting in the queue, and stop the background thread"""
+        self.queue.close()
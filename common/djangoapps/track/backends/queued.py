@@ -0,0 +1,146 @@
+"""Event tracker backend that hands events to another backend from a background thread."""
+
+from __future__ import absolute_import
+
+import atexit
+import logging
+import os
+import Queue
+import threading
+import time
+
+from dogapi import dog_stats_api
+
+from track.backends import BaseBackend
+
+
+log = logging.getLogger(__name__)
+
+
+class QueuedBackend(BaseBackend):
+    """
+    Event tracker backend which queues events in memory, and sends them to
+    another backend in batches from a background thread, so that a slow
+    backend doesn't hold up the requests that emit events.
+
+    Events are lost if the process dies before they are sent.
+    """
+
+    def __init__(self, backend, name=None, batch_size=100, flush_interval=1.0, max_queue_size=10000,
+                 block_when_full=False, flush_on_exit=True, **kwargs):
+        """
+        Queue events for a backend.
+
+        :Parameters:
+
+          - `backend`: the backend to send the events to, with its `send_batch` method
+          - `name`: name of the backend in the dog_stats_api metrics
+          - `batch_size`: most events to send at once
+          - `flush_interval`: most seconds to hold on to an event before sending it
+          - `max_queue_size`: most events waiting to be sent
+          - `block_when_full`: whether sending an event when `max_queue_size` events are
+            waiting blocks until there is room, rather than dropping the event
+          - `flush_on_exit`: whether to send the waiting events when the process exits
+
+        """
+        super(QueuedBackend, self).__init__(**kwargs)
+
+        self.backend = backend
+        self.name = name or backend.__class__.__name__
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.block_when_full = block_when_full
+
+        # Number of events dropped because the queue was full
+        self.dropped_events = 0
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._stopping = None
+        self._worker = None
+
+        if flush_on_exit:
+            atexit.register(self.close)
+
+    def send(self, event):
+        """Queue the event to be sent to the backend"""
+        self._start_worker()
+        try:
+            self._queue.put(event, self.block_when_full)
+        except Queue.Full:
+            with self._lock:
+                self.dropped_events += 1
+            dog_stats_api.increment('track.backend.{0}.dropped'.format(self.name))
+
+    def close(self):
+        """Send the events waiting in the queue, and stop the background thread"""
+        worker = self._worker
+        if worker is not None and self._pid == os.getpid():
+            self._stopping.set()
+            worker.join()
+
+    def _start_worker(self):
+        """
+        Start the background thread, unless it is already running in this process.
+
+        Threads don't survive a fork, so a process forked after the backend was
+        created starts its own thread (and queue) on its first event.
+        """
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = Queue.Queue(self.max_queue_size)
+            self._stopping = threading.Event()
+            self._worker = threading.Thread(
+                target=self._run,
+                args=(self._queue, self._stopping),
+                name='QueuedBackend-{0}'.format(self.name),
+            )
+            self._worker.daemon = True
+            self._worker.start()
+            self._pid = os.getpid()
+
+    def _run(self, queue, stopping):
+        """Send batches of events from `queue` until `stopping` is set and it is empty"""
+        while not (stopping.is_set() and queue.empty()):
+            try:
+                self._send_next_batch(queue, stopping)
+            except Exception:  # pylint: disable=broad-except
+                # An exception would end the background thread, and lose all future events too
+                log.exception('Error in the background thread of event tracker backend %s', self.name)
+
+    def _send_next_batch(self, queue, stopping):
+        """Wait for a batch of events from `queue`, and send it to the backend"""
+        batch = []
+        deadline = time.time() + self.flush_interval
+        while len(batch) < self.batch_size and not stopping.is_set():
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(queue.get(True, timeout))
+            except Queue.Empty:
+                break
+        # Once stopping, take whatever is left without waiting for more
+        while stopping.is_set() and len(batch) < self.batch_size:
+            try:
+                batch.append(queue.get_nowait())
+            except Queue.Empty:
+                break
+
+        if batch:
+            self._send_batch(batch, queue.qsize())
+
+    def _send_batch(self, batch, queue_depth):
+        """Send a batch of events to the backend, recording how long it took and how many events are left"""
+        dog_stats_api.gauge('track.backend.{0}.queue_depth'.format(self.name), queue_depth)
+        try:
+            with dog_stats_api.timer('track.backend.{0}.send_batch'.format(self.name)):
+                self.backend.send_batch(batch)
+        except Exception:  # pylint: disable=broad-except
+            # An exception would end the background thread, and lose all future events too
+            log.exception('Error sending %d events to event tracker backend %s', len(batch), self.name)
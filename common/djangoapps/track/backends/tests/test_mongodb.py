@@ -1,12 +1,13 @@
 from __future__ import absolute_import
 
+import threading
 from uuid import uuid4
 
 from mock import patch
 
 from django.test import TestCase
 
-from track.backends.mongodb import MongoBackend
+from track.backends.mongodb import BufferedMongoBackend, MongoBackend
 
 
 class TestMongoBackend(TestCase):
@@ -38,3 +39,66 @@ class TestMongoBackend(TestCase):
 
         self.assertEqual(events[0], first_argument(calls[0]))
         self.assertEqual(events[1], first_argument(calls[1]))
+
+
+class TestBufferedMongoBackend(TestCase):
+    def setUp(self):
+        self.mongo_patcher = patch('track.backends.mongodb.MongoClient')
+        self.addCleanup(self.mongo_patcher.stop)
+        self.mongo_patcher.start()
+
+    def inserted_batches(self, backend):
+        return [args[0] for _, args, _ in backend.collection.insert.mock_calls]
+
+    def test_batches(self):
+        backend = BufferedMongoBackend(batch_size=2, flush_interval=60, flush_on_exit=False)
+        events = [{'test': num} for num in range(5)]
+        for event in events:
+            backend.send(event)
+        backend.close()
+
+        batches = self.inserted_batches(backend)
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(sum(batches, []), events)
+
+    def test_full_queue(self):
+        backend = BufferedMongoBackend(batch_size=1, max_queue_size=1, flush_on_exit=False)
+
+        # Hold up the insert of the first event, so that the second one fills the queue
+        inserting = threading.Event()
+        release = threading.Event()
+
+        def insert(*args, **kwargs):
+            inserting.set()
+            release.wait()
+        backend.collection.insert.side_effect = insert
+
+        backend.send({'test': 1})
+        inserting.wait()
+        backend.send({'test': 2})
+        backend.send({'test': 3})
+        release.set()
+        backend.close()
+
+        self.assertEqual(backend.dropped_events, 1)
+        self.assertEqual(self.inserted_batches(backend), [[{'test': 1}], [{'test': 2}]])
+
+    def test_insert_error(self):
+        backend = BufferedMongoBackend(batch_size=1, flush_on_exit=False)
+
+        # An error other than a PyMongoError, e.g. for an event that can't be encoded
+        inserted = threading.Event()
+
+        def insert(events, **kwargs):
+            inserted.set()
+            if events == [{'test': 1}]:
+                raise ValueError('Cannot encode event')
+        backend.collection.insert.side_effect = insert
+
+        backend.send({'test': 1})
+        inserted.wait()
+        backend.send({'test': 2})
+        backend.close()
+
+        # The background thread kept inserting events after the error
+        self.assertEqual(self.inserted_batches(backend), [[{'test': 1}], [{'test': 2}]])
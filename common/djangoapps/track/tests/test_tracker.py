@@ -4,6 +4,7 @@ from django.test.utils import override_settings
 
 import track.tracker as tracker
 from track.backends import BaseBackend
+from track.backends.queued import QueuedBackend
 
 
 SIMPLE_SETTINGS = {
@@ -15,6 +16,22 @@ SIMPLE_SETTINGS = {
     }
 }
 
+QUEUED_SETTINGS = {
+    'queued': {
+        'ENGINE': 'track.tests.test_tracker.DummyBackend',
+        'QUEUE': {
+            'batch_size': 3,
+            'flush_on_exit': False,
+        }
+    }
+}
+
+PROCESSOR_SETTINGS = [
+    {
+        'ENGINE': 'track.tests.test_tracker.DummyProcessor',
+    }
+]
+
 MULTI_SETTINGS = {
     'first': {
         'ENGINE': 'track.tests.test_tracker.DummyBackend',
@@ -97,6 +114,35 @@ class TestTrackerDjangoInstantiation(TestCase):
 
         self.assertEqual(len(backends), 1)
 
+    @override_settings(TRACKING_BACKENDS=QUEUED_SETTINGS)
+    def test_django_queued_settings(self):
+        """Test that a backend with a QUEUE is sent events in batches."""
+
+        queued_backend = self._reload_backends()['queued']
+        self.assertIsInstance(queued_backend, QueuedBackend)
+
+        event_count = 10
+        for _ in xrange(event_count):
+            tracker.send({})
+        queued_backend.close()
+
+        self.assertEqual(queued_backend.backend.count, event_count)
+        self.assertTrue(all(size <= 3 for size in queued_backend.backend.batch_sizes))
+
+    @override_settings(TRACKING_BACKENDS=MULTI_SETTINGS, TRACKING_PROCESSORS=PROCESSOR_SETTINGS)
+    def test_django_processor_settings(self):
+        """Test that processors run once for each event, before the backends see it."""
+
+        backends = self._reload_backends().values()
+        # Don't leave the processor configured for other tests
+        self.addCleanup(self._reload_backends)
+
+        event = {}
+        tracker.send(event)
+
+        self.assertEqual(event['processed'], 1)
+        self.assertEqual([backend.events for backend in backends], [[event], [event]])
+
     def _reload_backends(self):
         # pylint: disable=protected-access
 
@@ -111,7 +157,18 @@ class DummyBackend(BaseBackend):
         super(DummyBackend, self).__init__(**options)
         self.flag = options.get('flag', False)
         self.count = 0
+        self.events = []
+        self.batch_sizes = []
 
-    # pylint: disable=unused-argument
     def send(self, event):
         self.count += 1
+        self.events.append(event)
+
+    def send_batch(self, events):
+        self.batch_sizes.append(len(events))
+        super(DummyBackend, self).send_batch(events)
+
+
+class DummyProcessor(object):
+    def __call__(self, event):
+        event['processed'] = event.get('processed', 0) + 1
@@ -12,10 +12,24 @@ below::
               'host': ... ,
               'port': ... ,
               ...
+          },
+          'QUEUE': {
+              'batch_size': ...,
+              ...
           }
       }
   }
 
+A backend with a 'QUEUE' entry is sent events in batches from a background
+thread, by a track.backends.queued.QueuedBackend given those options.
+
+Processors, which modify each event before it is sent to the backends,
+can be configured as well::
+
+  TRACKING_PROCESSORS = [
+      {'ENGINE': 'class.name.for.processor'}
+  ]
+
 """
 
 import inspect
@@ -26,17 +40,19 @@ from dogapi import dog_stats_api
 from django.conf import settings
 
 from track.backends import BaseBackend
+from track.backends.queued import QueuedBackend
 
 
 __all__ = ['send']
 
 
 backends = {}
+processors = []
 
 
 def _initialize_backends_from_django_settings():
     """
-    Initialize the event tracking backends according to the
+    Initialize the event tracking backends and processors according to the
     configuration in django settings
 
     """
@@ -49,7 +65,15 @@ def _initialize_backends_from_django_settings():
         if values:
             engine = values['ENGINE']
             options = values.get('OPTIONS', {})
-            backends[name] = _instantiate_backend_from_name(engine, options)
+            backend = _instantiate_backend_from_name(engine, options)
+            if 'QUEUE' in values:
+                backend = QueuedBackend(backend, name=name, **values['QUEUE'])
+            backends[name] = backend
+
+    processors[:] = [
+        _instantiate_from_name(values['ENGINE'], values.get('OPTIONS', {}))
+        for values in getattr(settings, 'TRACKING_PROCESSORS', [])
+    ]
 
 
 def _instantiate_backend_from_name(name, options):
@@ -83,14 +107,33 @@ def _instantiate_backend_from_name(name, options):
     return backend
 
 
+def _instantiate_from_name(name, options):
+    """
+    Instantiate a class from its full module path, e.g. an event processor.
+
+    """
+    module_name, _, class_name = name.rpartition('.')
+    try:
+        cls = getattr(import_module(module_name), class_name)
+    except (ValueError, AttributeError, ImportError):
+        raise ValueError('Cannot find %s' % name)
+
+    return cls(**options)
+
+
 @dog_stats_api.timed('track.send')
 def send(event):
     """
-    Send an event object to all the initialized backends.
+    Send an event object to all the initialized backends, after
+    running it through the processors.
 
     """
     dog_stats_api.increment('track.send.count')
 
+    # Processors change the event in place, once for all backends
+    for processor in processors:
+        processor(event)
+
     for name, backend in backends.iteritems():
         with dog_stats_api.timer('track.send.backend.{0}'.format(name)):
             backend.send(event)
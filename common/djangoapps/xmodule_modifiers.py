@@ -131,6 +131,16 @@ def replace_static_urls(data_dir, block, view, frag, context, course_id=None, st
     ))
 
 
+def replace_urls(data_dir, course_id, jump_to_id_base_url, block, view, frag, context, static_asset_path=''):  # pylint: disable=unused-argument
+    """
+    Does what replace_static_urls, replace_course_urls and replace_jump_to_id_urls do, in a single
+    pass over the fragment. The rewritten content of html modules, which is the same on every render,
+    is cached.
+    """
+    rewriter = static_replace.get_url_rewriter(data_dir, course_id, static_asset_path, jump_to_id_base_url)
+    return wrap_fragment(frag, rewriter.rewrite(frag.content, cache=(block.scope_ids.block_type == 'html')))
+
+
 def grade_histogram(module_id):
     '''
     Print out a histogram of grades on a given problem in staff member debug info.
@@ -142,15 +152,25 @@ def grade_histogram(module_id):
     from django.db import connection
     cursor = connection.cursor()
 
-    q = """SELECT courseware_studentmodule.grade,
-                  COUNT(courseware_studentmodule.student_id)
-    FROM courseware_studentmodule
-    WHERE courseware_studentmodule.module_id=%s
-    GROUP BY courseware_studentmodule.grade"""
+    if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+        # Read the histogram kept as StudentModules are saved, rather than counting them
+        q = """SELECT courseware_studentmodulegradecount.grade,
+                      SUM(courseware_studentmodulegradecount.count)
+        FROM courseware_studentmodulegradecount
+        WHERE courseware_studentmodulegradecount.module_id=%s
+        GROUP BY courseware_studentmodulegradecount.grade
+        HAVING SUM(courseware_studentmodulegradecount.count) > 0"""
+    else:
+        q = """SELECT courseware_studentmodule.grade,
+                      COUNT(courseware_studentmodule.student_id)
+        FROM courseware_studentmodule
+        WHERE courseware_studentmodule.module_id=%s
+        GROUP BY courseware_studentmodule.grade"""
     # Passing module_id this way prevents sql-injection.
     cursor.execute(q, [module_id.to_deprecated_string()])
 
-    grades = list(cursor.fetchall())
+    # SUM() may come back as a Decimal, which doesn't render as a number
+    grades = [(grade, int(count)) for grade, count in cursor.fetchall()]
     grades.sort(key=lambda x: x[0])  # Add ORDER BY to sql query?
     if len(grades) >= 1 and grades[0][0] is None:
         return []
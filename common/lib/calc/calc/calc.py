@@ -7,6 +7,9 @@ Uses pyparsing to parse. Main function as of now is evaluator().
 import math
 import operator
 import numbers
+import threading
+from collections import OrderedDict
+
 import numpy
 import scipy.constants
 import functions
@@ -72,6 +75,9 @@ SUFFIXES = {
     'c': 1e-2, 'm': 1e-3, 'u': 1e-6, 'n': 1e-9, 'p': 1e-12
 }
 
+# How many parsed expressions `parse_expression` keeps around.
+PARSE_CACHE_SIZE = 1024
+
 
 class UndefinedVariable(Exception):
     """
@@ -200,6 +206,53 @@ def eval_product(parse_result):
     return prod
 
 
+# The following actions are used instead of the ones above when evaluating
+# many samples at once. Values may then be numpy arrays (which aren't
+# `numbers.Number`s), so operands are told apart from operators by not being
+# strings.
+
+def eval_vector_atom(parse_result):
+    """
+    Return the value (or array of values) wrapped by the atom.
+    """
+    return next(k for k in parse_result if not isinstance(k, basestring))
+
+
+def eval_vector_power(parse_result):
+    """
+    Exponentiate the values, right to left, like `eval_power`.
+    """
+    parse_result = reversed(
+        [k for k in parse_result if not isinstance(k, basestring)]
+    )
+    return reduce(lambda a, b: b ** a, parse_result)
+
+
+def eval_vector_parallel(parse_result):
+    """
+    Apply the parallel resistors operator, like `eval_parallel`.
+
+    A zero input divides by zero, which is left to numpy's error handling to
+    report (see `vector_evaluator`).
+    """
+    values = [k for k in parse_result if not isinstance(k, basestring)]
+    if len(values) == 1:
+        return values[0]
+    return 1. / sum(1. / value for value in values)
+
+
+def apply_vector_function(function, arg):
+    """
+    Apply `function` to the array `arg`, value by value if it doesn't support
+    arrays.
+    """
+    try:
+        return function(arg)
+    except (TypeError, ValueError):
+        # e.g. `math.factorial`, or functions that branch on their input
+        return numpy.array([function(value) for value in arg])
+
+
 def add_defaults(variables, functions, case_sensitive):
     """
     Create dictionaries with both the default and user-defined variables.
@@ -216,6 +269,67 @@ def add_defaults(variables, functions, case_sensitive):
     return (all_variables, all_functions)
 
 
+class _ParseCache(object):
+    """
+    A thread-safe, least-recently-used cache of parsed expressions.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the entry for `key` (marking it as recently used), or None.
+        """
+        with self.lock:
+            value = self.entries.pop(key, None)
+            if value is not None:
+                self.entries[key] = value
+            return value
+
+    def set(self, key, value):
+        """
+        Store `value` for `key`, evicting the least recently used entry if full.
+        """
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = value
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Forget every entry.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+_PARSE_CACHE = _ParseCache(PARSE_CACHE_SIZE)
+
+
+def parse_expression(math_expr, case_sensitive=False):
+    """
+    Parse and compile `math_expr`, and return its `ParseAugmenter`.
+
+    Parsing is by far the most expensive part of evaluating an expression, and
+    the same expressions get evaluated over and over (e.g. once per sample when
+    checking a formula), so parsed expressions are cached by their text and
+    case sensitivity. The returned object is shared, and must not be modified.
+
+    Raises a `pyparsing.ParseException` if `math_expr` isn't valid.
+    """
+    key = (math_expr, case_sensitive)
+    math_interpreter = _PARSE_CACHE.get(key)
+    if math_interpreter is None:
+        math_interpreter = ParseAugmenter(math_expr, case_sensitive)
+        math_interpreter.parse_algebra()
+        math_interpreter.compiled_tree = math_interpreter.compile_tree()
+        _PARSE_CACHE.set(key, math_interpreter)
+    return math_interpreter
+
+
 def evaluator(variables, functions, math_expr, case_sensitive=False):
     """
     Evaluate an expression; that is, take a string of math and return a float.
@@ -228,9 +342,8 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     if math_expr.strip() == "":
         return float('nan')
 
-    # Parse the tree.
-    math_interpreter = ParseAugmenter(math_expr, case_sensitive)
-    math_interpreter.parse_algebra()
+    # Parse the tree (or reuse an earlier parse).
+    math_interpreter = parse_expression(math_expr, case_sensitive)
 
     # Get our variables together.
     all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
@@ -238,24 +351,43 @@ def evaluator(variables, functions, math_expr, case_sensitive=False):
     # ...and check them
     math_interpreter.check_variables(all_variables, all_functions)
 
-    # Create a recursion to evaluate the tree.
-    if case_sensitive:
-        casify = lambda x: x
-    else:
-        casify = lambda x: x.lower()  # Lowercase for case insens.
+    return math_interpreter.evaluate(all_variables, all_functions)
+
+
+def vector_evaluator(variables, functions, math_expr, case_sensitive=False):
+    """
+    Evaluate an expression for many samples of its variables at once.
+
+    Like `evaluator`, but each value in `variables` is a numpy array holding
+    one value per sample (all of the same length), and an array of the results
+    is returned. The parsed tree is evaluated once, using numpy's arithmetic on
+    whole arrays; functions that don't support arrays are applied to each
+    sample in turn.
+
+    Numerical errors (like dividing by zero, or raising a negative number to a
+    fractional power) raise a `FloatingPointError` instead of producing
+    infinities or NaNs, since `evaluator` either raises or returns NaN in
+    those cases. Callers should fall back to `evaluator` to get its exact
+    behavior for such inputs.
+    """
+    num_samples = max(len(values) for values in variables.itervalues()) if variables else 1
+
+    if math_expr.strip() == "":
+        return numpy.repeat(float('nan'), num_samples)
 
-    evaluate_actions = {
-        'number': eval_number,
-        'variable': lambda x: all_variables[casify(x[0])],
-        'function': lambda x: all_functions[casify(x[0])](x[1]),
-        'atom': eval_atom,
-        'power': eval_power,
-        'parallel': eval_parallel,
-        'product': eval_product,
-        'sum': eval_sum
-    }
+    math_interpreter = parse_expression(math_expr, case_sensitive)
+    all_variables, all_functions = add_defaults(variables, functions, case_sensitive)
+    math_interpreter.check_variables(all_variables, all_functions)
 
-    return math_interpreter.reduce_tree(evaluate_actions)
+    with numpy.errstate(divide='raise', over='raise', invalid='raise'):
+        result = numpy.asarray(math_interpreter.evaluate_vector(all_variables, all_functions))
+    if result.dtype == object:
+        # e.g. huge integers from `factorial`, which numpy can't hold
+        raise TypeError("Expression can't be evaluated as an array")
+    if result.ndim == 0:
+        # The expression doesn't depend on the variables
+        result = numpy.repeat(result, num_samples)
+    return result
 
 
 class ParseAugmenter(object):
@@ -275,6 +407,8 @@ class ParseAugmenter(object):
         self.case_sensitive = case_sensitive
         self.math_expr = math_expr
         self.tree = None
+        self.compiled_tree = None
+        self.compiled_vector_tree = None
         self.variables_used = set()
         self.functions_used = set()
 
@@ -397,6 +531,90 @@ class ParseAugmenter(object):
         # Find the value of the entire tree.
         return handle_node(self.tree)
 
+    def compile_tree(self, vectorized=False):
+        """
+        Turn `self.tree` into a function that evaluates it, and return it.
+
+        The function takes the dictionaries of variables and functions (with
+        the defaults already added, see `add_defaults`) and returns the value
+        of the expression. Numbers are converted and the case of names is
+        handled once here, so evaluating the tree again with different values
+        only has to do the arithmetic.
+
+        If `vectorized` is True, the function evaluates samples held in numpy
+        arrays (see `vector_evaluator`).
+        """
+        if self.case_sensitive:
+            casify = lambda x: x
+        else:
+            casify = lambda x: x.lower()  # Lowercase for case insens.
+
+        if vectorized:
+            evaluate_actions = {
+                'atom': eval_vector_atom,
+                'power': eval_vector_power,
+                'parallel': eval_vector_parallel,
+                'product': eval_product,
+                'sum': eval_sum
+            }
+            apply_function = apply_vector_function
+        else:
+            evaluate_actions = {
+                'atom': eval_atom,
+                'power': eval_power,
+                'parallel': eval_parallel,
+                'product': eval_product,
+                'sum': eval_sum
+            }
+            apply_function = lambda function, arg: function(arg)
+
+        def compile_node(node):
+            """
+            Return a function of (variables, functions) evaluating the node.
+            """
+            if not isinstance(node, ParseResults):
+                # Then treat it as a terminal node.
+                return lambda variables, functions: node
+
+            node_name = node.getName()
+            if node_name == 'number':
+                value = eval_number(node)
+                return lambda variables, functions: value
+            elif node_name == 'variable':
+                varname = casify(node[0])
+                return lambda variables, functions: variables[varname]
+            elif node_name == 'function':
+                funcname = casify(node[0])
+                compiled_arg = compile_node(node[1])
+                return lambda variables, functions: apply_function(
+                    functions[funcname], compiled_arg(variables, functions)
+                )
+            elif node_name not in evaluate_actions:  # pragma: no cover
+                raise Exception(u"Unknown branch name '{}'".format(node_name))
+
+            action = evaluate_actions[node_name]
+            compiled_kids = [compile_node(k) for k in node]
+            return lambda variables, functions: action([kid(variables, functions) for kid in compiled_kids])
+
+        return compile_node(self.tree)
+
+    def evaluate(self, all_variables, all_functions):
+        """
+        Return the value of the tree for the given variables and functions.
+        """
+        if self.compiled_tree is None:
+            self.compiled_tree = self.compile_tree()
+        return self.compiled_tree(all_variables, all_functions)
+
+    def evaluate_vector(self, all_variables, all_functions):
+        """
+        Return the values of the tree for the given variables and functions,
+        with the variables' samples held in numpy arrays.
+        """
+        if self.compiled_vector_tree is None:
+            self.compiled_vector_tree = self.compile_tree(vectorized=True)
+        return self.compiled_vector_tree(all_variables, all_functions)
+
     def check_variables(self, valid_variables, valid_functions):
         """
         Confirm that all the variables used in the tree are valid/defined.
@@ -3,8 +3,10 @@ Unit tests for calc.py
 """
 
 import unittest
+import mock
 import numpy
 import calc
+from calc.calc import _ParseCache, _PARSE_CACHE
 from pyparsing import ParseException
 
 # numpy's default behavior when it evaluates a function outside its domain
@@ -558,3 +560,79 @@ class EvaluatorTest(unittest.TestCase):
             calc.evaluator({'r1': 5}, {}, "r1+r2")
         with self.assertRaisesRegexp(calc.UndefinedVariable, 'r1 r3'):
             calc.evaluator(variables, {}, "r1*r3", case_sensitive=True)
+
+    def test_parse_cache(self):
+        """
+        Expressions are parsed once, and evaluated with new values each time
+        """
+        _PARSE_CACHE.clear()
+        with mock.patch.object(calc.ParseAugmenter, 'parse_algebra', autospec=True,
+                               side_effect=calc.ParseAugmenter.parse_algebra) as mock_parse:
+            self.assertEqual(calc.evaluator({'x': 2.0}, {}, "3*x+1"), 7.0)
+            self.assertEqual(calc.evaluator({'x': 5.0}, {}, "3*x+1"), 16.0)
+            self.assertEqual(mock_parse.call_count, 1)
+
+            # Case sensitivity changes how an expression is evaluated, so it's
+            # cached separately
+            self.assertEqual(calc.evaluator({'x': 5.0}, {}, "3*x+1", case_sensitive=True), 16.0)
+            self.assertEqual(mock_parse.call_count, 2)
+
+    def test_parse_cache_eviction(self):
+        """
+        The least recently used expression is dropped once the cache is full
+        """
+        cache = _ParseCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+
+
+class VectorEvaluatorTest(unittest.TestCase):
+    """
+    Run tests for calc.vector_evaluator, checking it against calc.evaluator
+    """
+    def assert_matches_evaluator(self, math_expr, samples, case_sensitive=False):
+        """
+        Check that evaluating `math_expr` over the arrays of values in
+        `samples` gives what evaluating each sample separately would.
+        """
+        variables = {name: numpy.array(values) for name, values in samples.iteritems()}
+        result = calc.vector_evaluator(variables, {}, math_expr, case_sensitive)
+        num_samples = len(samples.values()[0])
+        expected = [
+            calc.evaluator({name: values[i] for name, values in samples.iteritems()}, {}, math_expr, case_sensitive)
+            for i in xrange(num_samples)
+        ]
+        self.assertEqual(len(result), num_samples)
+        for value, expected_value in zip(result, expected):
+            self.assertAlmostEqual(value, expected_value)
+
+    def test_expressions(self):
+        samples = {'x': [0.5, 1.0, 2.5, 7.0], 'y': [1.0, 3.0, -2.0, 0.25]}
+        self.assert_matches_evaluator("x+y*2-x/y", samples)
+        self.assert_matches_evaluator("x^2^0.5 + (x||y)", samples)
+        self.assert_matches_evaluator("sin(x)*cos(y) + sqrt(x) + arccot(y)", samples)
+        self.assert_matches_evaluator("x*i + e^(pi*y)", samples)
+        self.assert_matches_evaluator("X+Y", samples)
+        self.assert_matches_evaluator("2.5k", samples)
+
+    def test_scalar_functions(self):
+        # `factorial` doesn't take arrays, so it's applied sample by sample
+        self.assert_matches_evaluator("fact(x)+x", {'x': [1.0, 3.0, 5.0]})
+
+    def test_numerical_errors(self):
+        # These have to be left to calc.evaluator, which raises or returns NaN
+        with self.assertRaises(FloatingPointError):
+            calc.vector_evaluator({'x': numpy.array([1.0, 0.0])}, {}, "1/x")
+        with self.assertRaises(FloatingPointError):
+            calc.vector_evaluator({'x': numpy.array([-8.0, 8.0])}, {}, "x^0.5")
+        with self.assertRaises(FloatingPointError):
+            calc.vector_evaluator({'x': numpy.array([1.0, 0.0])}, {}, "x||2")
+
+    def test_undefined_vars(self):
+        with self.assertRaisesRegexp(calc.UndefinedVariable, 'z'):
+            calc.vector_evaluator({'x': numpy.array([1.0])}, {}, "x+z")
@@ -13,10 +13,13 @@ Main module which shows problems (of "capa" type).
 This is used by capa_module.
 """
 
+from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import logging
 import os.path
 import re
+import threading
 
 from lxml import etree
 from xml.sax.saxutils import unescape
@@ -59,6 +62,9 @@ html_problem_semantics = [
 
 log = logging.getLogger(__name__)
 
+# Number of parsed problem templates kept by PROBLEM_TEMPLATE_CACHE
+PROBLEM_TEMPLATE_CACHE_SIZE = 1000
+
 #-----------------------------------------------------------------------------
 # main class for this module
 
@@ -107,12 +113,62 @@ class LoncapaSystem(object):
         self.xqueue = xqueue
 
 
+class ProblemTemplateCache(object):
+    """
+    A thread-safe least-recently-used cache of parsed problem templates.
+
+    A template is the problem's XML tree, with includes resolved, and the context
+    produced by running its scripts.  Both only depend on the problem text and seed,
+    so they can be shared by every student who has the same seed.  Templates are
+    copied on the way in and out: `LoncapaProblem` modifies its tree and context.
+    """
+    def __init__(self, size=PROBLEM_TEMPLATE_CACHE_SIZE):
+        self.size = size
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return a copy of the (tree, context) template cached for key, or None
+        """
+        with self._lock:
+            try:
+                template = self._items.pop(key)
+            except KeyError:
+                return None
+            self._items[key] = template
+        return deepcopy(template)
+
+    def set(self, key, tree, context):
+        """
+        Cache a copy of tree and context for key, evicting the least recently used
+        templates beyond size
+        """
+        template = deepcopy((tree, context))
+        with self._lock:
+            self._items.pop(key, None)
+            self._items[key] = template
+            while len(self._items) > self.size:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        """
+        Empty the cache
+        """
+        with self._lock:
+            self._items.clear()
+
+
+# The templates shared by the problems in this process
+PROBLEM_TEMPLATE_CACHE = ProblemTemplateCache()
+
+
 class LoncapaProblem(object):
     """
     Main class for capa Problems.
     """
 
-    def __init__(self, problem_text, id, capa_system, state=None, seed=None):
+    def __init__(self, problem_text, id, capa_system, state=None, seed=None, template_cache=None):
         """
         Initializes capa Problem.
 
@@ -129,6 +185,8 @@ class LoncapaProblem(object):
                 - `done` (bool) indicates whether or not this problem is considered done
                 - `input_state` (dict) maps input_id to a dictionary that holds the state for that input
             seed (int): random number generator seed.
+            template_cache (ProblemTemplateCache): if given, the parsed tree and script
+                context are shared through it by problems with the same text and seed.
 
         """
 
@@ -156,14 +214,28 @@ class LoncapaProblem(object):
         problem_text = re.sub(r"endouttext\s*/", "/text", problem_text)
         self.problem_text = problem_text
 
-        # parse problem XML file into an element tree
-        self.tree = etree.XML(problem_text)
+        template_key = None
+        template = None
+        if template_cache is not None:
+            template_key = self._template_key(problem_text)
+            template = template_cache.get(template_key)
+
+        if template is not None:
+            self.tree, self.context = template
+            self.context['anonymous_student_id'] = self.capa_system.anonymous_student_id
+        else:
+            # parse problem XML file into an element tree
+            self.tree = etree.XML(problem_text)
+
+            # handle any <include file="foo"> tags
+            self._process_includes()
 
-        # handle any <include file="foo"> tags
-        self._process_includes()
+            # construct script processor context (eg for customresponse problems)
+            self.context = self._extract_context(self.tree)
 
-        # construct script processor context (eg for customresponse problems)
-        self.context = self._extract_context(self.tree)
+            # Scripts that read the student's id give a different context per student
+            if template_key is not None and 'anonymous_student_id' not in self.context['script_code']:
+                template_cache.set(template_key, self.tree, self.context)
 
         # Pre-parse the XML tree: modifies it to add ID's and perform some in-place
         # transformations.  This also creates the dict (self.responders) of Response
@@ -223,6 +295,24 @@ class LoncapaProblem(object):
                 'input_state': self.input_state,
                 'done': self.done}
 
+    def set_student_state(self, state):
+        """
+        Load a student's saved `state` (as returned by `get_state()`) into this
+        problem, so that their answers can be graded again without building a
+        new problem for them.
+
+        The problem's XML was processed using its seed, so `state` must have
+        been saved with the same seed.
+        """
+        if state.get('seed', self.seed) != self.seed:
+            raise responsetypes.LoncapaProblemError("State's seed doesn't match the problem's seed.")
+        self.do_reset()
+        self.student_answers = state.get('student_answers') or {}
+        if state.get('correct_map'):
+            self.correct_map.set_dict(state['correct_map'])
+        self.done = state.get('done', False)
+        self.input_state = state.get('input_state') or {}
+
     def get_max_score(self):
         """
         Return the maximum score for this problem.
@@ -526,6 +616,23 @@ class LoncapaProblem(object):
 
     # ======= Private Methods Below ========
 
+    def _template_key(self, problem_text):
+        """
+        Return the key under which the parsed template of problem_text is cached.
+
+        Includes and script paths are resolved against the filestore, and the scripts
+        are run sandboxed or not, so those are part of the key along with the seed.
+        """
+        if isinstance(problem_text, unicode):
+            problem_text = problem_text.encode('utf-8')
+        return (
+            hashlib.md5(problem_text).hexdigest(),
+            self.problem_id,
+            self.seed,
+            getattr(self.capa_system.filestore, 'root_path', None),
+            self.capa_system.can_execute_unsafe_code(),
+        )
+
     def _process_includes(self):
         """
         Handle any <include file="foo"> tags by reading in the specified file and inserting it
@@ -36,7 +36,7 @@ from shapely.geometry import Point, MultiPoint
 from dogapi import dog_stats_api
 
 # specific library imports
-from calc import evaluator, UndefinedVariable
+from calc import evaluator, vector_evaluator, UndefinedVariable
 from . import correctmap
 from .registry import TagRegistry
 from datetime import datetime
@@ -2309,10 +2309,23 @@ class FormulaResponse(LoncapaResponse):
         """
         Takes in an answer and a list of dictionaries mapping variables to values.
         Each dictionary represents a test case for the answer.
-        Returns a tuple of formula evaluation results.
+        Returns a numpy array of formula evaluation results.
         """
         _ = self.capa_system.i18n.ugettext
 
+        # Evaluate all of the test cases in one pass if possible. Anything out of
+        # the ordinary, like an invalid answer or a numerical error for some test
+        # case, is left to evaluating them one by one below, which reports it.
+        if var_dict_list:
+            variables = {
+                var: numpy.array([var_dict[var] for var_dict in var_dict_list])
+                for var in var_dict_list[0]
+            }
+            try:
+                return vector_evaluator(variables, dict(), answer, case_sensitive=self.case_sensitive)
+            except Exception:  # pylint: disable=W0703
+                pass
+
         out = []
         for var_dict in var_dict_list:
             try:
@@ -2362,7 +2375,7 @@ class FormulaResponse(LoncapaResponse):
                         bad_input=cgi.escape(answer)
                     )
                 )
-        return out
+        return numpy.array(out)
 
     def randomize_variables(self, samples):
         """
@@ -2396,8 +2409,7 @@ class FormulaResponse(LoncapaResponse):
         student_result = self.tupleize_answers(given, var_dict_list)
         instructor_result = self.tupleize_answers(expected, var_dict_list)
 
-        correct = all(compare_with_tolerance(student, instructor, self.tolerance)
-                      for student, instructor in zip(student_result, instructor_result))
+        correct = numpy.all(compare_with_tolerance(student_result, instructor_result, self.tolerance))
         if correct:
             return "correct"
         else:
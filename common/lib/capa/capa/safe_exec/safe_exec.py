@@ -7,6 +7,9 @@ from . import lazymod
 from dogapi import dog_stats_api
 
 import hashlib
+import json
+import threading
+from collections import OrderedDict
 
 # Establish the Python environment for Capa.
 # Capa assumes float-friendly division always.
@@ -70,6 +73,61 @@ def update_hash(hasher, obj):
         hasher.update(repr(obj))
 
 
+class LocalCache(object):
+    """
+    A cache of `safe_exec` results kept in this process, in front of another
+    cache (like Django's).
+
+    A result is fully determined by its cache key (the code, the globals and
+    the random seed), so it can be kept for as long as is useful. Finding the
+    results of the most used code (e.g. the scripts of problems that many
+    students are working on) in memory saves a round trip to the shared cache.
+
+    The `size` most recently used results are kept. They're stored serialized,
+    so that callers get their own copies to modify.
+    """
+    def __init__(self, backing_cache, size=1000):
+        self.backing_cache = backing_cache
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """
+        Return the value for `key`, or None if it isn't cached.
+        """
+        with self.lock:
+            serialized = self.entries.pop(key, None)
+            if serialized is not None:
+                self.entries[key] = serialized
+        if serialized is not None:
+            return json.loads(serialized)
+
+        value = self.backing_cache.get(key)
+        if value is not None:
+            self._set_local(key, value)
+        return value
+
+    def set(self, key, value):
+        """
+        Cache `value` for `key`, here and in the backing cache.
+        """
+        self._set_local(key, value)
+        self.backing_cache.set(key, value)
+
+    def _set_local(self, key, value):
+        """
+        Keep `value` for `key` in this process, evicting the least recently
+        used value if the cache is full.
+        """
+        serialized = json.dumps(value)
+        with self.lock:
+            self.entries.pop(key, None)
+            self.entries[key] = serialized
+            if len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+
 @dog_stats_api.timed('capa.safe_exec.time')
 def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None, slug=None, unsafely=False):
     """
@@ -85,7 +143,7 @@ def safe_exec(code, globals_dict, random_seed=None, python_path=None, cache=None
 
     `cache` is an object with .get(key) and .set(key, value) methods.  It will be used
     to cache the execution, taking into account the code, the values of the globals,
-    and the random seed.
+    and the random seed. Wrap it in a `LocalCache` to also keep results in memory.
 
     `slug` is an arbitrary string, a description that's meaningful to the
     caller, that will be used in log messages.
@@ -9,7 +9,7 @@ import unittest
 
 from nose.plugins.skip import SkipTest
 
-from capa.safe_exec import safe_exec, update_hash
+from capa.safe_exec import safe_exec, update_hash, LocalCache
 from codejail.safe_exec import SafeExecException
 from codejail.jail_code import is_configured
 
@@ -176,6 +176,50 @@ class TestSafeExecCaching(unittest.TestCase):
             except UnicodeEncodeError:
                 self.fail("Tried executing code with non-ASCII unicode: {0}".format(code))
 
+    def test_local_cache(self):
+        shared = {}
+        cache = LocalCache(DictCache(shared))
+
+        g = {}
+        safe_exec("a = int(math.pi)", g, cache=cache)
+        self.assertEqual(g['a'], 3)
+        # The result is in the shared cache too
+        self.assertEqual(shared.values()[0], (None, {'a': 3}))
+
+        # The result now comes from memory, without looking in the shared cache.
+        shared.clear()
+        g = {}
+        safe_exec("a = int(math.pi)", g, cache=cache)
+        self.assertEqual(g['a'], 3)
+        self.assertEqual(shared, {})
+
+
+class TestLocalCache(unittest.TestCase):
+    """Test the in-memory cache of safe_exec results."""
+
+    def test_miss_fills_from_backing_cache(self):
+        cache = LocalCache(DictCache({'key': [None, {'a': 1}]}))
+        self.assertEqual(cache.get('key'), [None, {'a': 1}])
+        self.assertIsNone(cache.get('other'))
+
+    def test_values_are_copies(self):
+        cache = LocalCache(DictCache({}))
+        cache.set('key', [None, {'a': [1]}])
+        cache.get('key')[1]['a'].append(2)
+        self.assertEqual(cache.get('key'), [None, {'a': [1]}])
+
+    def test_least_recently_used_evicted(self):
+        backing = {}
+        cache = LocalCache(DictCache(backing), size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        backing.clear()
+        self.assertEqual(cache.get('a'), 1)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), 3)
+
 
 class TestUpdateHash(unittest.TestCase):
     """Test the safe_exec.update_hash function to be sure it canonicalizes properly."""
@@ -0,0 +1,85 @@
+"""
+Tests for sharing parsed problem templates between LoncapaProblem instances.
+"""
+import textwrap
+import unittest
+
+import mock
+
+from capa import capa_problem
+from capa.capa_problem import LoncapaProblem, ProblemTemplateCache
+from . import test_capa_system
+
+
+class ProblemTemplateCacheTest(unittest.TestCase):
+    """
+    Problems built through a template cache behave like problems built from scratch.
+    """
+    xml = textwrap.dedent("""
+        <problem>
+            <script type="loncapa/python">
+                answer = str(random.randint(0, 1000))
+            </script>
+            <p>Enter $answer</p>
+            <stringresponse answer="$answer">
+                <textline size="20"/>
+            </stringresponse>
+        </problem>
+    """)
+
+    def setUp(self):
+        super(ProblemTemplateCacheTest, self).setUp()
+        self.template_cache = ProblemTemplateCache()
+        patcher = mock.patch('capa.capa_problem.safe_exec', wraps=capa_problem.safe_exec)
+        self.safe_exec = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _new_problem(self, xml=None, seed=1, state=None, template_cache=True):
+        """
+        Build a problem, through self.template_cache unless template_cache is False.
+        """
+        return LoncapaProblem(
+            xml or self.xml,
+            id='1',
+            capa_system=test_capa_system(),
+            state=state,
+            seed=seed,
+            template_cache=self.template_cache if template_cache else None,
+        )
+
+    def test_template_shared(self):
+        first = self._new_problem()
+        second = self._new_problem()
+        self.assertEqual(self.safe_exec.call_count, 1)
+
+        uncached = self._new_problem(template_cache=False)
+        self.assertEqual(second.get_html(), uncached.get_html())
+        self.assertEqual(first.context['answer'], second.context['answer'])
+
+    def test_seed_not_shared(self):
+        self._new_problem(seed=1)
+        self._new_problem(seed=2)
+        self.assertEqual(self.safe_exec.call_count, 2)
+
+    def test_student_state_not_shared(self):
+        first = self._new_problem()
+        answer = first.context['answer']
+        first.grade_answers({'1_2_1': answer})
+
+        second = self._new_problem()
+        self.assertEqual(second.student_answers, {})
+        self.assertFalse(second.correct_map.is_correct('1_2_1'))
+        second.context['answer'] = 'changed'
+        self.assertEqual(self._new_problem().context['answer'], answer)
+
+    def test_student_specific_scripts_not_cached(self):
+        xml = textwrap.dedent("""
+            <problem>
+                <script type="loncapa/python">
+                    code = anonymous_student_id.upper()
+                </script>
+            </problem>
+        """)
+        self._new_problem(xml=xml)
+        self._new_problem(xml=xml)
+        self.assertEqual(self.safe_exec.call_count, 2)
@@ -377,6 +377,22 @@ class FormulaResponseTest(ResponseTest):
         input_formula = "x + y"
         self.assert_grade(problem, input_formula, "incorrect")
 
+    def test_grade_samples_together(self):
+        """
+        Test that the samples of a formula are evaluated together, rather
+        than one at a time
+        """
+        sample_dict = {'x': (-10, 10), 'y': (-10, 10)}
+        problem = self.build_problem(sample_dict=sample_dict,
+                                     num_samples=50,
+                                     tolerance=0.01,
+                                     answer="x+2*y")
+
+        with mock.patch('capa.responsetypes.evaluator') as mock_evaluator:
+            self.assert_grade(problem, "2*x - x + y + y", "correct")
+            self.assert_grade(problem, "x + y", "incorrect")
+        self.assertFalse(mock_evaluator.called)
+
     def test_hint(self):
         """
         Test the hint-giving functionality of FormulaResponse
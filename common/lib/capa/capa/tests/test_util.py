@@ -2,6 +2,7 @@
 
 import unittest
 import textwrap
+import numpy
 from . import test_capa_system
 from capa.util import compare_with_tolerance
 
@@ -80,3 +81,16 @@ class UtilTest(unittest.TestCase):
         self.assertFalse(result)
         result = compare_with_tolerance(infinity, infinity, '1.0', False)
         self.assertTrue(result)
+
+    def test_compare_arrays_with_tolerance(self):
+        infinity = float('Inf')
+        student = numpy.array([100.0, 100.001, 101.0, infinity, infinity, 109.9 + 1j])
+        instructor = numpy.array([100.0, 100.0, 100.0, 100.0, infinity, 100.0 + 1j])
+        # Arrays are compared value by value, as single values would be
+        for tolerance, relative_tolerance in [('0.001%', False), ('10%', False), ('10%', True), (1.0, False)]:
+            expected = [
+                compare_with_tolerance(student_value, instructor_value, tolerance, relative_tolerance)
+                for student_value, instructor_value in zip(student, instructor)
+            ]
+            result = compare_with_tolerance(student, instructor, tolerance, relative_tolerance)
+            self.assertEqual(list(result), expected)
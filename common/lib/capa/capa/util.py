@@ -1,5 +1,6 @@
 from calc import evaluator
 from cmath import isinf
+import numpy
 
 #-----------------------------------------------------------------------------
 #
@@ -41,7 +42,14 @@ def compare_with_tolerance(student_complex, instructor_complex, tolerance=defaul
         Out[183]: -3.3881317890172014e-21
         In [212]: 1.9e24 - 1.9*10**24
         Out[212]: 268435456.0
+
+     student_complex and instructor_complex may also be numpy arrays of
+     results, in which case they're compared value by value, and an array of
+     the comparisons is returned.
     """
+    if isinstance(student_complex, numpy.ndarray) or isinstance(instructor_complex, numpy.ndarray):
+        return _compare_arrays_with_tolerance(student_complex, instructor_complex, tolerance, relative_tolerance)
+
     if isinstance(tolerance, str):
         if tolerance == default_tolerance:
             relative_tolerance = True
@@ -66,6 +74,33 @@ def compare_with_tolerance(student_complex, instructor_complex, tolerance=defaul
         return abs(student_complex - instructor_complex) <= tolerance
 
 
+def _compare_arrays_with_tolerance(student_complex, instructor_complex, tolerance, relative_tolerance):
+    """
+    `compare_with_tolerance` for arrays of results.
+    """
+    student_complex = numpy.asarray(student_complex)
+    instructor_complex = numpy.asarray(instructor_complex)
+    if isinstance(tolerance, str):
+        if tolerance == default_tolerance:
+            relative_tolerance = True
+        if tolerance.endswith('%'):
+            tolerance = evaluator(dict(), dict(), tolerance[:-1]) * 0.01
+            if not relative_tolerance:
+                tolerance = tolerance * numpy.abs(instructor_complex)
+        else:
+            tolerance = evaluator(dict(), dict(), tolerance)
+
+    # Infinities and NaNs are handled below, so don't warn about them here
+    with numpy.errstate(invalid='ignore', over='ignore'):
+        if relative_tolerance:
+            tolerance = tolerance * numpy.maximum(numpy.abs(student_complex), numpy.abs(instructor_complex))
+        within_tolerance = numpy.abs(student_complex - instructor_complex) <= tolerance
+
+    # As above, compare infinite values directly.
+    is_infinite = numpy.isinf(student_complex) | numpy.isinf(instructor_complex)
+    return numpy.where(is_infinite, student_complex == instructor_complex, within_tolerance)
+
+
 def contextualize_text(text, context):  # private
     """
     Takes a string with variables. E.g. $a+$b.
@@ -17,9 +17,11 @@ except ImportError:
     # pylint: disable=invalid-name
     dog_stats_api = None
 
+from lxml import etree
 from pkg_resources import resource_string
 
-from capa.capa_problem import LoncapaProblem, LoncapaSystem
+from capa.capa_problem import LoncapaProblem, LoncapaSystem, PROBLEM_TEMPLATE_CACHE
+from capa.correctmap import CorrectMap
 from capa.responsetypes import StudentInputError, \
     ResponseError, LoncapaProblemError
 from capa.util import convert_files_to_filenames
@@ -214,10 +216,61 @@ class CapaMixin(CapaFields):
         # there.
         self.runtime.set('location', self.location.to_deprecated_string())
 
+        # Building the problem parses its XML and runs its scripts, so it is left
+        # until something needs it.  Scoring only needs the max score, which is
+        # cached per problem content and seed after the first build.  Until then,
+        # build the problem now, so that problems which fail to build are caught here.
+        self._lcp = None
+        self._max_score = None
+        max_score_key = self._max_score_cache_key()
+        if max_score_key is not None:
+            self._max_score = self.runtime.cache.get(max_score_key)
+        if self._max_score is None:
+            self._load_lcp()
+
+        assert self.seed is not None
+
+    def choose_new_seed(self):
+        """
+        Choose a new seed.
+        """
+        if self.rerandomize == 'never':
+            self.seed = 1
+        elif self.rerandomize == "per_student" and hasattr(self.runtime, 'seed'):
+            # see comment on randomization_bin
+            self.seed = randomization_bin(self.runtime.seed, unicode(self.location).encode('utf-8'))
+        else:
+            self.seed = struct.unpack('i', os.urandom(4))[0]
+
+            # So that sandboxed code execution can be cached, but still have an interesting
+            # number of possibilities, cap the number of different random seeds.
+            self.seed %= MAX_RANDOMIZATION_BINS
+
+    @property
+    def lcp(self):
+        """
+        The LoncapaProblem for this module and its student, built on first use
+        """
+        return self._load_lcp()
+
+    @lcp.setter
+    def lcp(self, lcp):
+        """
+        Replace the LoncapaProblem for this module
+        """
+        self._lcp = lcp
+
+    def _load_lcp(self):
+        """
+        Build `self.lcp` from the module's state if it hasn't been built yet, and return it
+        """
+        if self._lcp is not None:
+            return self._lcp
+
         try:
             # TODO (vshnayder): move as much as possible of this work and error
             # checking to descriptor load time
-            self.lcp = self.new_lcp(self.get_state_for_lcp())
+            self._lcp = self.new_lcp(self.get_state_for_lcp())
 
             # At this point, we need to persist the randomization seed
             # so that when the problem is re-loaded (to check/view/save)
@@ -226,7 +279,13 @@ class CapaMixin(CapaFields):
             # every time the module is loaded.
             # So we set the seed ONLY when there is not one set already
             if self.seed is None:
-                self.seed = self.lcp.seed
+                self.seed = self._lcp.seed
+
+            if self._max_score is None:
+                self._max_score = self._lcp.get_max_score()
+                max_score_key = self._max_score_cache_key()
+                if max_score_key is not None:
+                    self.runtime.cache.set(max_score_key, self._max_score)
 
         except Exception as err:  # pylint: disable=broad-except
             msg = u'cannot create LoncapaProblem {loc}: {err}'.format(
@@ -247,30 +306,37 @@ class CapaMixin(CapaFields):
                                     url=self.location.to_deprecated_string(),
                                     msg=msg)
                                 )
-                self.lcp = self.new_lcp(self.get_state_for_lcp(), text=problem_text)
+                self._lcp = self.new_lcp(self.get_state_for_lcp(), text=problem_text)
             else:
                 # add extra info and raise
                 raise Exception(msg), None, sys.exc_info()[2]
 
             self.set_state_from_lcp()
 
-        assert self.seed is not None
+        return self._lcp
 
-    def choose_new_seed(self):
+    def _max_score_cache_key(self):
         """
-        Choose a new seed.
+        The key of this problem's max score in the runtime's cache.  The problem's
+        scripts can depend on the seed, and its XML on the files it includes, so
+        the key covers all three.  Returns None if an included file can't be read,
+        in which case the max score isn't cached.
         """
-        if self.rerandomize == 'never':
-            self.seed = 1
-        elif self.rerandomize == "per_student" and hasattr(self.runtime, 'seed'):
-            # see comment on randomization_bin
-            self.seed = randomization_bin(self.runtime.seed, unicode(self.location).encode('utf-8'))
-        else:
-            self.seed = struct.unpack('i', os.urandom(4))[0]
-
-            # So that sandboxed code execution can be cached, but still have an interesting
-            # number of possibilities, cap the number of different random seeds.
-            self.seed %= MAX_RANDOMIZATION_BINS
+        data = self.data
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        key_hash = hashlib.md5(data)
+        key_hash.update(str(self.seed))
+        if '<include' in data:
+            try:
+                for include in etree.XML(data).findall('.//include'):
+                    filename = include.get('file')
+                    if filename is not None:
+                        key_hash.update(filename.encode('utf-8'))
+                        key_hash.update(self.runtime.filestore.open(filename).read())
+            except Exception:  # pylint: disable=broad-except
+                return None
+        return "capa-max-score:" + key_hash.hexdigest()
 
     def new_lcp(self, state, text=None):
         """
@@ -300,6 +366,7 @@ class CapaMixin(CapaFields):
             state=state,
             seed=self.seed,
             capa_system=capa_system,
+            template_cache=PROBLEM_TEMPLATE_CACHE,
         )
 
     def get_state_for_lcp(self):
@@ -335,12 +402,22 @@ class CapaMixin(CapaFields):
         """
         Access the problem's score
         """
+        if self._lcp is None:
+            # Same as LoncapaProblem.get_score, from the saved state
+            score = 0
+            if self.student_answers:
+                correct_map = CorrectMap()
+                correct_map.set_dict(self.correct_map)
+                score = sum(correct_map.get_npoints(key) for key in correct_map)
+            return {'score': score, 'total': self._max_score}
         return self.lcp.get_score()
 
     def max_score(self):
         """
         Access the problem's max score
         """
+        if self._lcp is None:
+            return self._max_score
         return self.lcp.get_max_score()
 
     def get_progress(self):
@@ -1223,19 +1300,63 @@ class CapaMixin(CapaFields):
         Returns the error messages for exceptions occurring while performing
         the rescoring, rather than throwing them.
         """
+        result = self._rescore_lcp(self.attempts, self.track_function_unmask)
+        if result['success'] in ('correct', 'incorrect'):
+            # rescoring should have no effect on attempts, so don't
+            # need to increment here, or mark done.  Just save.
+            self.set_state_from_lcp()
+            self.publish_grade()
+
+            # psychometrics should be called on rescoring requests in the same way as check-problem
+            if hasattr(self.runtime, 'psychometrics_handler'):  # update PsychometricsData using callback
+                self.runtime.psychometrics_handler(self.get_state_for_lcp())
+
+        return result
+
+    def rescore_state(self, state, track_function):
+        """
+        Rescores another student's saved `state` for this problem, reusing this
+        module's LoncapaProblem instead of building a new one.
+
+        This is used to rescore many students at once, so `state` must have been
+        saved with the same seed as this module's problem. The rescore is tracked
+        with `track_function`, but nothing is saved or published: returns a tuple
+        of the result `rescore_problem()` would return, the student's new problem
+        state, and their new score.
+        """
+        def track_function_unmask(title, event_info):
+            """Track the event for the student, with choice names unmasked."""
+            event_unmasked = copy.deepcopy(event_info)
+            self.unmask_event(event_unmasked)
+            track_function(title, event_unmasked)
+
+        own_state = self.lcp.get_state()
+        self.lcp.set_student_state(state)
+        try:
+            result = self._rescore_lcp(state.get('attempts', 0), track_function_unmask)
+            return result, self.lcp.get_state(), self.lcp.get_score()
+        finally:
+            self.lcp.set_student_state(own_state)
+
+    def _rescore_lcp(self, attempts, track_function_unmask):
+        """
+        Rescores the answers currently loaded into `self.lcp`, whose student has
+        made `attempts` attempts, and tracks the outcome. See `rescore_problem()`
+        for the value returned and exceptions raised.
+        """
         event_info = {'state': self.lcp.get_state(), 'problem_id': self.location.to_deprecated_string()}
 
         _ = self.runtime.service(self, "i18n").ugettext
 
         if not self.lcp.supports_rescoring():
             event_info['failure'] = 'unsupported'
-            self.track_function_unmask('problem_rescore_fail', event_info)
+            track_function_unmask('problem_rescore_fail', event_info)
             # Translators: 'rescoring' refers to the act of re-submitting a student's solution so it can get a new score.
             raise NotImplementedError(_("Problem's definition does not support rescoring."))
 
-        if not self.done:
+        if not self.lcp.done:
             event_info['failure'] = 'unanswered'
-            self.track_function_unmask('problem_rescore_fail', event_info)
+            track_function_unmask('problem_rescore_fail', event_info)
             raise NotFoundError(_("Problem must be answered before it can be graded again."))
 
         # get old score, for comparison:
@@ -1249,24 +1370,18 @@ class CapaMixin(CapaFields):
         except (StudentInputError, ResponseError, LoncapaProblemError) as inst:
             log.warning("Input error in capa_module:problem_rescore", exc_info=True)
             event_info['failure'] = 'input_error'
-            self.track_function_unmask('problem_rescore_fail', event_info)
+            track_function_unmask('problem_rescore_fail', event_info)
             return {'success': u"Error: {0}".format(inst.message)}
 
         except Exception as err:
             event_info['failure'] = 'unexpected'
-            self.track_function_unmask('problem_rescore_fail', event_info)
+            track_function_unmask('problem_rescore_fail', event_info)
             if self.runtime.DEBUG:
                 msg = u"Error checking problem: {0}".format(err.message)
                 msg += u'\nTraceback:\n' + traceback.format_exc()
                 return {'success': msg}
             raise
 
-        # rescoring should have no effect on attempts, so don't
-        # need to increment here, or mark done.  Just save.
-        self.set_state_from_lcp()
-
-        self.publish_grade()
-
         new_score = self.lcp.get_score()
         event_info['new_score'] = new_score['score']
         event_info['new_total'] = new_score['total']
@@ -1281,12 +1396,8 @@ class CapaMixin(CapaFields):
         #       'success' will always be incorrect
         event_info['correct_map'] = correct_map.get_dict()
         event_info['success'] = success
-        event_info['attempts'] = self.attempts
-        self.track_function_unmask('problem_rescore', event_info)
-
-        # psychometrics should be called on rescoring requests in the same way as check-problem
-        if hasattr(self.runtime, 'psychometrics_handler'):  # update PsychometricsData using callback
-            self.runtime.psychometrics_handler(self.get_state_for_lcp())
+        event_info['attempts'] = attempts
+        track_function_unmask('problem_rescore', event_info)
 
         return {'success': success}
 
@@ -12,10 +12,11 @@ structure:
 }
 """
 
+import functools
 import pymongo
 import sys
 import logging
-import copy
+import time
 import re
 
 from bson.son import SON
@@ -49,20 +50,59 @@ class InvalidWriteError(Exception):
     pass
 
 
+class DefinitionDataLazyLoader(object):
+    """
+    A placeholder for the definition data of an item which was left out of a
+    prefetch. It reads the data from the db when the item's content fields are
+    first accessed.
+    """
+    def __init__(self, collection, location_son, convert):
+        """
+        :param collection: the pymongo collection with the item
+        :param location_son: the _id of the item
+        :param convert: a function to apply to the data once it's read
+        """
+        self.collection = collection
+        self.location_son = location_son
+        self.convert = convert
+
+    def fetch(self):
+        """
+        Fetch the data. Note, the caller should replace this lazy loader
+        pointer with the result so as not to fetch more than once
+        """
+        item = self.collection.find_one({'_id': self.location_son}, {'definition.data': True})
+        data = item.get('definition', {}).get('data', {}) if item is not None else {}
+        if not isinstance(data, dict):
+            data = {'data': data}
+        return self.convert(data)
+
+
 class MongoKeyValueStore(InheritanceKeyValueStore):
     """
     A KeyValueStore that maps keyed data access to one of the 3 data areas
     known to the MongoModuleStore (data, children, and metadata)
     """
     def __init__(self, data, children, metadata):
+        """
+        data may be a DefinitionDataLazyLoader, which is replaced by the data
+        it fetches on the first access to a content field
+        """
         super(MongoKeyValueStore, self).__init__()
-        if not isinstance(data, dict):
+        if not isinstance(data, (dict, DefinitionDataLazyLoader)):
             self._data = {'data': data}
         else:
             self._data = data
         self._children = children
         self._metadata = metadata
 
+    def _load_data(self):
+        """
+        Replace a lazy loader with the definition data it fetches
+        """
+        if isinstance(self._data, DefinitionDataLazyLoader):
+            self._data = self._data.fetch()
+
     def get(self, key):
         if key.scope == Scope.children:
             return self._children
@@ -71,6 +111,7 @@ class MongoKeyValueStore(InheritanceKeyValueStore):
         elif key.scope == Scope.settings:
             return self._metadata[key.field_name]
         elif key.scope == Scope.content:
+            self._load_data()
             return self._data[key.field_name]
         else:
             raise InvalidScopeError(key)
@@ -81,6 +122,7 @@ class MongoKeyValueStore(InheritanceKeyValueStore):
         elif key.scope == Scope.settings:
             self._metadata[key.field_name] = value
         elif key.scope == Scope.content:
+            self._load_data()
             self._data[key.field_name] = value
         else:
             raise InvalidScopeError(key)
@@ -92,6 +134,7 @@ class MongoKeyValueStore(InheritanceKeyValueStore):
             if key.field_name in self._metadata:
                 del self._metadata[key.field_name]
         elif key.scope == Scope.content:
+            self._load_data()
             if key.field_name in self._data:
                 del self._data[key.field_name]
         else:
@@ -103,6 +146,7 @@ class MongoKeyValueStore(InheritanceKeyValueStore):
         elif key.scope == Scope.settings:
             return key.field_name in self._metadata
         elif key.scope == Scope.content:
+            self._load_data()
             return key.field_name in self._data
         else:
             return False
@@ -180,11 +224,19 @@ class CachingDescriptorSystem(MakoDescriptorSystem):
                     location.course_key.make_usage_key_from_deprecated_string(childloc)
                     for childloc in definition.get('children', [])
                 ]
-                data = definition.get('data', {})
-                if isinstance(data, basestring):
-                    data = {'data': data}
                 mixed_class = self.mixologist.mix(class_)
-                data = self._convert_reference_fields_to_keys(mixed_class, location.course_key, data)
+                if 'data' in definition:
+                    data = definition['data']
+                    if isinstance(data, basestring):
+                        data = {'data': data}
+                    data = self._convert_reference_fields_to_keys(mixed_class, location.course_key, data)
+                else:
+                    # the data was left out of a prefetch, so only read it if it's used
+                    data = DefinitionDataLazyLoader(
+                        self.modulestore.collection,
+                        json_data['location'],
+                        functools.partial(self._convert_reference_fields_to_keys, mixed_class, location.course_key),
+                    )
                 metadata = self._convert_reference_fields_to_keys(mixed_class, location.course_key, metadata)
                 kvs = MongoKeyValueStore(
                     data,
@@ -323,86 +375,157 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
         self.ignore_write_events_on_courses = set()
 
+    def _inheritance_record_filter(self):
+        """
+        Return the find() projection for the fields needed to compute metadata inheritance: the
+        Location, children, and inheritable metadata. This minimizes the data pushed over the wire.
+        """
+        record_filter = {'_id': 1, 'definition.children': 1}
+        for field_name in InheritanceMixin.fields:
+            record_filter['metadata.{0}'.format(field_name)] = 1
+        return record_filter
+
+    def _inheritance_records_by_url(self, course_id, resultset):
+        """
+        Index the inheritance records in resultset by non-draft location url. When an item has both a
+        draft and a published version, the draft wins, as it does when loading items.
+        """
+        # it's ok to keep these as urls b/c the overall cache is indexed by course_key and this
+        # is a dictionary relative to that course
+        results_by_url = {}
+        for result in resultset:
+            # manually pick it apart b/c the db has tag and we want revision = None regardless
+            location = Location._from_deprecated_son(result['_id'], course_id.run)
+            location_url = location.replace(revision=None).to_deprecated_string()
+            if location.revision is not None or location_url not in results_by_url:
+                results_by_url[location_url] = result
+        return results_by_url
+
+    @staticmethod
+    def _metadata_for_children(inherited_metadata, record):
+        """
+        Return the metadata which the children of record inherit, given what record itself inherits.
+
+        Items which set no inheritable fields hand their parent's dict down unchanged, so the tree
+        shares one dict between every item below the nearest override instead of copying it per item.
+        Dicts in the tree must therefore never be modified in place.
+        """
+        own_metadata = record.get('metadata', {})
+        if not own_metadata:
+            return inherited_metadata
+        metadata = dict(inherited_metadata)
+        metadata.update(own_metadata)
+        return metadata
+
     def _compute_metadata_inheritance_tree(self, course_id):
         '''
+        Return a dict mapping the url of every item in the course to the (json) metadata it inherits
+        from its ancestors.
+
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
         # get all collections in the course, this query should not return any leaf nodes
-        # note this is a bit ugly as when we add new categories of containers, we have to add it here
-
-        block_types_with_children = set(
-            name for name, class_ in XBlock.load_classes() if getattr(class_, 'has_children', False)
-        )
         query = SON([
             ('_id.tag', 'i4x'),
             ('_id.org', course_id.org),
             ('_id.course', course_id.course),
-            ('_id.category', {'$in': list(block_types_with_children)})
+            ('_id.category', {'$in': list(self._block_types_with_children())})
         ])
-        # we just want the Location, children, and inheritable metadata
-        record_filter = {'_id': 1, 'definition.children': 1}
+        results_by_url = self._inheritance_records_by_url(
+            course_id, self.collection.find(query, self._inheritance_record_filter())
+        )
+        # now traverse the tree and compute down the inherited metadata
+        metadata_to_inherit = {}
+        for url, result in results_by_url.iteritems():
+            if result['_id']['category'] == 'course':
+                self._inherit_metadata_down(results_by_url, {url: {}}, metadata_to_inherit)
+                break
+        return metadata_to_inherit
 
-        # just get the inheritable metadata since that is all we need for the computation
-        # this minimizes both data pushed over the wire
-        for field_name in InheritanceMixin.fields:
-            record_filter['metadata.{0}'.format(field_name)] = 1
+    def _inherit_metadata_down(self, results_by_url, to_process, tree, fetch_children=None):
+        """
+        Walk down from the containers in to_process (a dict of url -> metadata that container inherits),
+        recording in tree what each descendant inherits.
 
-        # call out to the DB
-        resultset = self.collection.find(query, record_filter)
+        results_by_url holds the inheritance records of the containers. If fetch_children is given,
+        it is called with the urls of each level of children and returns the records of those which
+        are containers, so that only the subtree below to_process is read from the db.
+        """
+        visited = set()
+        while to_process:
+            child_metadata = {}
+            for url, inherited_metadata in to_process.iteritems():
+                visited.add(url)
+                metadata_for_children = self._metadata_for_children(inherited_metadata, results_by_url[url])
+                for child in results_by_url[url].get('definition', {}).get('children', []):
+                    tree[child] = metadata_for_children
+                    if child not in visited:
+                        child_metadata[child] = metadata_for_children
+            if fetch_children is not None and child_metadata:
+                results_by_url = fetch_children(child_metadata.keys())
+            # go on with the children which are containers. Remember results will not contain leaf nodes
+            to_process = dict(
+                (child, metadata) for child, metadata in child_metadata.iteritems() if child in results_by_url
+            )
 
-        # it's ok to keep these as urls b/c the overall cache is indexed by course_key and this
-        # is a dictionary relative to that course
-        results_by_url = {}
-        root = None
+    def _block_types_with_children(self):
+        """
+        Return the set of block types which can have children
+        """
+        # note this is a bit ugly as when we add new categories of containers, we have to add it here
+        return set(
+            name for name, class_ in XBlock.load_classes() if getattr(class_, 'has_children', False)
+        )
 
-        # now go through the results and order them by the location url
-        for result in resultset:
-            # manually pick it apart b/c the db has tag and we want revision = None regardless
-            location = Location._from_deprecated_son(result['_id'], course_id.run).replace(revision=None)
-
-            location_url = location.to_deprecated_string()
-            if location_url in results_by_url:
-                # found either draft or live to complement the other revision
-                existing_children = results_by_url[location_url].get('definition', {}).get('children', [])
-                additional_children = result.get('definition', {}).get('children', [])
-                total_children = existing_children + additional_children
-                results_by_url[location_url].setdefault('definition', {})['children'] = total_children
-            results_by_url[location_url] = result
-            if location.category == 'course':
-                root = location_url
+    def _metadata_inheritance_version(self, course_id, bump=False):
+        """
+        Return the current version of the course's inheritance tree in the
+        metadata_inheritance_cache_subsystem, first moving on to a new version if bump is set.
 
-        # now traverse the tree and compute down the inherited metadata
-        metadata_to_inherit = {}
+        Every write which changes the tree bumps the version, and the tree of each version is
+        cached under its own key, so a tree updated from an out of date copy is never served.
+        Returns None if the version can't be read, in which case the tree isn't cached.
+        """
+        cache = self.metadata_inheritance_cache_subsystem
+        version_key = u'metadata_inheritance_version:{}'.format(course_id)
+        # Versions start from the current time rather than from 0, so that if the version is
+        # evicted from the cache, the trees cached for the old versions aren't mistaken for new ones
+        cache.add(version_key, int(time.time() * 1000))
+        if not bump:
+            return cache.get(version_key)
+        try:
+            return cache.incr(version_key)
+        except ValueError:
+            # evicted since it was added
+            return None
 
-        def _compute_inherited_metadata(url):
-            """
-            Helper method for computing inherited metadata for a specific location url
-            """
-            my_metadata = results_by_url[url].get('metadata', {})
-
-            # go through all the children and recurse, but only if we have
-            # in the result set. Remember results will not contain leaf nodes
-            for child in results_by_url[url].get('definition', {}).get('children', []):
-                if child in results_by_url:
-                    new_child_metadata = copy.deepcopy(my_metadata)
-                    new_child_metadata.update(results_by_url[child].get('metadata', {}))
-                    results_by_url[child]['metadata'] = new_child_metadata
-                    metadata_to_inherit[child] = new_child_metadata
-                    _compute_inherited_metadata(child)
-                else:
-                    # this is likely a leaf node, so let's record what metadata we need to inherit
-                    metadata_to_inherit[child] = my_metadata
+    @staticmethod
+    def _metadata_inheritance_cache_key(course_id, version):
+        """
+        Return the key of the course's inheritance tree of version in the metadata_inheritance_cache_subsystem
+        """
+        return u'metadata_inheritance:{}:{}'.format(course_id, version)
 
-        if root is not None:
-            _compute_inherited_metadata(root)
+    def _cache_metadata_inheritance_tree(self, course_id, tree, version=None, runtime=None):
+        """
+        Store the course's inheritance tree of version in the caches, and in runtime if given
+        """
+        if self.metadata_inheritance_cache_subsystem is not None and version is not None:
+            cache_key = self._metadata_inheritance_cache_key(course_id, version)
+            self.metadata_inheritance_cache_subsystem.set(cache_key, tree)
 
-        return metadata_to_inherit
+        # we can't assume the 'metadata_inheritance' part of the request cache dict has been defined
+        if self.request_cache is not None:
+            self.request_cache.data.setdefault('metadata_inheritance', {})[course_id] = tree
+        if runtime:
+            runtime.cached_metadata = tree
 
     def _get_cached_metadata_inheritance_tree(self, course_id, force_refresh=False):
         '''
         TODO (cdodge) This method can be deleted when the 'split module store' work has been completed
         '''
         tree = {}
+        version = None
 
         if not force_refresh:
             # see if we are first in the request cache (if present)
@@ -411,28 +534,24 @@ class MongoModuleStore(ModuleStoreWriteBase):
 
             # then look in any caching subsystem (e.g. memcached)
             if self.metadata_inheritance_cache_subsystem is not None:
-                tree = self.metadata_inheritance_cache_subsystem.get(course_id, {})
+                version = self._metadata_inheritance_version(course_id)
+                if version is not None:
+                    tree = self.metadata_inheritance_cache_subsystem.get(
+                        self._metadata_inheritance_cache_key(course_id, version), {}
+                    )
             else:
                 logging.warning('Running MongoModuleStore without a metadata_inheritance_cache_subsystem. This is OK in localdev and testing environment. Not OK in production.')
+        elif self.metadata_inheritance_cache_subsystem is not None:
+            # the tree cached for the current version, and any update other processes are making to it, are stale
+            version = self._metadata_inheritance_version(course_id, bump=True)
 
         if not tree:
             # if not in subsystem, or we are on force refresh, then we have to compute
             tree = self._compute_metadata_inheritance_tree(course_id)
 
-            # now write out computed tree to caching subsystem (e.g. memcached), if available
-            if self.metadata_inheritance_cache_subsystem is not None:
-                self.metadata_inheritance_cache_subsystem.set(course_id, tree)
-
-        # now populate a request_cache, if available. NOTE, we are outside of the
-        # scope of the above if: statement so that after a memcache hit, it'll get
-        # put into the request_cache
-        if self.request_cache is not None:
-            # we can't assume the 'metadatat_inheritance' part of the request cache dict has been
-            # defined
-            if 'metadata_inheritance' not in self.request_cache.data:
-                self.request_cache.data['metadata_inheritance'] = {}
-            self.request_cache.data['metadata_inheritance'][course_id] = tree
-
+        # now populate the caches. NOTE, we are outside of the scope of the above if: statement
+        # so that after a memcache hit, it'll get put into the request_cache
+        self._cache_metadata_inheritance_tree(course_id, tree, version)
         return tree
 
     def refresh_cached_metadata_inheritance_tree(self, course_id, runtime=None):
@@ -448,6 +567,84 @@ class MongoModuleStore(ModuleStoreWriteBase):
             if runtime:
                 runtime.cached_metadata = cached_metadata
 
+    def update_cached_metadata_inheritance_subtree(self, location, runtime=None):
+        """
+        Update the cached metadata inheritance tree after the item at location was written or deleted.
+
+        Only the descendants of location can inherit anything different, so only the containers in
+        that subtree are re-read and the rest of the cached tree is kept. Writes to leaf items don't
+        change the tree at all. If no tree is cached for the course yet, this refreshes it in full.
+
+        The update is made to the tree cached for the current version (see
+        _metadata_inheritance_version), and stored as the next version. If another process changed
+        the tree in the meantime, the update would lose that change, so the tree is refreshed in
+        full instead.
+
+        If given a runtime, it replaces the cached_metadata in that runtime.
+        """
+        course_id = location.course_key
+        if course_id in self.ignore_write_events_on_courses:
+            return
+
+        tree = None
+        version = None
+        if self.metadata_inheritance_cache_subsystem is not None:
+            version = self._metadata_inheritance_version(course_id)
+            if version is not None:
+                tree = self.metadata_inheritance_cache_subsystem.get(
+                    self._metadata_inheritance_cache_key(course_id, version), {}
+                )
+        elif self.request_cache is not None:
+            tree = self.request_cache.data.get('metadata_inheritance', {}).get(course_id)
+        if not tree:
+            return self.refresh_cached_metadata_inheritance_tree(course_id, runtime)
+
+        block_types_with_children = self._block_types_with_children()
+        if location.category not in block_types_with_children:
+            return
+
+        url = location.replace(revision=None).to_deprecated_string()
+        if location.category != 'course' and url not in tree:
+            # nothing in the course inherits from an item which isn't attached to it
+            return
+
+        if version is not None:
+            new_version = self._metadata_inheritance_version(course_id, bump=True)
+            if new_version != version + 1:
+                # another process changed the tree since it was read
+                return self._cache_metadata_inheritance_tree(
+                    course_id, self._compute_metadata_inheritance_tree(course_id), new_version, runtime
+                )
+            version = new_version
+
+        def fetch_children(urls):
+            """
+            Read the inheritance records of the containers among urls, whether draft or published
+            """
+            locations = [course_id.make_usage_key_from_deprecated_string(url) for url in urls]
+            categories = set(loc.category for loc in locations) & block_types_with_children
+            if not categories:
+                return {}
+            query = SON([
+                ('_id.tag', 'i4x'),
+                ('_id.org', course_id.org),
+                ('_id.course', course_id.course),
+                ('_id.category', {'$in': list(categories)}),
+                ('_id.name', {'$in': list(set(loc.name for loc in locations))}),
+            ])
+            return self._inheritance_records_by_url(
+                course_id, self.collection.find(query, self._inheritance_record_filter())
+            )
+
+        results_by_url = fetch_children([url])
+        if url in results_by_url:
+            self._inherit_metadata_down(results_by_url, {url: tree.get(url, {})}, tree, fetch_children)
+        elif location.category != 'course':
+            # the item is gone; its descendants are orphans now
+            del tree[url]
+
+        self._cache_metadata_inheritance_tree(course_id, tree, version, runtime)
+
     def _clean_item_data(self, item):
         """
         Renames the '_id' field in item to 'location'
@@ -467,14 +664,56 @@ class MongoModuleStore(ModuleStoreWriteBase):
         }
         return list(self.collection.find(query))
 
+    def _index_course_items(self, course_key, items):
+        """
+        Return a dict mapping the url of each of the items to its payload, for finding
+        children without a query
+        """
+        return dict(
+            (Location._from_deprecated_son(item['_id'], course_key.run).to_deprecated_string(), item)
+            for item in items
+            if item['_id'].get('revision') is None
+        )
+
+    def _prefetch_descendents(self, course_key, items):
+        """
+        Returns the same as _cache_children with depth=None, but reads the whole course
+        in a single query and assembles the descendents of items in memory. The definition
+        data of the descendents, which can be large, is left out and only read if it's
+        used (see DefinitionDataLazyLoader).
+        """
+        query = SON([
+            ('_id.tag', 'i4x'),
+            ('_id.org', course_key.org),
+            ('_id.course', course_key.course),
+        ])
+        course_items = self._index_course_items(course_key, self.collection.find(query, {'definition.data': False}))
+        for item in items:
+            location = Location._from_deprecated_son(item['_id'], course_key.run).replace(revision=None)
+            course_items.pop(location.to_deprecated_string(), None)
+
+        data = {}
+        to_process = list(items)
+        while to_process:
+            children = []
+            for item in to_process:
+                self._clean_item_data(item)
+                children.extend(item.get('definition', {}).get('children', []))
+                data[Location._from_deprecated_son(item['location'], course_key.run)] = item
+            # pop so that each item is only processed once
+            to_process = [course_items.pop(child) for child in children if child in course_items]
+        return data
+
     def _cache_children(self, course_key, items, depth=0):
         """
         Returns a dictionary mapping Location -> item data, populated with json data
         for all descendents of items up to the specified depth.
         (0 = no descendents, 1 = children, 2 = grandchildren, etc)
-        If depth is None, will load all the children.
-        This will make a number of queries that is linear in the depth.
+        If depth is None, will load all the children in a single query.
+        Otherwise, this will make a number of queries that is linear in the depth.
         """
+        if depth is None:
+            return self._prefetch_descendents(course_key, items)
 
         data = {}
         to_process = list(items)
@@ -915,8 +1154,8 @@ class MongoModuleStore(ModuleStoreWriteBase):
                     static_tab['name'] = xblock.display_name
                     self.update_item(course, user_id)
 
-            # recompute (and update) the metadata inheritance tree which is cached
-            self.refresh_cached_metadata_inheritance_tree(xblock.scope_ids.usage_id.course_key, xblock.runtime)
+            # update the part of the metadata inheritance tree which is cached that this write affects
+            self.update_cached_metadata_inheritance_subtree(xblock.scope_ids.usage_id, xblock.runtime)
             # fire signal that we've written to DB
         except ItemNotFoundError:
             if not allow_not_found:
@@ -965,8 +1204,8 @@ class MongoModuleStore(ModuleStoreWriteBase):
         # Must include this to avoid the django debug toolbar (which defines the deprecated "safe=False")
         # from overriding our default value set in the init method.
         self.collection.remove({'_id': location.to_deprecated_son()}, safe=self.collection.safe)
-        # recompute (and update) the metadata inheritance tree which is cached
-        self.refresh_cached_metadata_inheritance_tree(location.course_key)
+        # update the part of the metadata inheritance tree which is cached that this delete affects
+        self.update_cached_metadata_inheritance_subtree(location)
 
     def get_parent_locations(self, location):
         '''Find all locations that are the parents of this location in this
@@ -153,7 +153,7 @@ class DraftModuleStore(MongoModuleStore):
         except pymongo.errors.DuplicateKeyError:
             raise DuplicateItemError(original['_id'])
 
-        self.refresh_cached_metadata_inheritance_tree(draft_location.course_key)
+        self.update_cached_metadata_inheritance_subtree(draft_location)
 
         return wrap_draft(self._load_items(source_location.course_key, [original])[0])
 
@@ -231,6 +231,18 @@ class DraftModuleStore(MongoModuleStore):
         self.convert_to_draft(location)
         super(DraftModuleStore, self).delete_item(location)
 
+    def _index_course_items(self, course_key, items):
+        items = list(items)
+        indexed = super(DraftModuleStore, self)._index_course_items(course_key, items)
+
+        # as in _query_children_for_cache_children, replace the non-draft with the draft
+        for item in items:
+            if item['_id'].get('revision') == DRAFT:
+                location = Location._from_deprecated_son(item['_id'], course_key.run).replace(revision=None)
+                if location.to_deprecated_string() in indexed:
+                    indexed[location.to_deprecated_string()] = item
+        return indexed
+
     def _query_children_for_cache_children(self, course_key, items):
         # first get non-draft in a round-trip
         to_process_non_drafts = super(DraftModuleStore, self)._query_children_for_cache_children(course_key, items)
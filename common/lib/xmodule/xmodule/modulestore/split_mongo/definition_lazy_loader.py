@@ -8,18 +8,57 @@ class DefinitionLazyLoader(object):
     object doesn't force access during init but waits until client wants the
     definition. Only works if the modulestore is a split mongo store.
     """
-    def __init__(self, modulestore, block_type, definition_id):
+    def __init__(self, modulestore, block_type, definition_id, batch=None):
         """
         Simple placeholder for yet-to-be-fetched data
         :param modulestore: the pymongo db connection with the definitions
         :param definition_locator: the id of the record in the above to fetch
+        :param batch: a DefinitionBatch to fetch the definition together with the
+            other definitions in it
         """
         self.modulestore = modulestore
         self.definition_locator = DefinitionLocator(block_type, definition_id)
+        self.batch = batch
+        if batch is not None:
+            batch.add(definition_id)
 
     def fetch(self):
         """
         Fetch the definition. Note, the caller should replace this lazy
         loader pointer with the result so as not to fetch more than once
         """
+        if self.batch is not None:
+            return self.batch.fetch(self.definition_locator.definition_id)
         return self.modulestore.db_connection.get_definition(self.definition_locator.definition_id)
+
+
+class DefinitionBatch(object):
+    """
+    The definitions of a set of DefinitionLazyLoaders (e.g., all those of a
+    CachingDescriptorSystem), which are all fetched in one query the first time
+    any of them is needed.
+    """
+    def __init__(self, modulestore):
+        self.modulestore = modulestore
+        self.pending = set()
+        self.definitions = {}
+
+    def add(self, definition_id):
+        """
+        Include the definition in the next fetch
+        """
+        self.pending.add(definition_id)
+
+    def fetch(self, definition_id):
+        """
+        Fetch the definition, along with all the other pending ones if it
+        wasn't fetched yet. Each fetched definition is handed out only once so
+        that loaders don't share the (mutable) definition documents.
+        """
+        if definition_id in self.pending:
+            self.definitions.update(self.modulestore.db_connection.get_definitions(self.pending))
+            self.pending = set()
+        definition = self.definitions.pop(definition_id, None)
+        if definition is None:
+            definition = self.modulestore.db_connection.get_definition(definition_id)
+        return definition
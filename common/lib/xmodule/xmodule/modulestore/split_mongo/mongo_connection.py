@@ -1,19 +1,121 @@
 """
 Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
 """
+import cPickle as pickle
 import re
+import threading
+from collections import OrderedDict
+from uuid import uuid4
+
 import pymongo
 from bson import son
 
+
+class DocumentCache(object):
+    """
+    A size-bounded LRU cache of documents keyed by their _id, with an optional shared cache
+    (e.g. a django cache) behind it.
+
+    Documents are stored pickled, so every get returns a fresh copy which the caller may
+    modify, and the memory each process uses is bounded by size.
+
+    If the documents are mutable, every set also stores a new token for the document in
+    the shared cache, and a copy kept in process is only used while its token is still the
+    shared one, so that no process keeps serving a document another process has changed.
+    Without a shared cache, mutable documents aren't kept in process at all.
+    """
+    def __init__(self, prefix, size, shared_cache=None, mutable=False):
+        """
+        :param prefix: the prefix for this cache's keys in the shared cache
+        :param size: the maximum number of documents to keep in process
+        :param shared_cache: a cache with get and set methods shared between processes
+        :param mutable: whether documents may be set again with different contents
+        """
+        self.prefix = prefix
+        self.size = size
+        self.shared_cache = shared_cache
+        self.mutable = mutable
+        self._documents = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _shared_key(self, key):
+        """
+        The key for the document in the shared cache
+        """
+        return u'{}.{}'.format(self.prefix, key)
+
+    def _token_key(self, key):
+        """
+        The key for the token of a mutable document in the shared cache
+        """
+        return u'{}.{}.token'.format(self.prefix, key)
+
+    def _set_local(self, key, token, pickled):
+        """
+        Keep the pickled document and its token in process, evicting the least recently used ones
+        """
+        if self.mutable and (self.shared_cache is None or token is None):
+            # other processes couldn't tell this copy is stale
+            return
+        with self._lock:
+            self._documents.pop(key, None)
+            self._documents[key] = (token, pickled)
+            while len(self._documents) > self.size:
+                self._documents.popitem(last=False)
+
+    def get(self, key):
+        """
+        Return a copy of the document with the given _id, or None if it isn't cached
+        """
+        with self._lock:
+            token, pickled = self._documents.pop(key, (None, None))
+            if pickled is not None:
+                self._documents[key] = (token, pickled)
+        if self.mutable and pickled is not None:
+            shared_token = self.shared_cache.get(self._token_key(key))
+            if shared_token is None or shared_token != token:
+                # the document was changed since it was kept in process
+                token, pickled = shared_token, None
+        if pickled is None and self.shared_cache is not None:
+            if self.mutable and token is None:
+                token = self.shared_cache.get(self._token_key(key))
+            pickled = self.shared_cache.get(self._shared_key(key))
+            if pickled is not None:
+                self._set_local(key, token, pickled)
+        if pickled is None:
+            return None
+        return pickle.loads(pickled)
+
+    def set(self, document):
+        """
+        Cache (a copy of) the document under its _id
+        """
+        key = document['_id']
+        pickled = pickle.dumps(document, pickle.HIGHEST_PROTOCOL)
+        token = uuid4().hex if self.mutable else None
+        self._set_local(key, token, pickled)
+        if self.shared_cache is not None:
+            self.shared_cache.set(self._shared_key(key), pickled)
+            if self.mutable:
+                # set after the document, so a process seeing the new token finds the new document
+                self.shared_cache.set(self._token_key(key), token)
+
+
 class MongoConnection(object):
     """
     Segregation of pymongo functions from the data modeling mechanisms for split modulestore.
     """
     def __init__(
-        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None, **kwargs
+        self, db, collection, host, port=27017, tz_aware=True, user=None, password=None,
+        shared_cache=None, structure_cache_size=50, definition_cache_size=1000, **kwargs
     ):
         """
         Create & open the connection, authenticate, and provide pointers to the collections
+
+        Structures and definitions are cached by _id in a size-bounded LRU per process, backed
+        by shared_cache (e.g. a django cache) if given. Definitions never change once written, but
+        the structure at the head of a course can be updated in place (see update_structure), so
+        copies of structures are only kept in process while they match the shared cache.
         """
         self.database = pymongo.database.Database(
             pymongo.MongoClient(
@@ -41,11 +143,21 @@ class MongoConnection(object):
         self.structures.write_concern = {'w': 1}
         self.definitions.write_concern = {'w': 1}
 
+        self.structure_cache = DocumentCache(
+            collection + '.structures', structure_cache_size, shared_cache, mutable=True
+        )
+        self.definition_cache = DocumentCache(collection + '.definitions', definition_cache_size, shared_cache)
+
     def get_structure(self, key):
         """
         Get the structure from the persistence mechanism whose id is the given key
         """
-        return self.structures.find_one({'_id': key})
+        structure = self.structure_cache.get(key)
+        if structure is None:
+            structure = self.structures.find_one({'_id': key})
+            if structure is not None:
+                self.structure_cache.set(structure)
+        return structure
 
     def find_matching_structures(self, query):
         """
@@ -59,12 +171,16 @@ class MongoConnection(object):
         Create the structure in the db
         """
         self.structures.insert(structure)
+        self.structure_cache.set(structure)
 
     def update_structure(self, structure):
         """
-        Update the db record for structure
+        Update the db record for structure. This is only for versions which are still being built
+        (see continue_version in SplitMongoModuleStore). Caching the updated structure gives it a
+        new token in the shared cache, so other processes drop the copies they kept before the update.
         """
         self.structures.update({'_id': structure['_id']}, structure)
+        self.structure_cache.set(structure)
 
     def get_course_index(self, key, ignore_case=False):
         """
@@ -110,7 +226,29 @@ class MongoConnection(object):
         """
         Get the definition from the persistence mechanism whose id is the given key
         """
-        return self.definitions.find_one({'_id': key})
+        definition = self.definition_cache.get(key)
+        if definition is None:
+            definition = self.definitions.find_one({'_id': key})
+            if definition is not None:
+                self.definition_cache.set(definition)
+        return definition
+
+    def get_definitions(self, keys):
+        """
+        Get a dict mapping each of the given keys to the definition whose id it is, in one
+        round-trip for all of those which aren't cached. Missing definitions are left out.
+        """
+        definitions = {}
+        for key in keys:
+            definition = self.definition_cache.get(key)
+            if definition is not None:
+                definitions[key] = definition
+        missing = [key for key in keys if key not in definitions]
+        if missing:
+            for definition in self.definitions.find({'_id': {'$in': missing}}):
+                self.definition_cache.set(definition)
+                definitions[definition['_id']] = definition
+        return definitions
 
     def find_matching_definitions(self, query):
         """
@@ -124,5 +262,6 @@ class MongoConnection(object):
         Create the definition in the db
         """
         self.definitions.insert(definition)
+        self.definition_cache.set(definition)
 
 
@@ -47,6 +47,7 @@ Representation:
 """
 import threading
 import datetime
+from collections import OrderedDict
 import logging
 from importlib import import_module
 from path import path
@@ -100,6 +101,8 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
     """
 
     SCHEMA_VERSION = 1
+    # the number of course versions whose descriptor systems each thread keeps
+    COURSE_CACHE_SIZE = 10
     reference_type = Locator
     def __init__(self, doc_store_config, fs_root, render_template,
                  default_class=None,
@@ -114,11 +117,12 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
         super(SplitMongoModuleStore, self).__init__(**kwargs)
         self.loc_mapper = loc_mapper
 
-        self.db_connection = MongoConnection(**doc_store_config)
+        # structures and definitions are shared between processes through the same cache as old mongo's
+        # metadata inheritance trees
+        self.db_connection = MongoConnection(shared_cache=self.metadata_inheritance_cache_subsystem, **doc_store_config)
         self.db = self.db_connection.database
 
-        # Code review question: How should I expire entries?
-        # _add_cache could use a lru mechanism to control the cache size?
+        # per thread LRU of descriptor systems by course version
         self.thread_cache = threading.local()
 
         if default_class is not None:
@@ -152,7 +156,11 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
 
         if lazy:
             for block in new_module_data.itervalues():
-                block['definition'] = DefinitionLazyLoader(self, block['category'], block['definition'])
+                # blocks cached by an earlier call already have their loader
+                if not isinstance(block['definition'], DefinitionLazyLoader):
+                    block['definition'] = DefinitionLazyLoader(
+                        self, block['category'], block['definition'], system.definition_batch
+                    )
         else:
             # Load all descendants by id
             descendent_definitions = self.db_connection.find_matching_definitions({
@@ -198,25 +206,37 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
             self.cache_items(system, block_ids, depth, lazy)
         return [system.load_item(block_id, course_entry) for block_id in block_ids]
 
+    def _course_cache(self):
+        """
+        Return this thread's LRU of descriptor systems by course version
+        """
+        if not hasattr(self.thread_cache, 'course_cache'):
+            self.thread_cache.course_cache = OrderedDict()
+        return self.thread_cache.course_cache
+
     def _get_cache(self, course_version_guid):
         """
         Find the descriptor cache for this course if it exists
         :param course_version_guid:
         """
-        if not hasattr(self.thread_cache, 'course_cache'):
-            self.thread_cache.course_cache = {}
-        system = self.thread_cache.course_cache
-        return system.get(course_version_guid)
+        course_cache = self._course_cache()
+        system = course_cache.pop(course_version_guid, None)
+        if system is not None:
+            course_cache[course_version_guid] = system
+        return system
 
     def _add_cache(self, course_version_guid, system):
         """
-        Save this cache for subsequent access
+        Save this cache for subsequent access, evicting the least recently used systems
+        beyond COURSE_CACHE_SIZE
         :param course_version_guid:
         :param system:
         """
-        if not hasattr(self.thread_cache, 'course_cache'):
-            self.thread_cache.course_cache = {}
-        self.thread_cache.course_cache[course_version_guid] = system
+        course_cache = self._course_cache()
+        course_cache.pop(course_version_guid, None)
+        course_cache[course_version_guid] = system
+        while len(course_cache) > self.COURSE_CACHE_SIZE:
+            course_cache.popitem(last=False)
         return system
 
     def _clear_cache(self, course_version_guid=None):
@@ -225,9 +245,9 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
         :param course_version_guid: if provided, clear only this entry
         """
         if course_version_guid:
-            del self.thread_cache.course_cache[course_version_guid]
+            self._course_cache().pop(course_version_guid, None)
         else:
-            self.thread_cache.course_cache = {}
+            self.thread_cache.course_cache = OrderedDict()
 
     def _lookup_course(self, course_locator):
         '''
@@ -399,22 +419,30 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
                 you can search by ``edited_by``, ``edited_on`` providing a function testing limits.
         """
         course = self._lookup_course(course_locator)
-        items = []
 
-        def _block_matches_all(block_json):
+        def _block_matches_settings(block_json):
             """
-            Check that the block matches all the criteria
+            Check that the block matches the criteria which don't require loading any additional data
             """
-            # do the checks which don't require loading any additional data
-            if (
+            return (
                 self._block_matches(block_json, kwargs) and
                 self._block_matches(block_json.get('fields', {}), settings)
-            ):
-                if content:
-                    definition_block = self.db_connection.get_definition(block_json['definition'])
-                    return self._block_matches(definition_block.get('fields', {}), content)
-                else:
-                    return True
+            )
+
+        def _blocks_matching_content(blocks):
+            """
+            Return the ids of those of the blocks (a dict of block_id -> block json) whose definitions
+            match content. The definitions are read in one query.
+            """
+            if not content:
+                return blocks.keys()
+            definitions = self.db_connection.get_definitions(
+                list(set(block['definition'] for block in blocks.itervalues()))
+            )
+            return [
+                block_id for block_id, block in blocks.iteritems()
+                if self._block_matches(definitions.get(block['definition'], {}).get('fields', {}), content)
+            ]
 
         if settings is None:
             settings = {}
@@ -422,16 +450,18 @@ class SplitMongoModuleStore(ModuleStoreWriteBase):
             # odd case where we don't search just confirm
             block_id = kwargs.pop('name')
             block = course['structure']['blocks'].get(block_id)
-            if _block_matches_all(block):
+            if _block_matches_settings(block) and _blocks_matching_content({block_id: block}):
                 return self._load_items(course, [block_id], lazy=True)
             else:
                 return []
         # don't expect caller to know that children are in fields
         if 'children' in kwargs:
             settings['children'] = kwargs.pop('children')
-        for block_id, value in course['structure']['blocks'].iteritems():
-            if _block_matches_all(value):
-                items.append(block_id)
+        items = _blocks_matching_content({
+            block_id: value
+            for block_id, value in course['structure']['blocks'].iteritems()
+            if _block_matches_settings(value)
+        })
 
         if len(items) > 0:
             return self._load_items(course, items, 0, lazy=True)
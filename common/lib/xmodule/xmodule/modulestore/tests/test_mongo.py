@@ -21,6 +21,7 @@ from xblock.plugin import Plugin
 from xmodule.tests import DATA_DIR
 from xmodule.modulestore import Location, MONGO_MODULESTORE_TYPE
 from xmodule.modulestore.mongo import MongoModuleStore, MongoKeyValueStore
+from xmodule.modulestore.mongo.base import DefinitionDataLazyLoader
 from xmodule.modulestore.draft import DraftModuleStore
 from xmodule.modulestore.locations import SlashSeparatedCourseKey, AssetLocation
 from xmodule.modulestore.xml_exporter import export_to_xml
@@ -32,6 +33,7 @@ from nose.tools import assert_in
 from xmodule.exceptions import NotFoundError
 from git.test.lib.asserts import assert_not_none
 from xmodule.x_module import XModuleMixin
+from mock import patch, Mock
 
 
 log = logging.getLogger(__name__)
@@ -445,6 +447,117 @@ class TestMongoModuleStore(unittest.TestCase):
         finally:
             shutil.rmtree(root_dir)
 
+    class DictCache(dict):
+        """A stand-in for the django cache used as metadata_inheritance_cache_subsystem"""
+        def set(self, key, value):
+            self[key] = value
+
+        def add(self, key, value):
+            self.setdefault(key, value)
+
+        def incr(self, key):
+            self[key] += 1
+            return self[key]
+
+    def _store_with_cache(self, cache):
+        """A MongoModuleStore which caches inheritance trees in cache"""
+        return MongoModuleStore(
+            {'host': HOST, 'db': DB, 'collection': COLLECTION},
+            FS_ROOT, RENDER_TEMPLATE, default_class=DEFAULT_CLASS,
+            metadata_inheritance_cache_subsystem=cache,
+        )
+
+    def test_metadata_inheritance_subtree_update(self):
+        """
+        Writing a container updates only its part of the cached inheritance tree
+        """
+        store = self._store_with_cache(self.DictCache())
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        chapter = store.get_item(course_key.make_usage_key('chapter', 'Overview'))
+        sequence_url = course_key.make_usage_key('videosequence', 'Toy_Videos').to_deprecated_string()
+        html_url = course_key.make_usage_key('html', 'toyhtml').to_deprecated_string()
+        tree = store._get_cached_metadata_inheritance_tree(course_key)
+        # items which override nothing share their parent's dict
+        assert_true(tree[sequence_url] is tree[course_key.make_usage_key('video', 'Welcome').to_deprecated_string()])
+
+        chapter.days_early_for_beta = 2.5
+        with patch.object(store, '_compute_metadata_inheritance_tree') as compute:
+            store.update_item(chapter)
+            # leaf writes don't touch the tree
+            store.update_item(store.get_item(course_key.make_usage_key('html', 'toyhtml')))
+        assert_false(compute.called)
+        tree = store._get_cached_metadata_inheritance_tree(course_key)
+        assert_equals(tree[sequence_url]['days_early_for_beta'], 2.5)
+        assert_equals(tree[html_url]['days_early_for_beta'], 2.5)
+        assert_equals(tree, store._compute_metadata_inheritance_tree(course_key))
+
+        del chapter.days_early_for_beta
+        store.update_item(chapter)
+        tree = store._get_cached_metadata_inheritance_tree(course_key)
+        assert_false('days_early_for_beta' in tree[html_url])
+        assert_equals(tree, store._compute_metadata_inheritance_tree(course_key))
+
+    def test_metadata_inheritance_concurrent_update(self):
+        """
+        An update to the cached inheritance tree doesn't lose a change another process made meanwhile
+        """
+        cache = self.DictCache()
+        store = self._store_with_cache(cache)
+        other_store = self._store_with_cache(cache)
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        video_url = course_key.make_usage_key('video', 'Welcome').to_deprecated_string()
+        store._get_cached_metadata_inheritance_tree(course_key)
+
+        chapter = store.get_item(course_key.make_usage_key('chapter', 'Overview'))
+        chapter.days_early_for_beta = 2.5
+        sequence = other_store.get_item(course_key.make_usage_key('videosequence', 'Toy_Videos'))
+        sequence.max_attempts = 3
+        other_store.update_item(sequence)
+        get_version = store._metadata_inheritance_version
+
+        def version_read_before_other_update(course_id, bump=False):
+            """Pretend that store read the version of the tree before other_store's update"""
+            version = get_version(course_id, bump)
+            return version if bump else version - 1
+
+        with patch.object(store, '_metadata_inheritance_version', side_effect=version_read_before_other_update):
+            with patch.object(store, '_compute_metadata_inheritance_tree',
+                              wraps=store._compute_metadata_inheritance_tree) as compute:
+                store.update_item(chapter)
+        assert_true(compute.called)
+
+        tree = self._store_with_cache(cache)._get_cached_metadata_inheritance_tree(course_key)
+        assert_equals(tree[video_url]['days_early_for_beta'], 2.5)
+        assert_equals(tree[video_url]['max_attempts'], 3)
+        assert_equals(tree, store._compute_metadata_inheritance_tree(course_key))
+
+        del chapter.days_early_for_beta
+        store.update_item(chapter)
+        del sequence.max_attempts
+        other_store.update_item(sequence)
+
+    def test_get_course_prefetch(self):
+        """
+        get_course with depth=None reads the whole course in one query and defers definition data
+        """
+        course_key = SlashSeparatedCourseKey('edX', 'toy', '2012_Fall')
+        with patch.object(self.store, '_query_children_for_cache_children') as query_children:
+            course = self.store.get_course(course_key, depth=None)
+        assert_false(query_children.called)
+
+        sequence = self.store.get_item(course_key.make_usage_key('videosequence', 'Toy_Videos'))
+        chapter = course.get_children()[0]
+        assert_equals(chapter.location, course_key.make_usage_key('chapter', 'Overview'))
+        prefetched = chapter.get_children()[0]
+        assert_equals(prefetched.location, sequence.location)
+        assert_equals(
+            [child.location for child in prefetched.get_children()],
+            [child.location for child in sequence.get_children()]
+        )
+        html = prefetched.get_children()[1]
+        assert_false('data' in html.runtime.module_data[html.location]['definition'])
+        assert_equals(html.data, self.store.get_item(html.location).data)
+
 
 class TestMongoKeyValueStore(object):
     """
@@ -513,3 +626,19 @@ class TestMongoKeyValueStore(object):
         for scope in (Scope.preferences, Scope.user_info, Scope.user_state, Scope.parent):
             with assert_raises(InvalidScopeError):
                 self.kvs.delete(KeyValueStore.Key(scope, None, None, 'foo'))
+
+    def test_lazy_data(self):
+        collection = Mock()
+        collection.find_one.return_value = {'definition': {'data': 'xml_data'}}
+        convert = Mock(side_effect=lambda data: data)
+        self.kvs = MongoKeyValueStore(
+            DefinitionDataLazyLoader(collection, {'name': 'a'}, convert), self.children, self.metadata
+        )
+        assert_false(collection.find_one.called)
+        assert_equals(self.metadata['meta'], self.kvs.get(KeyValueStore.Key(Scope.settings, None, None, 'meta')))
+        assert_false(collection.find_one.called)
+
+        assert_equals('xml_data', self.kvs.get(KeyValueStore.Key(Scope.content, None, None, 'data')))
+        assert_true(self.kvs.has(KeyValueStore.Key(Scope.content, None, None, 'data')))
+        collection.find_one.assert_called_once_with({'_id': {'name': 'a'}}, {'definition.data': True})
+        convert.assert_called_once_with({'data': 'xml_data'})
@@ -4,6 +4,7 @@
 import datetime
 import unittest
 import uuid
+from mock import Mock, patch
 from importlib import import_module
 from path import path
 import re
@@ -18,6 +19,7 @@ from xmodule.modulestore.inheritance import InheritanceMixin
 from xmodule.x_module import XModuleMixin
 from xmodule.fields import Date, Timedelta
 from xmodule.modulestore.split_mongo.split import SplitMongoModuleStore
+from xmodule.modulestore.split_mongo.mongo_connection import DocumentCache
 from xmodule.modulestore.tests.test_modulestore import check_has_course_method
 
 
@@ -890,6 +892,24 @@ class SplitModuleItemTests(SplitModuleTest):
             expected_ids.remove(child.location.block_id)
         self.assertEqual(len(expected_ids), 0)
 
+    def test_get_children_definitions_batched(self):
+        """
+        The definitions of a course's blocks are read together the first time one is needed
+        """
+        locator = BlockUsageLocator(
+            CourseLocator(org='testx', offering='GreekHero', branch='draft'), 'course', 'head12345'
+        )
+        modulestore()._clear_cache()
+        db_connection = modulestore().db_connection
+        with patch.object(db_connection, 'definition_cache', DocumentCache('test', 100)), \
+                patch.object(db_connection, 'definitions', Mock(wraps=db_connection.definitions)), \
+                patch.object(db_connection, 'get_definition') as get_definition:
+            block = modulestore().get_item(locator, depth=1)
+            for child in block.get_children():
+                child.get_explicitly_set_fields_by_scope(Scope.content)
+            self.assertEqual(db_connection.definitions.find.call_count, 1)
+        self.assertFalse(get_definition.called)
+
 
 class TestItemCrud(SplitModuleTest):
     """
@@ -1653,6 +1673,56 @@ class TestSchema(SplitModuleTest):
                 "{0.name} has records with wrong schema_version".format(collection)
             )
 
+
+class TestDocumentCache(unittest.TestCase):
+    """
+    Test the LRU of structures and definitions in front of mongo
+    """
+    def setUp(self):
+        self.shared_cache = {}
+        self.cache = DocumentCache('test', 2, Mock(get=self.shared_cache.get, set=self.shared_cache.__setitem__))
+
+    def test_copies(self):
+        document = {'_id': 1, 'blocks': {'a': {}}}
+        self.cache.set(document)
+        document['blocks']['b'] = {}
+        cached = self.cache.get(1)
+        self.assertEqual(cached, {'_id': 1, 'blocks': {'a': {}}})
+        cached['blocks']['c'] = {}
+        self.assertEqual(self.cache.get(1), {'_id': 1, 'blocks': {'a': {}}})
+
+    def test_lru(self):
+        for key in (1, 2, 3):
+            self.cache.set({'_id': key})
+        self.assertEqual(self.cache._documents.keys(), [2, 3])
+        self.cache.get(2)
+        self.cache.set({'_id': 4})
+        self.assertEqual(self.cache._documents.keys(), [2, 4])
+
+        # evicted documents are still found in the shared cache
+        self.assertEqual(self.cache.get(1), {'_id': 1})
+        self.assertEqual(self.cache._documents.keys(), [4, 1])
+        self.assertIsNone(self.cache.get(5))
+
+    def test_mutable(self):
+        shared_cache = Mock(get=self.shared_cache.get, set=self.shared_cache.__setitem__)
+        cache = DocumentCache('test', 2, shared_cache, mutable=True)
+        # the cache of another process
+        other_cache = DocumentCache('test', 2, shared_cache, mutable=True)
+        cache.set({'_id': 1, 'blocks': {}})
+        self.assertEqual(other_cache.get(1), {'_id': 1, 'blocks': {}})
+        self.assertEqual(other_cache._documents.keys(), [1])
+
+        cache.set({'_id': 1, 'blocks': {'a': {}}})
+        self.assertEqual(other_cache.get(1), {'_id': 1, 'blocks': {'a': {}}})
+        self.assertEqual(cache.get(1), {'_id': 1, 'blocks': {'a': {}}})
+
+    def test_mutable_without_shared_cache(self):
+        cache = DocumentCache('test', 2, mutable=True)
+        cache.set({'_id': 1})
+        self.assertIsNone(cache.get(1))
+
+
 #===========================================
 def modulestore():
     """
@@ -11,10 +11,11 @@ import datetime
 import json
 import random
 import os
+from StringIO import StringIO
 import textwrap
 import unittest
 
-from mock import Mock, patch
+from mock import ANY, Mock, patch
 import webob
 from webob.multidict import MultiDict
 
@@ -201,6 +202,72 @@ class CapaModuleTest(unittest.TestCase):
         self.assertNotEqual(module.url_name, other_module.url_name,
                             "Factory should be creating unique names for each problem")
 
+    def test_lcp_built_lazily(self):
+        """
+        Once a problem's max score is cached, scoring it doesn't build a LoncapaProblem.
+        """
+        cached = {}
+        system = get_test_system()
+        system.cache = Mock(get=cached.get, set=cached.__setitem__)
+        location = Location("edX", "capa_test", "2012_Fall", "problem", "LazyProblem", None)
+        answer_id = location.html_id() + "_2_1"
+
+        def create(problem_state):
+            """Create the problem module with the given student state."""
+            field_data = {'data': CapaFactory.sample_problem_xml}
+            field_data.update(problem_state)
+            return CapaModule(
+                Mock(weight="1"), system, DictFieldData(field_data), ScopeIds(None, None, location, location)
+            )
+
+        with patch('xmodule.capa_base.LoncapaProblem', wraps=xmodule.capa_base.LoncapaProblem) as mock_problem:
+            self.assertEqual(create({}).max_score(), 1)
+            self.assertEqual(mock_problem.call_count, 1)
+
+            module = create({
+                'student_answers': {answer_id: '3.14'},
+                'correct_map': CorrectMap(answer_id, 'correct').get_dict(),
+                'done': True,
+            })
+            self.assertEqual(module.max_score(), 1)
+            self.assertEqual(module.get_score(), {'score': 1, 'total': 1})
+            self.assertEqual(mock_problem.call_count, 1)
+
+            self.assertTrue(module.lcp.done)
+            self.assertEqual(mock_problem.call_count, 2)
+            self.assertEqual(module.get_score(), {'score': 1, 'total': 1})
+
+    def test_max_score_cache_key(self):
+        """
+        The cached max score is kept apart per seed and per version of the included files, so
+        a problem which no longer builds still fails when it's created.
+        """
+        cached = {}
+        included = {'part.xml': '<numericalresponse answer="3.14"><textline/></numericalresponse>'}
+        system = get_test_system()
+        system.cache = Mock(get=cached.get, set=cached.__setitem__)
+        system.filestore = Mock(open=lambda filename: StringIO(included[filename]))
+        system.DEBUG = False
+        location = Location("edX", "capa_test", "2012_Fall", "problem", "IncludingProblem", None)
+
+        def create(seed):
+            """Create the problem module with the given seed."""
+            field_data = DictFieldData({'data': '<problem><include file="part.xml"/></problem>', 'seed': seed})
+            return CapaModule(Mock(weight="1"), system, field_data, ScopeIds(None, None, location, location))
+
+        module = create(1)
+        self.assertEqual(module.max_score(), 1)
+        first_key = module._max_score_cache_key()  # pylint: disable=protected-access
+        self.assertIn(first_key, cached)
+        self.assertNotEqual(create(2)._max_score_cache_key(), first_key)  # pylint: disable=protected-access
+
+        included['part.xml'] = '<numericalresponse answer="3.14">'
+        with self.assertRaises(Exception):
+            create(1)
+
+        del included['part.xml']
+        self.assertIsNone(module._max_score_cache_key())  # pylint: disable=protected-access
+
     def test_correct(self):
         """
         Check that the factory creates correct and incorrect problems properly.
@@ -812,6 +879,41 @@ class CapaModuleTest(unittest.TestCase):
         # Expect that the number of attempts is not incremented
         self.assertEqual(module.attempts, 0)
 
+    def test_rescore_state(self):
+        module = CapaFactory.create(attempts=1, done=True)
+        own_state = module.lcp.get_state()
+        other_state = {
+            'seed': module.lcp.seed,
+            'done': True,
+            'attempts': 3,
+            'student_answers': {CapaFactory.answer_key(): '3.14'},
+            'correct_map': {},
+            'input_state': {},
+        }
+        track_function = Mock()
+
+        # Rescore another student's answers with the module's problem
+        with patch('capa.responsetypes.LoncapaResponse.evaluate_answers') as mock_evaluate_answers:
+            mock_evaluate_answers.return_value = CorrectMap(CapaFactory.answer_key(), 'correct')
+            result, state, score = module.rescore_state(other_state, track_function)
+
+        self.assertEqual(result['success'], 'correct')
+        self.assertEqual(state['student_answers'], other_state['student_answers'])
+        self.assertEqual(score, {'score': 1, 'total': 1})
+
+        # The rescore is tracked for the other student
+        track_function.assert_called_once_with('problem_rescore', ANY)
+        self.assertEqual(track_function.call_args[0][1]['attempts'], 3)
+
+        # Expect that the module's own state is unchanged
+        self.assertEqual(module.lcp.get_state(), own_state)
+        self.assertEqual(module.attempts, 1)
+
+    def test_rescore_state_wrong_seed(self):
+        module = CapaFactory.create(done=True)
+        with self.assertRaises(LoncapaProblemError):
+            module.rescore_state({'seed': module.lcp.seed + 1, 'done': True}, Mock())
+
     def test_rescore_problem_not_done(self):
         # Simulate that the problem is NOT done
         module = CapaFactory.create(done=False)
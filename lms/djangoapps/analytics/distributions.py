@@ -21,8 +21,9 @@ The distribution in a course for gender might look like:
 }
 """
 
+from django.core.cache import cache
 from django.db.models import Count
-from student.models import CourseEnrollment, UserProfile
+from student.models import UserProfile
 
 # choices with a restricted domain, e.g. level_of_education
 _EASY_CHOICE_FEATURES = ('gender', 'level_of_education')
@@ -36,6 +37,10 @@ DISPLAY_NAMES = {
     'year_of_birth': 'Year Of Birth',
 }
 
+KEY_PREFIX = "analytics_profile_distribution_"
+# Dashboards ask for the same distributions over and over, so keep them this many seconds
+DISTRIBUTION_CACHE_TIME = 60
+
 
 class ProfileDistribution(object):
     """
@@ -81,6 +86,27 @@ class ProfileDistribution(object):
             validation_assert(isinstance(self.choices_display_names, dict))
 
 
+def _feature_counts(course_id, feature):
+    """
+    Return a list of (value, count) pairs giving the number of students enrolled in the course
+    whose profile has each value of the feature.
+
+    The counts are computed in one grouped query, and cached for DISTRIBUTION_CACHE_TIME seconds.
+    """
+    key = u"{prefix}{course}_{feature}".format(prefix=KEY_PREFIX, course=course_id, feature=feature)
+    counts = cache.get(key)
+    if counts is None:
+        # Count enrollment ids rather than the feature, since COUNT() skips NULL values
+        counts = [
+            (row[feature], row['count'])
+            for row in UserProfile.objects.filter(
+                user__courseenrollment__course_id=course_id
+            ).values(feature).annotate(count=Count('user__courseenrollment')).order_by()
+        ]
+        cache.set(key, counts, DISTRIBUTION_CACHE_TIME)
+    return counts
+
+
 def profile_distribution(course_id, feature):
     """
     Retrieve distribution of students over a given feature.
@@ -112,57 +138,24 @@ def profile_distribution(course_id, feature):
         choices = [(short, full)
                    for (short, full) in raw_choices] + [('no_data', 'No Data')]
 
-        def get_filter(feature, value):
-            """ Get the orm filter parameters for a feature. """
-            return {
-                'gender': {'user__profile__gender': value},
-                'level_of_education': {'user__profile__level_of_education': value},
-            }[feature]
-
-        def get_count(feature, value):
-            """ Get the count of enrolled students matching the feature value. """
-            return CourseEnrollment.objects.filter(
-                course_id=course_id,
-                **get_filter(feature, value)
-            ).count()
-
-        distribution = {}
-        for (short, full) in choices:
-            # handle no data case
-            if short == 'no_data':
-                distribution['no_data'] = 0
-                distribution['no_data'] += get_count(feature, None)
-                distribution['no_data'] += get_count(feature, '')
-            else:
-                distribution[short] = get_count(feature, short)
+        # Both None and '' mean the student didn't give a value
+        distribution = dict((short, 0) for (short, full) in choices)
+        for value, count in _feature_counts(course_id, feature):
+            if value in (None, ''):
+                distribution['no_data'] += count
+            elif value in distribution:
+                distribution[value] = count
 
         prd.data = distribution
         prd.choices_display_names = dict(choices)
     elif feature in _OPEN_CHOICE_FEATURES:
         prd.type = 'OPEN_CHOICE'
-        profiles = UserProfile.objects.filter(
-            user__courseenrollment__course_id=course_id
-        )
-        query_distribution = profiles.values(
-            feature).annotate(Count(feature)).order_by()
-        # query_distribution is of the form [{'featureval': 'value1', 'featureval__count': 4},
-        #    {'featureval': 'value2', 'featureval__count': 2}, ...]
-
-        distribution = dict((vald[feature], vald[feature + '__count'])
-                            for vald in query_distribution)
+        distribution = dict(_feature_counts(course_id, feature))
         # distribution is of the form {'value1': 4, 'value2': 2, ...}
 
         # change none to no_data for valid json key
         if None in distribution:
-            # django does not properly count NULL values when using annotate Count
-            # so
-            #     distribution['no_data'] = distribution.pop(None)
-            # would always be 0.
-
-            # Correctly count null values
-            distribution['no_data'] = profiles.filter(
-                **{feature: None}
-            ).count()
+            distribution['no_data'] = distribution.pop(None)
 
         prd.data = distribution
 
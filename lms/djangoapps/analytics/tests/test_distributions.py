@@ -1,5 +1,6 @@
 """ Tests for analytics.distributions """
 
+from django.core.cache import cache
 from django.test import TestCase
 from nose.tools import raises
 from student.models import CourseEnrollment
@@ -13,6 +14,7 @@ class TestAnalyticsDistributions(TestCase):
     '''Test analytics distribution gathering.'''
 
     def setUp(self):
+        cache.clear()
         self.course_id = SlashSeparatedCourseKey('robot', 'course', 'id')
 
         self.users = [UserFactory(
@@ -49,11 +51,20 @@ class TestAnalyticsDistributions(TestCase):
         self.assertNotIn('no_data', distribution.data)
         self.assertEqual(distribution.data[1930], 1)
 
+    def test_profile_distribution_queries(self):
+        for feature in AVAILABLE_PROFILE_FEATURES:
+            with self.assertNumQueries(1):
+                distribution = profile_distribution(self.course_id, feature)
+            # Asking again is answered from the cache
+            with self.assertNumQueries(0):
+                self.assertEqual(profile_distribution(self.course_id, feature).data, distribution.data)
+
 
 class TestAnalyticsDistributionsNoData(TestCase):
     '''Test analytics distribution gathering.'''
 
     def setUp(self):
+        cache.clear()
         self.course_id = SlashSeparatedCourseKey('robot', 'course', 'id')
 
         self.users = [UserFactory(
@@ -12,6 +12,8 @@ file and check it in at the same time as your model changes. To do that,
 
 """
 import logging
+from string import Formatter
+
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.db import models, transaction
@@ -170,33 +172,29 @@ class CourseEmailTemplate(models.Model):
         """
         Create a text message using a template, message body and context.
 
-        Convert message body (`message_body`) into an email message
-        using the provided template.  The template is a format string,
-        which is rendered using format() with the provided `context` dict.
+        See :class:`CompiledEmailTemplate` for how the message is built.
+        """
+        return CompiledEmailTemplate(format_string, message_body, context).render({})
 
-        This doesn't insert user's text into template, until such time we can
-        support proper error handling due to errors in the message body
-        (e.g. due to the use of curly braces).
+    def compile_plaintext(self, plaintext, context, recipient_fields=('name', 'email')):
+        """
+        Create a CompiledEmailTemplate for plain text messages.
 
-        Instead, for now, we insert the message body *after* the substitutions
-        have been performed, so that anything in the message body that might
-        interfere will be innocently returned as-is.
+        Fills the stored plain template in with plain text body (`plaintext`) and the
+        values in `context` that are the same for all recipients, leaving the `recipient_fields`
+        to be filled in for each recipient by CompiledEmailTemplate.render.
+        """
+        return CompiledEmailTemplate(self.plain_template, plaintext, context, recipient_fields)
 
-        Output is returned as a unicode string.  It is not encoded as utf-8.
-        Such encoding is left to the email code, which will use the value
-        of settings.DEFAULT_CHARSET to encode the message.
+    def compile_htmltext(self, htmltext, context, recipient_fields=('name', 'email')):
         """
-        # If we wanted to support substitution, we'd call:
-        # format_string = format_string.replace(COURSE_EMAIL_MESSAGE_BODY_TAG, message_body)
-        result = format_string.format(**context)
-        # Note that the body tag in the template will now have been
-        # "formatted", so we need to do the same to the tag being
-        # searched for.
-        message_body_tag = COURSE_EMAIL_MESSAGE_BODY_TAG.format()
-        result = result.replace(message_body_tag, message_body, 1)
+        Create a CompiledEmailTemplate for HTML messages.
 
-        # finally, return the result, after wrapping long lines and without converting to an encoded byte array.
-        return wrap_message(result)
+        Fills the stored HTML template in with HTML text body (`htmltext`) and the
+        values in `context` that are the same for all recipients, leaving the `recipient_fields`
+        to be filled in for each recipient by CompiledEmailTemplate.render.
+        """
+        return CompiledEmailTemplate(self.html_template, htmltext, context, recipient_fields)
 
     def render_plaintext(self, plaintext, context):
         """
@@ -217,6 +215,109 @@ class CourseEmailTemplate(models.Model):
         return CourseEmailTemplate._render(self.html_template, htmltext, context)
 
 
+class CompiledEmailTemplate(object):
+    """
+    A CourseEmailTemplate filled in with a message body and everything but the values
+    which differ between recipients, so that rendering a message for each recipient of
+    a bulk email is just a matter of joining strings.
+    """
+    def __init__(self, format_string, message_body, context, recipient_fields=()):
+        """
+        Create a text message template using a template, message body and context.
+
+        Convert message body (`message_body`) into an email message
+        using the provided template.  The template is a format string,
+        which is rendered using format() with the provided `context` dict.
+
+        This doesn't insert user's text into template, until such time we can
+        support proper error handling due to errors in the message body
+        (e.g. due to the use of curly braces).
+
+        Instead, for now, we insert the message body *after* the substitutions
+        have been performed, so that anything in the message body that might
+        interfere will be innocently returned as-is.
+
+        The fields of the template which refer to one of `recipient_fields` are left
+        as slots, to be formatted with the recipient's values by `render`.
+        """
+        # If we wanted to support substitution, we'd call:
+        # format_string = format_string.replace(COURSE_EMAIL_MESSAGE_BODY_TAG, message_body)
+        # Split the template into literal text and the formatted values of its fields, keeping
+        # the format strings of the per-recipient fields as slots in the form of 1-tuples.
+        parts = [u'']
+        for literal_text, field_name, format_spec, conversion in Formatter().parse(format_string):
+            # parse() also splits literal text at escaped braces, so keep consecutive text together
+            if isinstance(parts[-1], tuple):
+                parts.append(literal_text)
+            else:
+                parts[-1] += literal_text
+            if field_name is None:
+                continue
+            field = u'{' + field_name
+            if conversion:
+                field += u'!' + conversion
+            if format_spec:
+                field += u':' + format_spec
+            field += u'}'
+            if _field_root(field_name) in recipient_fields:
+                parts.append((field,))
+            else:
+                parts[-1] += field.format(**context)
+
+        # Note that the body tag in the template will now have been
+        # "formatted", so we need to do the same to the tag being
+        # searched for.
+        message_body_tag = COURSE_EMAIL_MESSAGE_BODY_TAG.format()
+        for index, part in enumerate(parts):
+            if not isinstance(part, tuple) and message_body_tag in part:
+                parts[index] = part.replace(message_body_tag, message_body, 1)
+                break
+
+        # Long lines are wrapped when the message is rendered, so group the parts into lines
+        # and wrap all the lines without any slots in them now.
+        lines = [[]]
+        for part in parts:
+            if isinstance(part, tuple):
+                lines[-1].append(part)
+                continue
+            part_lines = part.split('\n')
+            lines[-1].append(part_lines[0])
+            lines.extend([part_line] for part_line in part_lines[1:])
+        self.lines = [
+            line if any(isinstance(part, tuple) for part in line) else wrap_message(u''.join(line))
+            for line in lines
+        ]
+
+    def render(self, recipient_context):
+        """
+        Return the message for the recipient whose `recipient_fields` values are given by the
+        `recipient_context` dict.
+
+        Output is returned as a unicode string.  It is not encoded as utf-8.
+        Such encoding is left to the email code, which will use the value
+        of settings.DEFAULT_CHARSET to encode the message.
+        """
+        rendered_lines = []
+        for line in self.lines:
+            if isinstance(line, list):
+                line = wrap_message(u''.join(
+                    part[0].format(**recipient_context) if isinstance(part, tuple) else part
+                    for part in line
+                ))
+            rendered_lines.append(line)
+        return u'\n'.join(rendered_lines)
+
+
+def _field_root(field_name):
+    """
+    Return the name of the context value a template field refers to, e.g. 'user' for '{user.name}'.
+    """
+    for index, char in enumerate(field_name):
+        if char in '.[':
+            return field_name[:index]
+    return field_name
+
+
 class CourseAuthorization(models.Model):
     """
     Enable the course email feature on a course-by-course basis.
@@ -437,9 +437,10 @@ def _send_course_email(entry_id, email_id, to_list, global_email_context, subtas
         connection = get_connection()
         connection.open()
 
-        # Define context values to use in all course emails:
+        # Fill in the templates with the context values used in all course emails, once:
+        plaintext_template = course_email_template.compile_plaintext(course_email.text_message, global_email_context)
+        html_template = course_email_template.compile_htmltext(course_email.html_message, global_email_context)
         email_context = {'name': '', 'email': ''}
-        email_context.update(global_email_context)
 
         while to_list:
             # Update context with user-specific values from the user at the end of the list.
@@ -453,8 +454,8 @@ def _send_course_email(entry_id, email_id, to_list, global_email_context, subtas
             email_context['name'] = current_recipient['profile__name']
 
             # Construct message content using templates and context:
-            plaintext_msg = course_email_template.render_plaintext(course_email.text_message, email_context)
-            html_msg = course_email_template.render_htmltext(course_email.html_message, email_context)
+            plaintext_msg = plaintext_template.render(email_context)
+            html_msg = html_template.render(email_context)
 
             # Create email:
             email_msg = EmailMultiAlternatives(
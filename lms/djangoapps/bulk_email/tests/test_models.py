@@ -104,6 +104,23 @@ class CourseEmailTemplateTest(TestCase):
         context = self._get_sample_plain_context()
         template.render_plaintext("My new plain text.", context)
 
+    def test_compiled_matches_render(self):
+        template = CourseEmailTemplate.get_template()
+        context = self._get_sample_html_context()
+        del context['email']
+        plaintext_template = template.compile_plaintext(u"My new plain text {name}.", context)
+        html_template = template.compile_htmltext(u"My new html text {{email}}." + u" word" * 500, context)
+        for recipient_context in ({'name': u'Jos\xe9', 'email': 'jose@test.com'}, {'name': '', 'email': 'x@test.com'}):
+            context.update(recipient_context)
+            self.assertEquals(
+                plaintext_template.render(recipient_context),
+                template.render_plaintext(u"My new plain text {name}.", context)
+            )
+            self.assertEquals(
+                html_template.render(recipient_context),
+                template.render_htmltext(u"My new html text {{email}}." + u" word" * 500, context)
+            )
+
 
 class CourseAuthorizationTest(TestCase):
     """Test the CourseAuthorization model."""
@@ -5,7 +5,8 @@ from util.json_request import JsonResponse
 import json
 
 from courseware import models
-from django.db.models import Count
+from django.conf import settings
+from django.db.models import Count, Sum
 from django.utils.translation import ugettext as _
 
 from xmodule.modulestore.django import modulestore
@@ -31,12 +32,22 @@ def get_problem_grade_distribution(course_id):
         attempting the problem
     """
 
-    # Aggregate query on studentmodule table for grade data for all problems in course
-    db_query = models.StudentModule.objects.filter(
-        course_id__exact=course_id,
-        grade__isnull=False,
-        module_type__exact="problem",
-    ).values('module_state_key', 'grade', 'max_grade').annotate(count_grade=Count('grade'))
+    if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+        # Grade data for all problems in course, from the histograms kept as students are graded
+        db_query = models.StudentModuleGradeCount.objects.filter(
+            course_id__exact=course_id,
+            grade__isnull=False,
+            module_type__exact="problem",
+        ).values('module_state_key', 'grade', 'max_grade').annotate(
+            count_grade=Sum('count')
+        ).filter(count_grade__gt=0)
+    else:
+        # Aggregate query on studentmodule table for grade data for all problems in course
+        db_query = models.StudentModule.objects.filter(
+            course_id__exact=course_id,
+            grade__isnull=False,
+            module_type__exact="problem",
+        ).values('module_state_key', 'grade', 'max_grade').annotate(count_grade=Count('grade'))
 
     prob_grade_distrib = {}
     total_student_count = {}
@@ -74,11 +85,18 @@ def get_sequential_open_distrib(course_id):
     Outputs a dict mapping the 'module_id' to the number of students that have opened that subsection/sequential.
     """
 
-    # Aggregate query on studentmodule table for "opening a subsection" data
-    db_query = models.StudentModule.objects.filter(
-        course_id__exact=course_id,
-        module_type__exact="sequential",
-    ).values('module_state_key').annotate(count_sequential=Count('module_state_key'))
+    if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+        # "Opening a subsection" data from the histograms kept as students open them
+        db_query = models.StudentModuleGradeCount.objects.filter(
+            course_id__exact=course_id,
+            module_type__exact="sequential",
+        ).values('module_state_key').annotate(count_sequential=Sum('count'))
+    else:
+        # Aggregate query on studentmodule table for "opening a subsection" data
+        db_query = models.StudentModule.objects.filter(
+            course_id__exact=course_id,
+            module_type__exact="sequential",
+        ).values('module_state_key').annotate(count_sequential=Count('module_state_key'))
 
     # Build set of "opened" data for each subsection that has "opened" data
     sequential_open_distrib = {}
@@ -104,17 +122,30 @@ def get_problem_set_grade_distrib(course_id, problem_set):
       'grade_distrib' - array of tuples (`grade`,`count`) ordered by `grade`
     """
 
-    # Aggregate query on studentmodule table for grade data for set of problems in course
-    db_query = models.StudentModule.objects.filter(
-        course_id__exact=course_id,
-        grade__isnull=False,
-        module_type__exact="problem",
-        module_state_key__in=problem_set,
-    ).values(
-        'module_state_key',
-        'grade',
-        'max_grade',
-    ).annotate(count_grade=Count('grade')).order_by('module_state_key', 'grade')
+    if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+        # Grade data for set of problems in course, from the histograms kept as students are graded
+        db_query = models.StudentModuleGradeCount.objects.filter(
+            course_id__exact=course_id,
+            grade__isnull=False,
+            module_type__exact="problem",
+            module_state_key__in=problem_set,
+        ).values(
+            'module_state_key',
+            'grade',
+            'max_grade',
+        ).annotate(count_grade=Sum('count')).filter(count_grade__gt=0).order_by('module_state_key', 'grade')
+    else:
+        # Aggregate query on studentmodule table for grade data for set of problems in course
+        db_query = models.StudentModule.objects.filter(
+            course_id__exact=course_id,
+            grade__isnull=False,
+            module_type__exact="problem",
+            module_state_key__in=problem_set,
+        ).values(
+            'module_state_key',
+            'grade',
+            'max_grade',
+        ).annotate(count_grade=Count('grade')).order_by('module_state_key', 'grade')
 
     prob_grade_distrib = {}
 
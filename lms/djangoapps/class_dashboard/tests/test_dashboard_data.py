@@ -5,12 +5,14 @@ Tests for class dashboard (Metrics tab in instructor dashboard)
 import json
 from mock import patch
 
+from django.conf import settings
 from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
 from django.test.client import RequestFactory
 from xmodule.modulestore.tests.factories import CourseFactory, ItemFactory
 from xmodule.modulestore.tests.django_utils import ModuleStoreTestCase
 from courseware.tests.tests import TEST_DATA_MONGO_MODULESTORE
+from courseware.models import StudentModule, StudentModuleGradeCount
 from courseware.tests.factories import StudentModuleFactory
 from student.tests.factories import UserFactory, CourseEnrollmentFactory, AdminFactory
 from capa.tests.response_xml_factory import StringResponseXMLFactory
@@ -22,6 +24,7 @@ from class_dashboard.dashboard_data import (get_problem_grade_distribution, get_
                                             get_students_opened_subsection, get_students_problem_grades,
                                             )
 from class_dashboard.views import has_instructor_access_for_class
+from xmodule_modifiers import grade_histogram
 
 USER_COUNT = 11
 
@@ -316,3 +319,50 @@ class TestGetProblemGradeDistribution(ModuleStoreTestCase):
         """
         ret_val = has_instructor_access_for_class(self.instructor, self.course.id)
         self.assertEquals(ret_val, True)
+
+
+class TestGetProblemGradeDistributionFromHistograms(TestGetProblemGradeDistribution):
+    """
+    Tests reading the class dashboard data from the StudentModuleGradeCount histograms
+    """
+
+    def setUp(self):
+        patcher = patch.dict(settings.FEATURES, {'ENABLE_GRADE_HISTOGRAM_TABLE': True})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        super(TestGetProblemGradeDistributionFromHistograms, self).setUp()
+
+    def test_regrade_and_rebuild(self):
+        student_module = StudentModule.objects.get(
+            student=self.users[0], module_state_key=self.item.location, module_type='problem'
+        )
+        student_module.grade = 1
+        student_module.max_grade = 1
+        student_module.save()
+
+        prob_grade_distrib, total_student_count = get_problem_grade_distribution(self.course.id)
+        self.assertEquals(
+            sorted(prob_grade_distrib[self.item.location]['grade_distrib']),
+            [(0.0, USER_COUNT - 2), (1.0, 2)]
+        )
+        self.assertEquals(total_student_count[self.item.location], USER_COUNT)
+
+        # The histograms match what counting the StudentModules gives, also after rebuilding them
+        def dashboard_data():
+            """ Return the dashboard data, with the grades of each problem in order """
+            prob_grade_distrib, total_student_count = get_problem_grade_distribution(self.course.id)
+            for distrib in prob_grade_distrib.values():
+                distrib['grade_distrib'].sort()
+            return (
+                prob_grade_distrib,
+                total_student_count,
+                get_sequential_open_distrib(self.course.id),
+                grade_histogram(self.item.location),
+            )
+
+        with patch.dict(settings.FEATURES, {'ENABLE_GRADE_HISTOGRAM_TABLE': False}):
+            expected = dashboard_data()
+        self.assertEquals(dashboard_data(), expected)
+        StudentModuleGradeCount.objects.all().delete()
+        StudentModuleGradeCount.rebuild(self.course.id)
+        self.assertEquals(dashboard_data(), expected)
@@ -1,19 +1,24 @@
 # Compute grades using real division, with no integer truncation
 from __future__ import division
 from collections import defaultdict
+from itertools import islice
+import hashlib
 import json
 import random
 import logging
 
 from contextlib import contextmanager
+from datetime import timedelta
 from django.conf import settings
-from django.db import transaction
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Max
 from django.test.client import RequestFactory
 
 from dogapi import dog_stats_api
 
 from courseware import courses
-from courseware.model_data import FieldDataCache
+from courseware.model_data import FieldDataCache, chunks
 from student.models import anonymous_id_for_user
 from submissions import api as sub_api
 from xmodule import graders
@@ -21,12 +26,20 @@ from xmodule.graders import Score
 from xmodule.modulestore.django import modulestore
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
-from .models import StudentModule
+from xblock.fields import Scope
+from .models import ProblemAnswerCount, StudentModule, StudentModuleAnswers, StudentSectionScore
 from .module_render import get_module_for_descriptor
 from opaque_keys import InvalidKeyError
 
 log = logging.getLogger("edx.courseware")
 
+# StudentModules modified up to this long before the newest one whose answers were
+# counted are looked at again, in case they were saved before it but committed after.
+ANSWER_COUNTS_WATERMARK_SLACK = timedelta(minutes=5)
+ANSWER_COUNTS_CHUNK_SIZE = 500
+# Seconds after which a crashed update of a course's answer counts stops blocking others
+ANSWER_COUNTS_LOCK_TIMEOUT = 60 * 60
+
 
 def yield_dynamic_descriptor_descendents(descriptor, module_creator):
     """
@@ -51,6 +64,172 @@ def yield_dynamic_descriptor_descendents(descriptor, module_creator):
         yield next_descriptor
 
 
+class PrefetchedStudentModules(object):
+    """
+    The StudentModules a single student has for a fixed set of locations,
+    loaded ahead of time by `prefetch_student_modules`.
+
+    Locations that were prefetched but have no entry mean the student has no
+    StudentModule there, so callers only need to query the database for
+    locations this object doesn't cover.
+    """
+    def __init__(self, locations):
+        # Set of location strings that were prefetched, shared between students
+        self.locations = locations
+        self.modules = {}
+
+    def covers(self, location):
+        """
+        Return True if StudentModules for `location` were prefetched.
+        """
+        return location.to_deprecated_string() in self.locations
+
+    def get(self, location):
+        """
+        Return the StudentModule for `location`, or None if there is none.
+        """
+        return self.modules.get(location.to_deprecated_string())
+
+    def add(self, student_module):
+        """
+        Record a StudentModule loaded for this student.
+        """
+        self.modules[student_module.module_state_key.to_deprecated_string()] = student_module
+
+
+def prefetch_student_modules(course, students, chunk_size=400):
+    """
+    Load the StudentModules that each of `students` has for every descriptor
+    that can affect grading in `course`, using a few chunked queries instead of
+    several queries per student and problem.
+
+    Returns a dict mapping student id to a PrefetchedStudentModules.
+    """
+    descriptors = course.grading_context['all_descriptors']
+    locations = set(descriptor.location.to_deprecated_string() for descriptor in descriptors)
+    students_by_id = {student.id: student for student in students}
+    prefetched = {student_id: PrefetchedStudentModules(locations) for student_id in students_by_id}
+
+    # Keep the number of query parameters under sqlite's limit
+    for location_chunk in chunks(set(descriptor.location for descriptor in descriptors), chunk_size):
+        student_modules = StudentModule.objects.filter(
+            course_id=course.id,
+            student__in=students_by_id.keys(),
+            module_state_key__in=location_chunk,
+        )
+        for student_module in student_modules:
+            # Avoid a query per row when anything looks at the student
+            student_module.student = students_by_id[student_module.student_id]
+            prefetched[student_module.student_id].add(student_module)
+
+    return prefetched
+
+
+class SectionScoreCache(object):
+    """
+    Persistent cache of the raw scores a single student earned in each graded
+    section of a course, backed by the StudentSectionScore table.
+
+    Each cached entry is stored along with a fingerprint of the section's
+    graded content and of the grade columns of every StudentModule the
+    student has for that section. Sections whose fingerprint still matches
+    are not regraded, so grading a student only instantiates problems in the
+    sections that changed since the last time they were graded.
+    """
+    def __init__(self, student, course_key, student_modules=None):
+        self.student = student
+        self.course_key = course_key
+
+        # { location string : (modified, grade, max_grade) } for every
+        # StudentModule this student has in the course. values_list() skips
+        # the key field conversion, so the locations come back as strings.
+        if student_modules is not None:
+            module_grades = (
+                (location, student_module.modified, student_module.grade, student_module.max_grade)
+                for location, student_module in student_modules.modules.iteritems()
+            )
+        else:
+            module_grades = StudentModule.objects.filter(
+                student=student, course_id=course_key
+            ).values_list('module_state_key', 'modified', 'grade', 'max_grade')
+        self.module_grades = {
+            module_state_key: (unicode(modified), grade, max_grade)
+            for module_state_key, modified, grade, max_grade in module_grades
+        }
+        self.entries = {
+            entry.section_key.to_deprecated_string(): entry
+            for entry in StudentSectionScore.objects.filter(student=student, course_id=course_key)
+        }
+
+    def has_state(self, descriptors):
+        """
+        Return True if the student has a StudentModule for any of `descriptors`.
+        """
+        return any(
+            descriptor.location.to_deprecated_string() in self.module_grades
+            for descriptor in descriptors
+        )
+
+    def fingerprint(self, section):
+        """
+        Return a hash of everything the scores in `section` (an entry of the
+        course grading_context) are computed from, or None if the section
+        can't be cached because its children depend on per-student state.
+        """
+        section_descriptor = section['section_descriptor']
+        if any(
+                descriptor.has_dynamic_children()
+                for descriptor in yield_dynamic_descriptor_descendents(section_descriptor, lambda _: None)
+        ):
+            return None
+
+        fingerprint = hashlib.md5()
+        fingerprint.update(section_descriptor.location.to_deprecated_string())
+        for descriptor in section['xmoduledescriptors']:
+            location = descriptor.location.to_deprecated_string()
+            fingerprint.update(json.dumps([
+                location,
+                descriptor.graded,
+                getattr(descriptor, 'weight', None),
+                descriptor.display_name_with_default,
+                descriptor.get_explicitly_set_fields_by_scope(Scope.content),
+                self.module_grades.get(location),
+            ], sort_keys=True, default=unicode))
+        return fingerprint.hexdigest()
+
+    def get(self, section_key, fingerprint):
+        """
+        Return the cached list of Scores for `section_key`, or None if there
+        is no entry or it was computed from a different `fingerprint`.
+        """
+        entry = self.entries.get(section_key.to_deprecated_string())
+        if entry is None or entry.fingerprint != fingerprint:
+            return None
+        return [Score(*score) for score in json.loads(entry.scores)]
+
+    def set(self, section_key, fingerprint, scores):
+        """
+        Store the list of `scores` computed for `section_key`.
+        """
+        entry = self.entries.get(section_key.to_deprecated_string())
+        if entry is None:
+            entry = StudentSectionScore(
+                student=self.student,
+                course_id=self.course_key,
+                section_key=section_key,
+            )
+        entry.fingerprint = fingerprint
+        entry.scores = json.dumps([list(score) for score in scores])
+        try:
+            with manual_transaction():
+                entry.save()
+        except IntegrityError:
+            # Someone else graded this student at the same time and stored
+            # the section first; their entry is just as good as ours.
+            return
+        self.entries[section_key.to_deprecated_string()] = entry
+
+
 def answer_distributions(course_key):
     """
     Given a course_key, return answer distributions in the form of a dictionary
@@ -79,9 +258,16 @@ def answer_distributions(course_key):
     generate the report.
 
     This method will try to use a read-replica database if one is available.
+
+    With FEATURES['ENABLE_INCREMENTAL_ANSWER_DISTRIBUTION'], the counts are kept in
+    the ProblemAnswerCount table instead, and each call only decodes the state of the
+    StudentModules which changed since the last one.
     """
-    # dict: { module.module_state_key : (url_name, display_name) }
-    state_keys_to_problem_info = {}  # For caching, used by url_and_display_name
+    # dict: { module.module_state_key : (url_name, display_name) }, for all of the course's problems
+    state_keys_to_problem_info = dict(
+        (problem.location, (problem.url_name, problem.display_name_with_default))
+        for problem in modulestore().get_items(course_key, category='problem')
+    )
 
     def url_and_display_name(usage_key):
         """
@@ -95,62 +281,204 @@ def answer_distributions(course_key):
         """
         problem_store = modulestore()
         if usage_key not in state_keys_to_problem_info:
-            problem = problem_store.get_item(usage_key)
+            try:
+                problem = problem_store.get_item(usage_key)
+            except ItemNotFoundError:
+                state_keys_to_problem_info[usage_key] = None
+                raise
             problem_info = (problem.url_name, problem.display_name_with_default)
             state_keys_to_problem_info[usage_key] = problem_info
 
+        if state_keys_to_problem_info[usage_key] is None:
+            raise ItemNotFoundError(usage_key)
         return state_keys_to_problem_info[usage_key]
 
-    # Iterate through all problems submitted for this course in no particular
-    # order, and build up our answer_counts dict that we will eventually return
+    part_answer_counts = None
+    if settings.FEATURES.get('ENABLE_INCREMENTAL_ANSWER_DISTRIBUTION'):
+        part_answer_counts = _update_answer_counts(course_key)
+    if part_answer_counts is None:
+        part_answer_counts = _count_submitted_answers(course_key)
+
+    # Go through the answers to each problem part in no particular order, and
+    # build up our answer_counts dict that we will eventually return
     answer_counts = defaultdict(lambda: defaultdict(int))
-    for module in StudentModule.all_submitted_problems_read_only(course_key):
+    missing_keys = set()
+    for (module_state_key, problem_part_id, answer), count in part_answer_counts.iteritems():
         try:
-            state_dict = json.loads(module.state) if module.state else {}
-            raw_answers = state_dict.get("student_answers", {})
-        except ValueError:
-            log.error(
-                "Answer Distribution: Could not parse module state for " +
-                "StudentModule id={}, course={}".format(module.id, course_key)
-            )
+            url, display_name = url_and_display_name(module_state_key.map_into_course(course_key))
+        except (ItemNotFoundError, InvalidKeyError):
+            if module_state_key not in missing_keys:
+                missing_keys.add(module_state_key)
+                msg = "Answer Distribution: Item {} referenced in StudentModules " + \
+                      "in course {} not found; " + \
+                      "This can happen if a student answered a question that " + \
+                      "was later deleted from the course. These answers will be " + \
+                      "omitted from the answer distribution CSV."
+                log.warning(msg.format(module_state_key, course_key))
             continue
 
-        try:
-            url, display_name = url_and_display_name(module.module_state_key.map_into_course(course_key))
-            # Each problem part has an ID that is derived from the
-            # module.module_state_key (with some suffix appended)
-            for problem_part_id, raw_answer in raw_answers.items():
-                # Convert whatever raw answers we have (numbers, unicode, None, etc.)
-                # to be unicode values. Note that if we get a string, it's always
-                # unicode and not str -- state comes from the json decoder, and that
-                # always returns unicode for strings.
-                answer = unicode(raw_answer)
-                answer_counts[(url, display_name, problem_part_id)][answer] += 1
+        answer_counts[(url, display_name, problem_part_id)][answer] += count
 
-        except (ItemNotFoundError, InvalidKeyError):
-            msg = "Answer Distribution: Item {} referenced in StudentModule {} " + \
-                  "for user {} in course {} not found; " + \
-                  "This can happen if a student answered a question that " + \
-                  "was later deleted from the course. This answer will be " + \
-                  "omitted from the answer distribution CSV."
-            log.warning(
-                msg.format(module.module_state_key, module.id, module.student_id, course_key)
+    return answer_counts
+
+
+def _submitted_answers(module, course_key):
+    """
+    Return a dict mapping the ids of the problem parts of a submitted problem
+    StudentModule to the answers given to them, or None if its state doesn't parse.
+    """
+    try:
+        state_dict = json.loads(module.state) if module.state else {}
+        raw_answers = state_dict.get("student_answers", {})
+    except ValueError:
+        log.error(
+            "Answer Distribution: Could not parse module state for " +
+            "StudentModule id={}, course={}".format(module.id, course_key)
+        )
+        return None
+
+    # Each problem part has an ID that is derived from the
+    # module.module_state_key (with some suffix appended)
+    # Convert whatever raw answers we have (numbers, unicode, None, etc.)
+    # to be unicode values. Note that if we get a string, it's always
+    # unicode and not str -- state comes from the json decoder, and that
+    # always returns unicode for strings.
+    return dict(
+        (problem_part_id, unicode(raw_answer))
+        for problem_part_id, raw_answer in raw_answers.items()
+    )
+
+
+def _count_submitted_answers(course_key):
+    """
+    Return a dict mapping (module_state_key, problem part id, answer) to the number
+    of submitted problem StudentModules in the course which gave that answer.
+    """
+    part_answer_counts = defaultdict(int)
+    for module in StudentModule.all_submitted_problems_read_only(course_key):
+        for problem_part_id, answer in (_submitted_answers(module, course_key) or {}).iteritems():
+            part_answer_counts[(module.module_state_key, problem_part_id, answer)] += 1
+    return part_answer_counts
+
+
+def _update_answer_counts(course_key):
+    """
+    Bring the ProblemAnswerCount rows of the course up to date with the problem
+    StudentModules submitted, changed or deleted since they were last updated, and
+    return their counts in the form returned by _count_submitted_answers.
+
+    Returns None without updating anything if another process is already updating them.
+    """
+    lock_key = u"answer_counts_update.{}".format(course_key)
+    if not cache.add(lock_key, True, ANSWER_COUNTS_LOCK_TIMEOUT):
+        return None
+    try:
+        with transaction.commit_on_success():
+            deltas = _answer_count_deltas(course_key)
+
+            counts = dict(
+                ((row.module_state_key, row.problem_part_id, row.answer), row)
+                for row in ProblemAnswerCount.objects.filter(course_id=course_key)
             )
-            continue
+            new_rows = []
+            for (module_state_key, problem_part_id, answer), delta in deltas.iteritems():
+                row = counts.get((module_state_key, problem_part_id, answer))
+                if row is None:
+                    if delta > 0:
+                        row = ProblemAnswerCount(
+                            course_id=course_key,
+                            module_state_key=module_state_key,
+                            problem_part_id=problem_part_id,
+                            answer=answer,
+                            count=delta,
+                        )
+                        counts[(module_state_key, problem_part_id, answer)] = row
+                        new_rows.append(row)
+                elif delta:
+                    row.count += delta
+                    if row.count > 0:
+                        row.save()
+                    else:
+                        row.delete()
+            ProblemAnswerCount.objects.bulk_create(new_rows)
+    finally:
+        cache.delete(lock_key)
+
+    return dict((key, row.count) for key, row in counts.iteritems() if row.count > 0)
+
+
+def _answer_count_deltas(course_key):
+    """
+    Update the StudentModuleAnswers rows of the course, and return a dict mapping
+    (module_state_key, problem part id, answer) to how much the counts of the answers
+    they record have changed.
+
+    Only the StudentModules modified since shortly before the newest one already recorded
+    are decoded.
+    """
+    submitted = StudentModule.all_submitted_problems_read_only(course_key)
+    recorded = StudentModuleAnswers.objects.filter(course_id=course_key)
+    deltas = defaultdict(int)
+
+    def uncount(record):
+        """ Take the answers recorded in `record` back out of the counts """
+        for problem_part_id, answer in json.loads(record.answers).iteritems():
+            deltas[(record.module_state_key, problem_part_id, answer)] -= 1
+
+    # StudentModules which were deleted, or are no longer submitted
+    gone_ids = (
+        set(recorded.values_list('student_module_id', flat=True)) -
+        set(submitted.values_list('id', flat=True))
+    )
+    for ids in chunks(gone_ids, ANSWER_COUNTS_CHUNK_SIZE):
+        for record in StudentModuleAnswers.objects.filter(student_module_id__in=ids):
+            uncount(record)
+        StudentModuleAnswers.objects.filter(student_module_id__in=ids).delete()
+
+    watermark = recorded.aggregate(Max('modified'))['modified__max']
+    if watermark is not None:
+        submitted = submitted.filter(modified__gte=watermark - ANSWER_COUNTS_WATERMARK_SLACK)
+
+    for modules in chunks(submitted, ANSWER_COUNTS_CHUNK_SIZE):
+        records = dict(
+            (record.student_module_id, record)
+            for record in StudentModuleAnswers.objects.filter(student_module_id__in=[module.id for module in modules])
+        )
+        new_records = []
+        for module in modules:
+            answers = _submitted_answers(module, course_key) or {}
+            record = records.get(module.id)
+            if record is None:
+                record = StudentModuleAnswers(student_module_id=module.id, course_id=course_key)
+                new_records.append(record)
+            elif record.modified == module.modified and json.loads(record.answers) == answers:
+                continue
+            else:
+                uncount(record)
+
+            for problem_part_id, answer in answers.iteritems():
+                deltas[(module.module_state_key, problem_part_id, answer)] += 1
+            record.module_state_key = module.module_state_key
+            record.answers = json.dumps(answers)
+            record.modified = module.modified
+            if record.pk is not None:
+                record.save()
+        StudentModuleAnswers.objects.bulk_create(new_records)
+
+    return deltas
 
-    return answer_counts
 
 @transaction.commit_manually
-def grade(student, request, course, keep_raw_scores=False):
+def grade(student, request, course, keep_raw_scores=False, student_modules=None):
     """
     Wraps "_grade" with the manual_transaction context manager just in case
     there are unanticipated errors.
     """
     with manual_transaction():
-        return _grade(student, request, course, keep_raw_scores)
+        return _grade(student, request, course, keep_raw_scores, student_modules)
 
 
-def _grade(student, request, course, keep_raw_scores):
+def _grade(student, request, course, keep_raw_scores, student_modules=None):
     """
     Unwrapped version of "grade"
 
@@ -169,6 +497,9 @@ def _grade(student, request, course, keep_raw_scores):
     - keep_raw_scores : if True, then value for key 'raw_scores' contains scores
       for every graded module
 
+    student_modules is an optional PrefetchedStudentModules for this student,
+    used in place of per-section and per-problem StudentModule queries.
+
     More information on the format is in the docstring for CourseGrader.
     """
     grading_context = course.grading_context
@@ -181,6 +512,12 @@ def _grade(student, request, course, keep_raw_scores):
         course.id.to_deprecated_string(), anonymous_id_for_user(student, course.id)
     )
 
+    # Randomly generated profile scores must never be persisted
+    score_cache = None
+    if settings.FEATURES.get('ENABLE_PERSISTENT_GRADE_CACHE') and not settings.GENERATE_PROFILE_SCORES:
+        with manual_transaction():
+            score_cache = SectionScoreCache(student, course.id, student_modules)
+
     totaled_scores = {}
     # This next complicated loop is just to collect the totaled_scores, which is
     # passed to the grader
@@ -206,48 +543,41 @@ def _grade(student, request, course, keep_raw_scores):
                     for descriptor in section['xmoduledescriptors']
                 )
 
+            # Only sections scored entirely from StudentModule can be cached,
+            # since those are the only scores the fingerprint covers.
+            fingerprint = None
             if not should_grade_section:
-                with manual_transaction():
-                    should_grade_section = StudentModule.objects.filter(
-                        student=student,
-                        module_state_key__in=[
-                            descriptor.location for descriptor in section['xmoduledescriptors']
-                        ]
-                    ).exists()
+                if score_cache is not None:
+                    should_grade_section = score_cache.has_state(section['xmoduledescriptors'])
+                    if should_grade_section:
+                        fingerprint = score_cache.fingerprint(section)
+                elif student_modules is not None:
+                    should_grade_section = any(
+                        student_modules.get(descriptor.location) is not None
+                        for descriptor in section['xmoduledescriptors']
+                    )
+                else:
+                    with manual_transaction():
+                        should_grade_section = StudentModule.objects.filter(
+                            student=student,
+                            module_state_key__in=[
+                                descriptor.location for descriptor in section['xmoduledescriptors']
+                            ]
+                        ).exists()
 
             # If we haven't seen a single problem in the section, we don't have
             # to grade it at all! We can assume 0%
             if should_grade_section:
-                scores = []
+                scores = None
+                if fingerprint is not None:
+                    scores = score_cache.get(section_descriptor.location, fingerprint)
 
-                def create_module(descriptor):
-                    '''creates an XModule instance given a descriptor'''
-                    # TODO: We need the request to pass into here. If we could forego that, our arguments
-                    # would be simpler
-                    with manual_transaction():
-                        field_data_cache = FieldDataCache([descriptor], course.id, student)
-                    return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
-
-                for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
-
-                    (correct, total) = get_score(
-                        course.id, student, module_descriptor, create_module, scores_cache=submissions_scores
+                if scores is None:
+                    scores = _score_section(
+                        student, request, course, section_descriptor, submissions_scores, student_modules
                     )
-                    if correct is None and total is None:
-                        continue
-
-                    if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
-                        if total > 1:
-                            correct = random.randrange(max(total - 2, 1), total + 1)
-                        else:
-                            correct = total
-
-                    graded = module_descriptor.graded
-                    if not total > 0:
-                        #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
-                        graded = False
-
-                    scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+                    if fingerprint is not None:
+                        score_cache.set(section_descriptor.location, fingerprint, scores)
 
                 _, graded_total = graders.aggregate_scores(scores, section_name)
                 if keep_raw_scores:
@@ -279,6 +609,53 @@ def _grade(student, request, course, keep_raw_scores):
     return grade_summary
 
 
+def _score_section(student, request, course, section_descriptor, submissions_scores, student_modules=None):
+    """
+    Return the list of Scores `student` earned on the problems inside
+    `section_descriptor`, instantiating problems as needed to score them.
+    """
+    scores = []
+
+    def create_module(descriptor):
+        '''creates an XModule instance given a descriptor'''
+        # TODO: We need the request to pass into here. If we could forego that, our arguments
+        # would be simpler
+        if student_modules is not None and student_modules.covers(descriptor.location):
+            student_module = student_modules.get(descriptor.location)
+            field_data_cache = FieldDataCache(
+                [descriptor], course.id, student,
+                student_modules=[student_module] if student_module is not None else []
+            )
+        else:
+            with manual_transaction():
+                field_data_cache = FieldDataCache([descriptor], course.id, student)
+        return get_module_for_descriptor(student, request, descriptor, field_data_cache, course.id)
+
+    for module_descriptor in yield_dynamic_descriptor_descendents(section_descriptor, create_module):
+
+        (correct, total) = get_score(
+            course.id, student, module_descriptor, create_module,
+            scores_cache=submissions_scores, student_modules=student_modules
+        )
+        if correct is None and total is None:
+            continue
+
+        if settings.GENERATE_PROFILE_SCORES:  	# for debugging!
+            if total > 1:
+                correct = random.randrange(max(total - 2, 1), total + 1)
+            else:
+                correct = total
+
+        graded = module_descriptor.graded
+        if not total > 0:
+            #We simply cannot grade a problem that is 12/0, because we might need it as a percentage
+            graded = False
+
+        scores.append(Score(correct, total, graded, module_descriptor.display_name_with_default))
+
+    return scores
+
+
 def grade_for_percentage(grade_cutoffs, percentage):
     """
     Returns a letter grade as defined in grading_policy (e.g. 'A' 'B' 'C' for 6.002x) or None.
@@ -403,7 +780,7 @@ def _progress_summary(student, request, course):
     return chapters
 
 
-def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None):
+def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=None, student_modules=None):
     """
     Return the score for a user on a problem, as a tuple (correct, total).
     e.g. (5,7) if you got 5 out of 7 points.
@@ -417,6 +794,8 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
            Can return None if user doesn't have access, or if something else went wrong.
     scores_cache: A dict of location names to (earned, possible) point tuples.
            If an entry is found in this cache, it takes precedence.
+    student_modules: An optional PrefetchedStudentModules for the user. If it
+           covers this problem, the database isn't queried for its StudentModule.
     """
     scores_cache = scores_cache or {}
 
@@ -443,14 +822,17 @@ def get_score(course_id, user, problem_descriptor, module_creator, scores_cache=
         # These are not problems, and do not have a score
         return (None, None)
 
-    try:
-        student_module = StudentModule.objects.get(
-            student=user,
-            course_id=course_id,
-            module_state_key=problem_descriptor.location
-        )
-    except StudentModule.DoesNotExist:
-        student_module = None
+    if student_modules is not None and student_modules.covers(problem_descriptor.location):
+        student_module = student_modules.get(problem_descriptor.location)
+    else:
+        try:
+            student_module = StudentModule.objects.get(
+                student=user,
+                course_id=course_id,
+                module_state_key=problem_descriptor.location
+            )
+        except StudentModule.DoesNotExist:
+            student_module = None
 
     if student_module is not None and student_module.max_grade is not None:
         correct = student_module.grade if student_module.grade is not None else 0
@@ -496,11 +878,27 @@ def manual_transaction():
         transaction.commit()
 
 
-def iterate_grades_for(course_id, students):
+def _batches(items, batch_size):
+    """
+    Yields the values from the iterable `items` in lists of up to `batch_size`,
+    without materializing all of them at once.
+    """
+    iterator = iter(items)
+    batch = list(islice(iterator, batch_size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, batch_size))
+
+
+def iterate_grades_for(course_id, students, batch_size=None):
     """Given a course_id and an iterable of students (User), yield a tuple of:
 
     (student, gradeset, err_msg) for every student enrolled in the course.
 
+    If `batch_size` is given, students are graded in batches of that size: the
+    whole course is loaded once up front, and the StudentModules of every
+    student in a batch are loaded together before any of them is graded.
+
     If an error occurred, gradeset will be an empty dict and err_msg will be an
     exception message. If there was no error, err_msg is an empty string.
 
@@ -514,32 +912,43 @@ def iterate_grades_for(course_id, students):
         make up the final grade. (For display)
     - raw_scores: contains scores for every graded module
     """
-    course = courses.get_course_by_id(course_id)
+    if batch_size is None:
+        course = courses.get_course_by_id(course_id)
+        student_batches = ([student] for student in students)
+    else:
+        course = courses.get_course_by_id(course_id, depth=None)
+        student_batches = _batches(students, batch_size)
 
     # We make a fake request because grading code expects to be able to look at
     # the request. We have to attach the correct user to the request before
     # grading that student.
     request = RequestFactory().get('/')
 
-    for student in students:
-        with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course_id)]):
-            try:
-                request.user = student
-                # Grading calls problem rendering, which calls masquerading,
-                # which checks session vars -- thus the empty session dict below.
-                # It's not pretty, but untangling that is currently beyond the
-                # scope of this feature.
-                request.session = {}
-                gradeset = grade(student, request, course)
-                yield student, gradeset, ""
-            except Exception as exc:  # pylint: disable=broad-except
-                # Keep marching on even if this student couldn't be graded for
-                # some reason, but log it for future reference.
-                log.exception(
-                    'Cannot grade student %s (%s) in course %s because of exception: %s',
-                    student.username,
-                    student.id,
-                    course_id,
-                    exc.message
-                )
-                yield student, {}, exc.message
+    for student_batch in student_batches:
+        prefetched = {}
+        if batch_size is not None:
+            with dog_stats_api.timer('lms.grades.prefetch_student_modules', tags=['action:{}'.format(course_id)]):
+                prefetched = prefetch_student_modules(course, student_batch)
+
+        for student in student_batch:
+            with dog_stats_api.timer('lms.grades.iterate_grades_for', tags=['action:{}'.format(course_id)]):
+                try:
+                    request.user = student
+                    # Grading calls problem rendering, which calls masquerading,
+                    # which checks session vars -- thus the empty session dict below.
+                    # It's not pretty, but untangling that is currently beyond the
+                    # scope of this feature.
+                    request.session = {}
+                    gradeset = grade(student, request, course, student_modules=prefetched.get(student.id))
+                    yield student, gradeset, ""
+                except Exception as exc:  # pylint: disable=broad-except
+                    # Keep marching on even if this student couldn't be graded for
+                    # some reason, but log it for future reference.
+                    log.exception(
+                        'Cannot grade student %s (%s) in course %s because of exception: %s',
+                        student.username,
+                        student.id,
+                        course_id,
+                        exc.message
+                    )
+                    yield student, {}, exc.message
@@ -0,0 +1,37 @@
+"""
+Recount the StudentModuleGradeCount histograms of courses from their StudentModules.
+"""
+
+from textwrap import dedent
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from courseware.models import StudentModuleGradeCount
+from opaque_keys import InvalidKeyError
+from xmodule.modulestore.locations import SlashSeparatedCourseKey
+
+
+class Command(BaseCommand):
+    """
+    Recount the grade histograms of the given courses from their StudentModules.
+
+    Run this for every course when turning on FEATURES['ENABLE_GRADE_HISTOGRAM_TABLE'],
+    since the histograms only follow StudentModules saved while it's on.
+    """
+    args = "<course_id course_id ...>"
+    help = dedent(__doc__).strip()
+
+    def handle(self, *args, **options):
+        if not args:
+            raise CommandError("Specify at least one course_id")
+
+        for course_id in args:
+            try:
+                course_key = SlashSeparatedCourseKey.from_deprecated_string(course_id)
+            except InvalidKeyError:
+                raise CommandError("Invalid course_id {}".format(course_id))
+
+            with transaction.commit_on_success():
+                StudentModuleGradeCount.rebuild(course_key)
+            self.stdout.write("Rebuilt grade histograms for {}\n".format(course_id))
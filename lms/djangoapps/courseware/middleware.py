@@ -0,0 +1,25 @@
+"""
+Middleware for the courseware app.
+"""
+from courseware.models import StudentModuleHistory
+
+
+class StudentModuleHistoryMiddleware(object):
+    """
+    Queues the StudentModuleHistory entries saved during a request only once the
+    request's transaction has been committed, so that entries are never written
+    for StudentModule changes that were rolled back.
+
+    This must come before TransactionMiddleware in MIDDLEWARE_CLASSES, so that
+    its process_response runs after TransactionMiddleware has committed.
+    """
+    def process_request(self, request):  # pylint: disable=unused-argument
+        StudentModuleHistory.defer_entries()
+
+    def process_exception(self, request, exception):  # pylint: disable=unused-argument
+        # TransactionMiddleware has just rolled back the request's transaction
+        StudentModuleHistory.discard_deferred_entries()
+
+    def process_response(self, request, response):  # pylint: disable=unused-argument
+        StudentModuleHistory.queue_deferred_entries()
+        return response
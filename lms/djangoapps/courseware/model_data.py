@@ -4,6 +4,7 @@ Classes to provide the LMS runtime data storage to XBlocks
 
 import json
 from collections import defaultdict
+from copy import deepcopy
 from itertools import chain
 from .models import (
     StudentModule,
@@ -14,8 +15,8 @@ from .models import (
 import logging
 from xmodule.modulestore.locations import SlashSeparatedCourseKey, Location
 
-from django.db import DatabaseError
-from django.contrib.auth.models import User
+from django.db import DatabaseError, IntegrityError, transaction
+from django.db.models.signals import post_save
 
 from xblock.runtime import KeyValueStore
 from xblock.exceptions import KeyValueMultiSaveError, InvalidScopeError
@@ -44,7 +45,7 @@ class FieldDataCache(object):
     A cache of django model objects needed to supply the data
     for a module and its decendants
     """
-    def __init__(self, descriptors, course_id, user, select_for_update=False):
+    def __init__(self, descriptors, course_id, user, select_for_update=False, student_modules=None):
         '''
         Find any courseware.models objects that are needed by any descriptor
         in descriptors. Attempts to minimize the number of queries to the database.
@@ -56,10 +57,16 @@ class FieldDataCache(object):
         course_id: The id of the current course
         user: The user for which to cache data
         select_for_update: True if rows should be locked until end of transaction
+        student_modules: If not None, all of the StudentModules that `user` has
+            for `descriptors`, already loaded from the database. They are used
+            instead of querying for Scope.user_state data.
         '''
         self.cache = {}
+        # Maps StudentModule ids to (state, decoded state), see `decoded_state`
+        self._decoded_states = {}
         self.descriptors = descriptors
         self.select_for_update = select_for_update
+        self.student_modules = student_modules
 
         assert isinstance(course_id, SlashSeparatedCourseKey)
         self.course_id = course_id
@@ -73,7 +80,7 @@ class FieldDataCache(object):
     @classmethod
     def cache_for_descriptor_descendents(cls, course_id, user, descriptor, depth=None,
                                          descriptor_filter=lambda descriptor: True,
-                                         select_for_update=False):
+                                         select_for_update=False, student_modules=None):
         """
         course_id: the course in the context of which we want StudentModules.
         user: the django user for whom to load modules.
@@ -83,6 +90,8 @@ class FieldDataCache(object):
         descriptor_filter is a function that accepts a descriptor and return wether the StudentModule
             should be cached
         select_for_update: Flag indicating whether the rows should be locked until end of transaction
+        student_modules: If not None, the StudentModules to use instead of querying for them
+            (see FieldDataCache.__init__)
         """
 
         def get_child_descriptors(descriptor, depth, descriptor_filter):
@@ -110,7 +119,7 @@ class FieldDataCache(object):
 
         descriptors = get_child_descriptors(descriptor, depth, descriptor_filter)
 
-        return FieldDataCache(descriptors, course_id, user, select_for_update)
+        return FieldDataCache(descriptors, course_id, user, select_for_update, student_modules)
 
     def _query(self, model_class, **kwargs):
         """
@@ -142,6 +151,8 @@ class FieldDataCache(object):
         Queries the database for all of the fields in the specified scope
         """
         if scope == Scope.user_state:
+            if self.student_modules is not None:
+                return self.student_modules
             return self._chunked_query(
                 StudentModule,
                 'module_state_key__in',
@@ -210,6 +221,28 @@ class FieldDataCache(object):
         elif scope == Scope.user_info:
             return (scope, field_object.field_name)
 
+    def decoded_state(self, student_module):
+        """
+        Return the decoded `state` of student_module, one of the StudentModules in this
+        cache. The state is only parsed again if student_module.state is replaced.
+
+        The returned dict is shared: callers that change it must call `encode_state`
+        before saving student_module.
+        """
+        state, decoded = self._decoded_states.get(student_module.id, (None, None))
+        if state is not student_module.state:
+            decoded = json.loads(student_module.state)
+            self._decoded_states[student_module.id] = (student_module.state, decoded)
+        return decoded
+
+    def encode_state(self, student_module):
+        """
+        Serialize the decoded state of student_module (see `decoded_state`) into its `state`
+        """
+        decoded = self.decoded_state(student_module)
+        student_module.state = json.dumps(decoded)
+        self._decoded_states[student_module.id] = (student_module.state, decoded)
+
     def find(self, key):
         '''
         Look for a model data object using an DjangoKeyValueStore.Key object
@@ -241,7 +274,7 @@ class FieldDataCache(object):
             assert(isinstance(key.block_scope_id, Location))
             field_object, _ = StudentModule.objects.get_or_create(
                 course_id=self.course_id,
-                student=User.objects.get(id=key.user_id),
+                student=self.user,
                 module_state_key=key.block_scope_id,
                 defaults={
                     'state': json.dumps({}),
@@ -257,18 +290,80 @@ class FieldDataCache(object):
             field_object, _ = XModuleStudentPrefsField.objects.get_or_create(
                 field_name=key.field_name,
                 module_type=key.block_scope_id,
-                student=User.objects.get(id=key.user_id),
+                student=self.user,
             )
         elif key.scope == Scope.user_info:
             field_object, _ = XModuleStudentInfoField.objects.get_or_create(
                 field_name=key.field_name,
-                student=User.objects.get(id=key.user_id),
+                student=self.user,
             )
 
         cache_key = self._cache_key_from_kvs_key(key)
         self.cache[cache_key] = field_object
         return field_object
 
+    def create_missing_student_modules(self, descriptor_filter=lambda descriptor: True):
+        '''
+        Create the StudentModules that self.user doesn't have yet for the descriptors
+        in this cache that match descriptor_filter and store user state.  They are
+        created together, with a single query.
+
+        Rendering a page saves each block's state as the block is created, so
+        without this, each block on the page creates its own StudentModule.
+        '''
+        if not self.user.is_authenticated():
+            return
+
+        missing_locations = set(
+            descriptor.scope_ids.usage_id for descriptor in self.descriptors
+            if descriptor_filter(descriptor)
+            and any(field.scope == Scope.user_state for field in descriptor.fields.values())
+            and (Scope.user_state, descriptor.scope_ids.usage_id) not in self.cache
+        )
+        if missing_locations:
+            self._create_student_modules(missing_locations)
+
+    def _create_student_modules(self, locations):
+        """
+        Create StudentModules for self.user at each of locations, and add them to the cache.
+
+        If another request creates some of them first, the ones that exist are loaded,
+        and `find_or_create` creates the rest one at a time as they are written.
+        """
+        new_modules = [
+            StudentModule(
+                course_id=self.course_id,
+                student=self.user,
+                module_state_key=location,
+                state=json.dumps({}),
+                module_type=location.category,
+            )
+            for location in locations
+        ]
+        savepoint = transaction.savepoint()
+        try:
+            StudentModule.objects.bulk_create(new_modules)
+            transaction.savepoint_commit(savepoint)
+            created = True
+        except IntegrityError:
+            transaction.savepoint_rollback(savepoint)
+            created = False
+
+        # bulk_create doesn't set the new primary keys, so load the rows back
+        student_modules = self._chunked_query(
+            StudentModule,
+            'module_state_key__in',
+            locations,
+            course_id=self.course_id,
+            student=self.user.pk,
+        )
+        for student_module in student_modules:
+            self.cache[self._cache_key_from_field_object(Scope.user_state, student_module)] = student_module
+            if created:
+                # bulk_create doesn't send post_save either, and StudentModule history
+                # and grade counts depend on it
+                post_save.send(sender=StudentModule, instance=student_module, created=True, raw=False)
+
 
 class DjangoKeyValueStore(KeyValueStore):
     """
@@ -307,7 +402,8 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            return json.loads(field_object.state)[key.field_name]
+            # Hand out a copy, so that changes the caller makes to it are seen by set_many
+            return deepcopy(self._field_data_cache.decoded_state(field_object)[key.field_name])
         else:
             return json.loads(field_object.value)
 
@@ -328,6 +424,8 @@ class DjangoKeyValueStore(KeyValueStore):
         saved_fields = []
         # field_objects maps a field_object to a list of associated fields
         field_objects = dict()
+        # the field_objects whose values changed, and need to be saved
+        changed_objects = set()
         for field in kv_dict:
             # Check field for validity
             if field.scope not in self._allowed_scopes:
@@ -342,15 +440,27 @@ class DjangoKeyValueStore(KeyValueStore):
 
             # Special case when scope is for the user state, because this scope saves fields in a single row
             if field.scope == Scope.user_state:
-                state = json.loads(field_object.state)
-                state[field.field_name] = kv_dict[field]
-                field_object.state = json.dumps(state)
+                state = self._field_data_cache.decoded_state(field_object)
+                if field.field_name not in state or state[field.field_name] != kv_dict[field]:
+                    state[field.field_name] = deepcopy(kv_dict[field])
+                    changed_objects.add(field_object)
             else:
             # The remaining scopes save fields on different rows, so
             # we don't have to worry about conflicts
-                field_object.value = json.dumps(kv_dict[field])
+                value = json.dumps(kv_dict[field])
+                if value != field_object.value:
+                    field_object.value = value
+                    changed_objects.add(field_object)
 
         for field_object in field_objects:
+            if field_object not in changed_objects:
+                # Nothing to write: the stored values are already the ones being set
+                saved_fields.extend([field.field_name for field in field_objects[field_object]])
+                continue
+
+            if isinstance(field_object, StudentModule):
+                # Serialize the state once, after all of its fields have been set
+                self._field_data_cache.encode_state(field_object)
             try:
                 # Save the field object that we made above
                 field_object.save()
@@ -370,9 +480,9 @@ class DjangoKeyValueStore(KeyValueStore):
             raise KeyError(key.field_name)
 
         if key.scope == Scope.user_state:
-            state = json.loads(field_object.state)
+            state = self._field_data_cache.decoded_state(field_object)
             del state[key.field_name]
-            field_object.state = json.dumps(state)
+            self._field_data_cache.encode_state(field_object)
             field_object.save()
         else:
             field_object.delete()
@@ -386,6 +496,6 @@ class DjangoKeyValueStore(KeyValueStore):
             return False
 
         if key.scope == Scope.user_state:
-            return key.field_name in json.loads(field_object.state)
+            return key.field_name in self._field_data_cache.decoded_state(field_object)
         else:
             return True
@@ -12,14 +12,26 @@ file and check it in at the same time as your model changes. To do that,
 ASSUMPTIONS: modules have unique IDs, even across different module_types
 
 """
+import logging
+import random
+import threading
+
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.db import models
-from django.db.models.signals import post_save
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
+from track.backends.queued import QueuedBackend
 from xmodule_django.models import CourseKeyField, LocationKeyField
 
+log = logging.getLogger("edx.courseware")
+
+# The StudentModuleHistory entries saved during the current request, which are only
+# queued once StudentModuleHistoryMiddleware sees the request's transaction committed
+_deferred_history = threading.local()
+
 
 class StudentModule(models.Model):
     """
@@ -112,22 +124,344 @@ class StudentModuleHistory(models.Model):
     grade = models.FloatField(null=True, blank=True)
     max_grade = models.FloatField(null=True, blank=True)
 
+    # The queue that writes history entries when FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY']
+    # is set, created on first use
+    _queue = None
+    _queue_lock = threading.Lock()
+
+    @classmethod
+    def queue(cls):
+        """
+        Returns the QueuedBackend that writes history entries in batches.
+        """
+        with cls._queue_lock:
+            if cls._queue is None:
+                cls._queue = QueuedBackend(
+                    StudentModuleHistoryWriter(),
+                    name='student_module_history',
+                    **settings.STUDENT_MODULE_HISTORY_QUEUE
+                )
+        return cls._queue
+
+    @staticmethod
+    def history_values(student_module):
+        """
+        The values of student_module that are kept in its history.
+        """
+        return (student_module.state, student_module.grade, student_module.max_grade)
+
+    @receiver(post_init, sender=StudentModule)
+    def remember_history_values(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Remembers a StudentModule's values when loaded, to tell whether a save changes them.
+        """
+        instance.history_values = StudentModuleHistory.history_values(instance)
+
     @receiver(post_save, sender=StudentModule)
-    def save_history(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+    def save_history(sender, instance, created, **kwargs):  # pylint: disable=no-self-argument, unused-argument
         """
         Checks the instance's module_type, and creates & saves a
         StudentModuleHistory entry if the module_type is one that
         we save.
+
+        Saves that don't change the StudentModule are skipped if
+        STUDENT_MODULE_HISTORY_SKIP_UNCHANGED is set, and only a
+        STUDENT_MODULE_HISTORY_SAMPLE_RATE fraction of the others are kept.
+
+        With FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY'] set, the entries
+        saved during a request are held back until StudentModuleHistoryMiddleware
+        sees the request's transaction committed, and are then queued to be written
+        in batches. Entries saved outside of a request are saved right away.
         """
-        if instance.module_type in StudentModuleHistory.HISTORY_SAVING_TYPES:
-            history_entry = StudentModuleHistory(student_module=instance,
-                                                 version=None,
-                                                 created=instance.modified,
-                                                 state=instance.state,
-                                                 grade=instance.grade,
-                                                 max_grade=instance.max_grade)
+        history_values = StudentModuleHistory.history_values(instance)
+        unchanged = history_values == instance.history_values
+        instance.history_values = history_values
+
+        if instance.module_type not in StudentModuleHistory.HISTORY_SAVING_TYPES:
+            return
+        if not created:
+            if unchanged and settings.STUDENT_MODULE_HISTORY_SKIP_UNCHANGED:
+                return
+            if random.random() >= settings.STUDENT_MODULE_HISTORY_SAMPLE_RATE:
+                return
+
+        history_entry = StudentModuleHistory.entry_for(instance)
+        deferred_entries = getattr(_deferred_history, 'entries', None)
+        if settings.FEATURES.get('ENABLE_ASYNC_STUDENT_MODULE_HISTORY') and deferred_entries is not None:
+            deferred_entries.append(history_entry)
+        else:
             history_entry.save()
 
+    @staticmethod
+    def entry_for(student_module):
+        """
+        Returns a new (unsaved) history entry recording student_module as it is now.
+        """
+        return StudentModuleHistory(student_module=student_module,
+                                    version=None,
+                                    created=student_module.modified,
+                                    state=student_module.state,
+                                    grade=student_module.grade,
+                                    max_grade=student_module.max_grade)
+
+    @staticmethod
+    def defer_entries():
+        """
+        Starts holding back the history entries saved by this thread, until
+        queue_deferred_entries or discard_deferred_entries is called.
+        """
+        _deferred_history.entries = []
+
+    @classmethod
+    def queue_deferred_entries(cls):
+        """
+        Queues the history entries held back since defer_entries was called.
+        """
+        deferred_entries = getattr(_deferred_history, 'entries', None)
+        _deferred_history.entries = None
+        for history_entry in deferred_entries or []:
+            cls.queue().send(history_entry)
+
+    @staticmethod
+    def discard_deferred_entries():
+        """
+        Drops the history entries held back since defer_entries was called,
+        because the transaction that saved their StudentModules was rolled back.
+        """
+        _deferred_history.entries = None
+
+
+class StudentModuleHistoryWriter(object):
+    """
+    Writes the batches of StudentModuleHistory entries queued by StudentModuleHistory.save_history.
+    """
+    def send_batch(self, history_entries):
+        """
+        Write history_entries to the database with a single query.
+
+        If that fails, the entries are written one at a time, so that one bad
+        entry (e.g. for a StudentModule that has since been deleted) doesn't
+        lose the rest of the batch.
+        """
+        try:
+            StudentModuleHistory.objects.bulk_create(history_entries)
+        except Exception:  # pylint: disable=broad-except
+            transaction.rollback_unless_managed()
+            log.exception("Could not write a batch of %d StudentModuleHistory entries", len(history_entries))
+            for history_entry in history_entries:
+                try:
+                    history_entry.save()
+                except Exception:  # pylint: disable=broad-except
+                    transaction.rollback_unless_managed()
+                    log.exception(
+                        "Could not write the StudentModuleHistory entry for StudentModule %s",
+                        history_entry.student_module_id
+                    )
+
+
+class StudentModuleGradeCount(models.Model):
+    """
+    The number of StudentModules for a module with each (grade, max_grade), so that
+    grade histograms and dashboards don't have to scan the StudentModule table.
+
+    The counts are only kept up to date as StudentModules are saved and deleted while
+    FEATURES['ENABLE_GRADE_HISTOGRAM_TABLE'] is set; run the rebuild_grade_histograms
+    management command for a course to bring them up to date with its StudentModules.
+    """
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    module_state_key = LocationKeyField(max_length=255, db_index=True, db_column='module_id')
+    module_type = models.CharField(max_length=32, db_index=True)
+    grade = models.FloatField(null=True, blank=True)
+    max_grade = models.FloatField(null=True, blank=True)
+    count = models.IntegerField(default=0)
+
+    @classmethod
+    def add(cls, histogram_key, count):
+        """
+        Add count (which may be negative) to the number of StudentModules with the
+        (course_id, module_state_key, module_type, grade, max_grade) `histogram_key`.
+        """
+        course_id, module_state_key, module_type, grade, max_grade = histogram_key
+        counts = cls.objects.filter(
+            course_id=course_id,
+            module_state_key=module_state_key,
+            module_type=module_type,
+            grade=grade,
+            max_grade=max_grade,
+        )
+        # Readers add up the counts of each key, so racing to create a row is harmless
+        if not counts.update(count=F('count') + count):
+            cls.objects.create(
+                course_id=course_id,
+                module_state_key=module_state_key,
+                module_type=module_type,
+                grade=grade,
+                max_grade=max_grade,
+                count=count,
+            )
+
+    @classmethod
+    def rebuild(cls, course_id):
+        """
+        Recount the course's StudentModules.
+        """
+        cls.objects.filter(course_id=course_id).delete()
+        cls.objects.bulk_create(
+            cls(course_id=course_id, count=row.pop('count'), **row)
+            for row in StudentModule.objects.filter(course_id=course_id).values(
+                'module_state_key', 'module_type', 'grade', 'max_grade'
+            ).annotate(count=Count('id')).order_by()
+        )
+
+    @receiver(post_init, sender=StudentModule)
+    def remember_histogram_key(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Remembers which histogram a StudentModule was counted in when loaded.
+        """
+        instance.histogram_key = StudentModuleGradeCount.histogram_key(instance)
+
+    @receiver(post_save, sender=StudentModule)
+    def count_saved(sender, instance, created, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Moves a saved StudentModule to the histogram for its new grade.
+        """
+        histogram_key = StudentModuleGradeCount.histogram_key(instance)
+        if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+            if created:
+                StudentModuleGradeCount.add(histogram_key, 1)
+            elif histogram_key != instance.histogram_key:
+                StudentModuleGradeCount.add(instance.histogram_key, -1)
+                StudentModuleGradeCount.add(histogram_key, 1)
+        instance.histogram_key = histogram_key
+
+    @receiver(post_delete, sender=StudentModule)
+    def count_deleted(sender, instance, **kwargs):  # pylint: disable=no-self-argument, unused-argument
+        """
+        Removes a deleted StudentModule from its histogram.
+        """
+        if settings.FEATURES.get('ENABLE_GRADE_HISTOGRAM_TABLE'):
+            StudentModuleGradeCount.add(instance.histogram_key, -1)
+
+    @staticmethod
+    def histogram_key(student_module):
+        """
+        Returns the key of the histogram `student_module` is counted in.
+        """
+        return (
+            student_module.course_id,
+            student_module.module_state_key,
+            student_module.module_type,
+            student_module.grade,
+            student_module.max_grade,
+        )
+
+    def __repr__(self):
+        return 'StudentModuleGradeCount<%r>' % ({
+            'course_id': self.course_id,
+            'module_state_key': self.module_state_key,
+            'grade': self.grade,
+            'max_grade': self.max_grade,
+            'count': self.count,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
+
+class StudentSectionScore(models.Model):
+    """
+    Caches the raw problem scores a student earned in one graded section
+    (subsection) of a course, so that grading does not have to instantiate
+    every problem in sections that have not changed since they were last graded.
+
+    `fingerprint` summarizes everything the cached scores were computed from:
+    the graded content of the section and the grade columns of the student's
+    StudentModule rows for it. Saving or deleting one of those StudentModules
+    changes the fingerprint, which invalidates the row.
+    """
+
+    class Meta:
+        unique_together = (('student', 'course_id', 'section_key'),)
+
+    student = models.ForeignKey(User, db_index=True)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+
+    # The location of the section (sequential) these scores are for
+    section_key = LocationKeyField(max_length=255, db_index=True)
+
+    fingerprint = models.CharField(max_length=32)
+
+    # JSON list of [earned, possible, graded, display_name] Score tuples
+    scores = models.TextField(default='[]')
+
+    created = models.DateTimeField(auto_now_add=True, db_index=True)
+    modified = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __repr__(self):
+        return 'StudentSectionScore<%r>' % ({
+            'course_id': self.course_id,
+            'section_key': self.section_key,
+            'student': self.student.username,
+            'fingerprint': self.fingerprint,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
+
+class StudentModuleAnswers(models.Model):
+    """
+    The answers of one submitted problem StudentModule, as last counted into the
+    ProblemAnswerCount rows of its course.
+
+    Keeping them lets the answer distribution report take a StudentModule's old
+    answers back out of the counts when it changes or is deleted, without
+    having to decode the state of the StudentModules that haven't.
+    """
+    # Not a ForeignKey, so that the answers of deleted StudentModules stick around to be uncounted
+    student_module_id = models.IntegerField(unique=True)
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    module_state_key = LocationKeyField(max_length=255)
+
+    # JSON dict of problem part id -> unicode answer
+    answers = models.TextField(default='{}')
+
+    # The StudentModule's modified time when these answers were counted
+    modified = models.DateTimeField(db_index=True)
+
+    def __repr__(self):
+        return 'StudentModuleAnswers<%r>' % ({
+            'student_module_id': self.student_module_id,
+            'course_id': self.course_id,
+            'module_state_key': self.module_state_key,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
+
+class ProblemAnswerCount(models.Model):
+    """
+    The number of StudentModules in a course which gave an answer to a problem part,
+    kept up to date by the answer distribution report.
+    """
+    course_id = CourseKeyField(max_length=255, db_index=True)
+    module_state_key = LocationKeyField(max_length=255)
+    problem_part_id = models.CharField(max_length=255)
+    answer = models.TextField()
+    count = models.IntegerField(default=0)
+
+    def __repr__(self):
+        return 'ProblemAnswerCount<%r>' % ({
+            'course_id': self.course_id,
+            'module_state_key': self.module_state_key,
+            'problem_part_id': self.problem_part_id,
+            'count': self.count,
+        },)
+
+    def __unicode__(self):
+        return unicode(repr(self))
+
 
 class XModuleUserStateSummaryField(models.Model):
     """
@@ -17,12 +17,13 @@ from django.core.urlresolvers import reverse
 from django.http import Http404, HttpResponse
 from django.views.decorators.csrf import csrf_exempt
 
+from capa.safe_exec import LocalCache
 from capa.xqueue_interface import XQueueInterface
 from courseware.access import has_access, get_user_role
 from courseware.masquerade import setup_masquerade
 from courseware.model_data import FieldDataCache, DjangoKeyValueStore
 from lms.lib.xblock.field_data import LmsFieldData
-from lms.lib.xblock.runtime import LmsModuleSystem, unquote_slashes, quote_slashes
+from lms.lib.xblock.runtime import FragmentCache, LmsModuleSystem, unquote_slashes, quote_slashes
 from edxmako.shortcuts import render_to_string
 from eventtracking import tracker
 from psychometrics.psychoanalyze import make_psychometrics_data_update_handler
@@ -38,7 +39,7 @@ from xmodule.modulestore.locations import SlashSeparatedCourseKey
 from xmodule.modulestore.django import modulestore, ModuleI18nService
 from xmodule.modulestore.exceptions import ItemNotFoundError
 from xmodule.util.duedate import get_extended_due_date
-from xmodule_modifiers import replace_course_urls, replace_jump_to_id_urls, replace_static_urls, add_staff_markup, wrap_xblock
+from xmodule_modifiers import replace_urls, add_staff_markup, wrap_xblock
 from xmodule.lti_module import LTIModule
 from xmodule.x_module import XModuleDescriptor
 
@@ -60,6 +61,10 @@ XQUEUE_INTERFACE = XQueueInterface(
     REQUESTS_AUTH,
 )
 
+# The same problem code gets run over and over, so its results are kept in
+# memory in front of the shared cache.
+SAFE_EXEC_CACHE = LocalCache(cache, settings.SAFE_EXEC_LOCAL_CACHE_SIZE)
+
 # TODO: course_id and course_key are used interchangeably in this file, which is wrong.
 # Some brave person should make the variable names consistently someday, but the code's
 # coupled enough that it's kind of tricky--you've been warned!
@@ -321,25 +326,7 @@ def get_module_system_for_user(user, field_data_cache,
         )
 
         student_module = field_data_cache.find_or_create(key)
-        # Update the grades
-        student_module.grade = event.get('value')
-        student_module.max_grade = event.get('max_value')
-        # Save all changes to the underlying KeyValueStore
-        student_module.save()
-
-        # Bin score into range and increment stats
-        score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
-
-        tags = [
-            u"org:{}".format(course_id.org),
-            u"course:{}".format(course_id),
-            u"score_bucket:{0}".format(score_bucket)
-        ]
-
-        if grade_bucket_type is not None:
-            tags.append('type:%s' % grade_bucket_type)
-
-        dog_stats_api.increment("lms.courseware.question_answered", tags=tags)
+        save_grade(student_module, event, course_id, grade_bucket_type)
 
     def publish(block, event_type, event):
         """A function that allows XModules to publish events."""
@@ -408,32 +395,31 @@ def get_module_system_for_user(user, field_data_cache,
     # prefix is going to have to be specific to the module, not the directory
     # that the xml was loaded from
 
+    # In one pass:
     # Rewrite urls beginning in /static to point to course-specific content
-    block_wrappers.append(partial(
-        replace_static_urls,
-        getattr(descriptor, 'data_dir', None),
-        course_id=course_id,
-        static_asset_path=static_asset_path or descriptor.static_asset_path
-    ))
-
     # Allow URLs of the form '/course/' refer to the root of multicourse directory
     #   hierarchy of this course
-    block_wrappers.append(partial(replace_course_urls, course_id))
-
-    # this will rewrite intra-courseware links (/jump_to_id/<id>). This format
+    # And rewrite intra-courseware links (/jump_to_id/<id>). This format
     # is an improvement over the /course/... format for studio authored courses,
     # because it is agnostic to course-hierarchy.
     # NOTE: module_id is empty string here. The 'module_id' will get assigned in the replacement
     # function, we just need to specify something to get the reverse() to work.
     block_wrappers.append(partial(
-        replace_jump_to_id_urls,
+        replace_urls,
+        getattr(descriptor, 'data_dir', None),
         course_id,
         reverse('jump_to_id', kwargs={'course_id': course_id.to_deprecated_string(), 'module_id': ''}),
+        static_asset_path=static_asset_path or descriptor.static_asset_path
     ))
 
-    if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF'):
-        if has_access(user, 'staff', descriptor, course_id):
-            block_wrappers.append(partial(add_staff_markup, user))
+    # The staff markup shows this user's state, so fragments with it can't be shared
+    fragment_cache = None
+    if settings.FEATURES.get('DISPLAY_DEBUG_INFO_TO_STAFF') and has_access(user, 'staff', descriptor, course_id):
+        block_wrappers.append(partial(add_staff_markup, user))
+    elif settings.FEATURES.get('ENABLE_XBLOCK_FRAGMENT_CACHE'):
+        fragment_cache = FragmentCache(u'{}:{}'.format(
+            wrap_xmodule_display, static_asset_path or descriptor.static_asset_path
+        ))
 
     # These modules store data using the anonymous_student_id as a key.
     # To prevent loss of data, we will continue to provide old modules with
@@ -484,11 +470,12 @@ def get_module_system_for_user(user, field_data_cache,
         course_id=course_id,
         open_ended_grading_interface=open_ended_grading_interface,
         s3_interface=s3_interface,
-        cache=cache,
+        cache=SAFE_EXEC_CACHE,
         can_execute_unsafe_code=(lambda: can_execute_unsafe_code(course_id)),
         # TODO: When we merge the descriptor and module systems, we can stop reaching into the mixologist (cpennington)
         mixins=descriptor.runtime.mixologist._mixins,  # pylint: disable=protected-access
         wrappers=block_wrappers,
+        fragment_cache=fragment_cache,
         get_real_user=user_by_anonymous_id,
         services={
             'i18n': ModuleI18nService(),
@@ -736,6 +723,32 @@ def _invoke_xblock_handler(request, course_id, usage_id, handler, suffix, user):
     return webob_to_django_response(resp)
 
 
+def save_grade(student_module, event, course_id, grade_bucket_type=None):
+    """
+    Saves the grade of a 'grade' `event` published by a module to its `student_module`,
+    and counts the answer in the question_answered stats.
+    """
+    # Update the grades
+    student_module.grade = event.get('value')
+    student_module.max_grade = event.get('max_value')
+    # Save all changes to the underlying KeyValueStore
+    student_module.save()
+
+    # Bin score into range and increment stats
+    score_bucket = get_score_bucket(student_module.grade, student_module.max_grade)
+
+    tags = [
+        u"org:{}".format(course_id.org),
+        u"course:{}".format(course_id),
+        u"score_bucket:{0}".format(score_bucket)
+    ]
+
+    if grade_bucket_type is not None:
+        tags.append('type:%s' % grade_bucket_type)
+
+    dog_stats_api.increment("lms.courseware.question_answered", tags=tags)
+
+
 def get_score_bucket(grade, max_grade):
     """
     Function to split arbitrary score ranges into 3 buckets.
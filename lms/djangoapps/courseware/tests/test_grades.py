@@ -14,7 +14,7 @@ from xmodule.modulestore.locations import SlashSeparatedCourseKey
 from courseware.grades import grade, iterate_grades_for
 
 
-def _grade_with_errors(student, request, course, keep_raw_scores=False):
+def _grade_with_errors(student, request, course, keep_raw_scores=False, student_modules=None):
     """This fake grade method will throw exceptions for student3 and
     student4, but allow any other students to go through normal grading.
 
@@ -25,7 +25,7 @@ def _grade_with_errors(student, request, course, keep_raw_scores=False):
     if student.username in ['student3', 'student4']:
         raise Exception("I don't like {}".format(student.username))
 
-    return grade(student, request, course, keep_raw_scores=keep_raw_scores)
+    return grade(student, request, course, keep_raw_scores=keep_raw_scores, student_modules=student_modules)
 
 
 @override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
@@ -106,8 +106,18 @@ class TestGradeIteration(ModuleStoreTestCase):
         self.assertTrue(all_gradesets[student2])
         self.assertTrue(all_gradesets[student5])
 
+    def test_batched_grades_match(self):
+        """Grading students in batches should give the same gradesets as
+        grading them one at a time."""
+        gradesets, _ = self._gradesets_and_errors_for(self.course.id, self.students)
+        batched_gradesets, batched_errors = self._gradesets_and_errors_for(
+            self.course.id, self.students, batch_size=2
+        )
+        self.assertEqual(batched_errors, {})
+        self.assertEqual(batched_gradesets, gradesets)
+
     ################################# Helpers #################################
-    def _gradesets_and_errors_for(self, course_id, students):
+    def _gradesets_and_errors_for(self, course_id, students, batch_size=None):
         """Simple helper method to iterate through student grades and give us
         two dictionaries -- one that has all students and their respective
         gradesets, and one that has only students that could not be graded and
@@ -115,7 +125,7 @@ class TestGradeIteration(ModuleStoreTestCase):
         students_to_gradesets = {}
         students_to_errors = {}
 
-        for student, gradeset, err_msg in iterate_grades_for(course_id, students):
+        for student, gradeset, err_msg in iterate_grades_for(course_id, students, batch_size=batch_size):
             students_to_gradesets[student] = gradeset
             if err_msg:
                 students_to_errors[student] = err_msg
@@ -7,7 +7,7 @@ from functools import partial
 
 from courseware.model_data import DjangoKeyValueStore
 from courseware.model_data import InvalidScopeError, FieldDataCache
-from courseware.models import StudentModule
+from courseware.models import StudentModule, StudentModuleHistory
 from courseware.models import XModuleStudentInfoField, XModuleStudentPrefsField
 
 from student.tests.factories import UserFactory
@@ -126,6 +126,20 @@ class TestStudentModuleStorage(OtherUserFailureTestMixin, TestCase):
         self.assertEquals(1, StudentModule.objects.all().count())
         self.assertEquals({'b_field': 'b_value', 'a_field': 'a_value', 'not_a_field': 'new_value'}, json.loads(StudentModule.objects.all()[0].state))
 
+    def test_set_unchanged_field(self):
+        "Test that setting user_state fields to their current values doesn't save the StudentModule"
+        with patch('django.db.models.Model.save') as mock_save:
+            self.kvs.set_many({user_state_key('a_field'): 'a_value', user_state_key('b_field'): 'b_value'})
+        self.assertFalse(mock_save.called)
+
+    def test_set_changed_mutable_field(self):
+        "Test that changes made to a value returned by `get` are saved when it is set again"
+        self.kvs.set(user_state_key('a_field'), {'key': ['value']})
+        value = self.kvs.get(user_state_key('a_field'))
+        value['key'].append('other value')
+        self.kvs.set(user_state_key('a_field'), value)
+        self.assertEquals({'key': ['value', 'other value']}, json.loads(StudentModule.objects.all()[0].state)['a_field'])
+
     def test_delete_existing_field(self):
         "Test that deleting an existing field removes it from the StudentModule"
         self.kvs.delete(user_state_key('a_field'))
@@ -203,6 +217,58 @@ class TestMissingStudentModule(TestCase):
         self.assertEquals(location('usage_id').replace(run=None), student_module.module_state_key)
         self.assertEquals(course_id, student_module.course_id)
 
+    def test_set_many_in_missing_student_modules(self):
+        "Test that setting fields in several missing StudentModules creates all of them"
+        other_key = DjangoKeyValueStore.Key(Scope.user_state, 1, location('other_usage_id'), 'b_field')
+        self.kvs.set_many({user_state_key('a_field'): 'a_value', other_key: 'b_value'})
+
+        self.assertEquals(2, len(self.field_data_cache.cache))
+        # History is kept for the creation of each module, as well as for its update
+        self.assertEquals(4, StudentModuleHistory.objects.all().count())
+        self.assertEquals(
+            [{'a_field': 'a_value'}, {'b_field': 'b_value'}],
+            sorted(json.loads(student_module.state) for student_module in StudentModule.objects.all())
+        )
+
+    def test_set_many_in_concurrently_created_student_module(self):
+        "Test that setting fields in StudentModules that another request created first updates them"
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        other_key = DjangoKeyValueStore.Key(Scope.user_state, 1, location('other_usage_id'), 'b_field')
+        self.kvs.set_many({user_state_key('a_field'): 'a_value', other_key: 'b_value'})
+
+        self.assertEquals(2, StudentModule.objects.all().count())
+        self.assertEquals(
+            [{'a_field': 'a_value'}, {'b_field': 'b_value'}],
+            sorted(json.loads(student_module.state) for student_module in StudentModule.objects.all())
+        )
+
+    def test_create_missing_student_modules(self):
+        "Test that the missing StudentModules of the cached descriptors are created, and not the existing ones"
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        other_descriptor = mock_descriptor([mock_field(Scope.user_state, 'b_field')])
+        other_descriptor.scope_ids = ScopeIds('user1', 'mock_problem', location('def_id'), location('other_usage_id'))
+        field_data_cache = FieldDataCache(
+            [mock_descriptor([mock_field(Scope.user_state, 'a_field')]), other_descriptor], course_id, self.user
+        )
+        field_data_cache.create_missing_student_modules()
+
+        self.assertEquals(2, len(field_data_cache.cache))
+        self.assertEquals(
+            [{}, {'a_field': 'old_value'}],
+            sorted(json.loads(student_module.state) for student_module in StudentModule.objects.all())
+        )
+
+    def test_create_concurrently_created_student_modules(self):
+        "Test that StudentModules created by another request first are loaded instead"
+        field_data_cache = FieldDataCache(
+            [mock_descriptor([mock_field(Scope.user_state, 'a_field')])], course_id, self.user
+        )
+        StudentModuleFactory(student=self.user, state=json.dumps({'a_field': 'old_value'}))
+        field_data_cache.create_missing_student_modules()
+
+        self.assertEquals(1, StudentModule.objects.all().count())
+        self.assertEquals({'a_field': 'old_value'}, json.loads(field_data_cache.find(user_state_key('a_field')).state))
+
     def test_delete_field_from_missing_student_module(self):
         "Test that deleting a field from a missing StudentModule raises a KeyError"
         self.assertRaises(KeyError, self.kvs.delete, user_state_key('a_field'))
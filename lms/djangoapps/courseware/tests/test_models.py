@@ -0,0 +1,94 @@
+"""
+Tests for courseware.models
+"""
+import json
+
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from courseware.middleware import StudentModuleHistoryMiddleware
+from courseware.models import StudentModuleHistory, StudentModuleHistoryWriter
+from courseware.tests.factories import StudentModuleFactory, location
+
+
+class TestStudentModuleHistory(TestCase):
+    """Tests for recording StudentModuleHistory entries when problem StudentModules are saved"""
+
+    def setUp(self):
+        self.student_module = StudentModuleFactory(module_state_key=location('usage_id'), state=json.dumps({'seed': 1}))
+
+    def history_states(self):
+        """The states recorded for self.student_module, oldest first"""
+        return [
+            json.loads(history_entry.state)
+            for history_entry in StudentModuleHistory.objects.filter(student_module=self.student_module).order_by('id')
+        ]
+
+    def test_every_save_recorded(self):
+        self.student_module.save()
+        self.student_module.state = json.dumps({'seed': 2})
+        self.student_module.save()
+        self.assertEqual(self.history_states(), [{'seed': 1}, {'seed': 1}, {'seed': 2}])
+
+    @override_settings(STUDENT_MODULE_HISTORY_SKIP_UNCHANGED=True)
+    def test_skip_unchanged(self):
+        self.student_module.save()
+        self.student_module.state = json.dumps({'seed': 2})
+        self.student_module.save()
+        self.student_module.grade = 1
+        self.student_module.save()
+        self.assertEqual(self.history_states(), [{'seed': 1}, {'seed': 2}, {'seed': 2}])
+
+    @override_settings(STUDENT_MODULE_HISTORY_SAMPLE_RATE=0)
+    def test_sampling(self):
+        self.student_module.state = json.dumps({'seed': 2})
+        self.student_module.save()
+        # Creating a StudentModule is always recorded
+        self.assertEqual(self.history_states(), [{'seed': 1}])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': True})
+    def test_queued_after_request(self):
+        middleware = StudentModuleHistoryMiddleware()
+        with patch.object(StudentModuleHistory, 'queue') as mock_queue:
+            middleware.process_request(None)
+            self.student_module.state = json.dumps({'seed': 2})
+            self.student_module.save()
+            self.assertFalse(mock_queue.return_value.send.called)
+            middleware.process_response(None, None)
+
+        self.assertEqual(self.history_states(), [{'seed': 1}])
+        (history_entry,), _ = mock_queue.return_value.send.call_args
+        StudentModuleHistoryWriter().send_batch([history_entry])
+        self.assertEqual(self.history_states(), [{'seed': 1}, {'seed': 2}])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': True})
+    def test_not_queued_after_rollback(self):
+        middleware = StudentModuleHistoryMiddleware()
+        with patch.object(StudentModuleHistory, 'queue') as mock_queue:
+            middleware.process_request(None)
+            self.student_module.state = json.dumps({'seed': 2})
+            self.student_module.save()
+            middleware.process_exception(None, ValueError())
+            middleware.process_response(None, None)
+
+        self.assertFalse(mock_queue.return_value.send.called)
+        self.assertEqual(self.history_states(), [{'seed': 1}])
+
+    @patch.dict(settings.FEATURES, {'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': True})
+    def test_saved_outside_request(self):
+        with patch.object(StudentModuleHistory, 'queue') as mock_queue:
+            self.student_module.state = json.dumps({'seed': 2})
+            self.student_module.save()
+
+        self.assertFalse(mock_queue.return_value.send.called)
+        self.assertEqual(self.history_states(), [{'seed': 1}, {'seed': 2}])
+
+    def test_failed_batch_written_by_row(self):
+        self.student_module.state = json.dumps({'seed': 2})
+        good_entry = StudentModuleHistory.entry_for(self.student_module)
+        bad_entry = StudentModuleHistory.entry_for(self.student_module)
+        bad_entry.created = None
+        StudentModuleHistoryWriter().send_batch([bad_entry, good_entry])
+        self.assertEqual(self.history_states(), [{'seed': 1}, {'seed': 2}])
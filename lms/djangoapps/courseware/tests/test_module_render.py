@@ -768,6 +768,58 @@ class TestStaffDebugInfo(ModuleStoreTestCase):
             self.assertTrue(mock_grade_histogram.called)
 
 
+@override_settings(MODULESTORE=TEST_DATA_MIXED_MODULESTORE)
+@patch('courseware.module_render.has_access', Mock(return_value=True))
+class TestCreateMissingStudentModules(ModuleStoreTestCase):
+    """Tests creating the StudentModules for the problems of a section before rendering it."""
+
+    def setUp(self):
+        self.user = UserFactory.create()
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+        self.request.session = {}
+        self.course = CourseFactory.create()
+        self.section = ItemFactory.create(category='sequential', parent_location=self.course.location)
+        vertical = ItemFactory.create(category='vertical', parent_location=self.section.location)
+
+        problem_xml = OptionResponseXMLFactory().build_xml(
+            question_text='The correct answer is Correct',
+            num_inputs=1,
+            weight=1,
+            options=['Correct', 'Incorrect'],
+            correct_option='Correct'
+        )
+        self.problems = [
+            ItemFactory.create(category='problem', parent_location=vertical.location, data=problem_xml)
+            for _ in xrange(3)
+        ]
+        ItemFactory.create(category='html', parent_location=vertical.location, data='Some text')
+
+    def test_render_section(self):
+        section_descriptor = modulestore().get_item(self.section.location, depth=None)
+        field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
+            self.course.id, self.user, section_descriptor, depth=None)
+        field_data_cache.create_missing_student_modules(lambda descriptor: descriptor.has_score)
+        self.assertEqual(3, StudentModule.objects.filter(student=self.user).count())
+
+        # Each problem saves its seed when it's created, into the StudentModule created above
+        with patch.object(StudentModule.objects, 'get_or_create') as mock_get_or_create:
+            section_module = render.get_module_for_descriptor(
+                self.user,
+                self.request,
+                section_descriptor,
+                field_data_cache,
+                self.course.id,
+            )
+            section_module.render('student_view')
+        self.assertFalse(mock_get_or_create.called)
+
+        self.assertEqual(3, StudentModule.objects.filter(student=self.user).count())
+        for problem in self.problems:
+            student_module = StudentModule.objects.get(student=self.user, module_state_key=problem.location)
+            self.assertIn('seed', json.loads(student_module.state))
+
+
 PER_COURSE_ANONYMIZED_DESCRIPTORS = (LTIDescriptor, )
 
 PER_STUDENT_ANONYMIZED_DESCRIPTORS = [
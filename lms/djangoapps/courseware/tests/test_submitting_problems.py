@@ -17,7 +17,7 @@ from django.test.utils import override_settings
 
 # Need access to internal func to put users in the right group
 from courseware import grades
-from courseware.models import StudentModule
+from courseware.models import ProblemAnswerCount, StudentModule, StudentSectionScore
 
 from xmodule.modulestore.django import modulestore, editable_modulestore
 
@@ -479,6 +479,47 @@ class TestCourseGrader(TestSubmittingProblems):
         self.check_grade_percent(0.67)
         self.assertEqual(self.get_grade_summary()['grade'], 'B')
 
+    @patch.dict(settings.FEATURES, {'ENABLE_PERSISTENT_GRADE_CACHE': True})
+    def test_persistent_grade_cache(self):
+        """
+        Check that cached section scores are reused until the student's state
+        for that section changes.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.check_grade_percent(0.33)
+        self.assertEqual(StudentSectionScore.objects.filter(student=self.student_user).count(), 1)
+
+        # Nothing changed, so no problem needs to be scored again
+        with patch('courseware.grades.get_score') as mock_get_score:
+            self.check_grade_percent(0.33)
+        self.assertFalse(mock_get_score.called)
+
+        # A new submission invalidates the cached section
+        self.submit_question_answer('p2', {'2_1': 'Correct'})
+        self.check_grade_percent(0.67)
+
+        # Deleting state invalidates it as well
+        StudentModule.objects.get(
+            student=self.student_user, module_state_key=self.problem_location('p2')
+        ).delete()
+        self.check_grade_percent(0.33)
+
+    def test_batched_grading(self):
+        """
+        Check that grading with prefetched student state gives the same grade.
+        """
+        self.basic_setup()
+        self.submit_question_answer('p1', {'2_1': 'Correct'})
+        self.submit_question_answer('p2', {'2_1': 'Correct'})
+        self.submit_question_answer('p3', {'2_1': 'Incorrect'})
+
+        results = list(grades.iterate_grades_for(self.course.id, [self.student_user], batch_size=10))
+        self.assertEqual(len(results), 1)
+        _, gradeset, err_msg = results[0]
+        self.assertEqual(err_msg, "")
+        self.assertEqual(gradeset['percent'], 0.67)
+
     def test_submissions_api_overrides_scores(self):
         """
         Check that answering incorrectly is graded properly.
@@ -1051,3 +1092,30 @@ class TestAnswerDistributions(TestSubmittingProblems):
                     },
                 }
             )
+
+
+@patch.dict(settings.FEATURES, {'ENABLE_INCREMENTAL_ANSWER_DISTRIBUTION': True})
+class TestIncrementalAnswerDistributions(TestAnswerDistributions):
+    """Check answer distributions kept up to date in the ProblemAnswerCount table."""
+
+    def test_changed_and_deleted_answers(self):
+        self.submit_question_answer('p1', {'2_1': u'Incorrect'})
+        self.submit_question_answer('p2', {'2_1': u'Correct'})
+        grades.answer_distributions(self.course.id)
+
+        self.submit_question_answer('p1', {'2_1': u'Correct'})
+        StudentModule.objects.get(
+            course_id=self.course.id,
+            student=self.student_user,
+            module_state_key=self.problem_location('p2'),
+        ).delete()
+
+        self.assertEqual(
+            grades.answer_distributions(self.course.id),
+            {
+                ('p1', 'p1', 'i4x-MITx-100-problem-p1_2_1'): {
+                    'Correct': 1
+                },
+            }
+        )
+        self.assertEqual(ProblemAnswerCount.objects.filter(course_id=self.course.id).count(), 1)
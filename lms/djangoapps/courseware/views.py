@@ -327,6 +327,12 @@ def index(request, course_id, chapter=None, section=None,
             section_field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
                 course_key, user, section_descriptor, depth=None)
 
+            # Rendering the section saves the state of each of its problems as the problem
+            # is created, so create the StudentModules the student doesn't have yet together
+            section_field_data_cache.create_missing_student_modules(
+                lambda descriptor: descriptor.has_score and has_access(user, 'load', descriptor, course_key)
+            )
+
             section_module = get_module_for_descriptor(
                 request.user,
                 request,
@@ -765,16 +771,20 @@ def submission_history(request, course_id, student_username, location):
             username=student_username,
             location=location
         )))
+    # Entries can be written in batches, in a different order than they were saved
+    # (see FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY']), so order them by time
     history_entries = StudentModuleHistory.objects.filter(
         student_module=student_module
-    ).order_by('-id')
+    ).order_by('-created', '-id')
 
-    # If no history records exist, let's force a save to get history started.
+    # If no history records exist, record the current state to get history started.
+    # This is saved directly, since saving the StudentModule may not record it (see
+    # STUDENT_MODULE_HISTORY_SKIP_UNCHANGED and FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY']).
     if not history_entries:
-        student_module.save()
+        StudentModuleHistory.entry_for(student_module).save()
         history_entries = StudentModuleHistory.objects.filter(
             student_module=student_module
-        ).order_by('-id')
+        ).order_by('-created', '-id')
 
     context = {
         'history_entries': history_entries,
@@ -19,6 +19,7 @@ import csv
 import json
 import hashlib
 import os.path
+import tempfile
 import urllib
 
 from boto.s3.connection import S3Connection
@@ -193,21 +194,64 @@ class InstructorTask(models.Model):
 class ReportStore(object):
     """
     Simple abstraction layer that can fetch and store CSV files for reports
-    download. Should probably refactor later to create a ReportFile object that
-    can simply be appended to for the sake of memory efficiency, rather than
-    passing in the whole dataset. Doing that for now just because it's simpler.
+    download. Rows passed to `store_rows()` may come from any iterable, and are
+    written out as they are produced, so a report never has to be held in
+    memory all at once. Only complete files are ever visible in `links_for()`.
     """
+    # Intermediate files are kept under this directory of the configured
+    # ROOT_PATH, apart from any course's finished reports.
+    SCRATCH_DIR = "scratch"
+
     @classmethod
-    def from_config(cls):
+    def from_config(cls, scratch=False):
         """
         Return one of the ReportStore subclasses depending on django
         configuration. Look at subclasses for expected configuration.
+
+        If `scratch` is True, the store returned keeps its files apart from
+        the finished reports, so it can hold intermediate files (like the
+        shards of a report being generated in parallel) that should never be
+        offered for download.
         """
         storage_type = settings.GRADES_DOWNLOAD.get("STORAGE_TYPE")
         if storage_type.lower() == "s3":
-            return S3ReportStore.from_config()
+            return S3ReportStore.from_config(scratch)
         elif storage_type.lower() == "localfs":
-            return LocalFSReportStore.from_config()
+            return LocalFSReportStore.from_config(scratch)
+
+
+class MultipartUploadWriter(object):
+    """
+    Write-only file-like object that sends everything written to it to S3 as
+    the parts of a multipart upload, buffering at most one part in memory.
+    """
+    def __init__(self, multipart_upload, part_size):
+        self.multipart_upload = multipart_upload
+        self.part_size = part_size
+        self.part_num = 0
+        self.buffer = StringIO()
+
+    def write(self, data):
+        """Buffer `data`, uploading a part whenever enough has accumulated."""
+        self.buffer.write(data)
+        if self.buffer.tell() >= self.part_size:
+            self._upload_part()
+
+    def flush(self):
+        """Parts are only uploaded once they are big enough; see `close()`."""
+        pass
+
+    def close(self):
+        """Upload whatever is left as the last (possibly short) part."""
+        if self.buffer.tell() or self.part_num == 0:
+            self._upload_part()
+
+    def _upload_part(self):
+        """Upload the buffered data as the next part and start a new buffer."""
+        self.part_num += 1
+        self.buffer.seek(0)
+        self.multipart_upload.upload_part_from_file(self.buffer, self.part_num)
+        self.buffer = StringIO()
 
 
 class S3ReportStore(ReportStore):
@@ -222,6 +266,9 @@ class S3ReportStore(ReportStore):
     conventions on where files are stored to know what to display. Clients using
     this class can name the final file whatever they want.
     """
+    # S3 requires every part of a multipart upload but the last to be at least 5MB
+    PART_SIZE = 5 * 1024 * 1024
+
     def __init__(self, bucket_name, root_path):
         self.root_path = root_path
 
@@ -232,7 +279,7 @@ class S3ReportStore(ReportStore):
         self.bucket = conn.get_bucket(bucket_name)
 
     @classmethod
-    def from_config(cls):
+    def from_config(cls, scratch=False):
         """
         The expected configuration for an `S3ReportStore` is to have a
         `GRADES_DOWNLOAD` dict in settings with the following fields::
@@ -246,10 +293,10 @@ class S3ReportStore(ReportStore):
         Since S3 access relies on boto, you must also define `AWS_ACCESS_KEY_ID`
         and `AWS_SECRET_ACCESS_KEY` in settings.
         """
-        return cls(
-            settings.GRADES_DOWNLOAD['BUCKET'],
-            settings.GRADES_DOWNLOAD['ROOT_PATH']
-        )
+        root_path = settings.GRADES_DOWNLOAD['ROOT_PATH']
+        if scratch:
+            root_path = "{}/{}".format(root_path, cls.SCRATCH_DIR)
+        return cls(settings.GRADES_DOWNLOAD['BUCKET'], root_path)
 
     def key_for(self, course_id, filename):
         """Return the S3 key we would use to store and retrieve the data for the
@@ -297,19 +344,55 @@ class S3ReportStore(ReportStore):
 
     def store_rows(self, course_id, filename, rows):
         """
-        Given a `course_id`, `filename`, and `rows` (each row is an iterable of
-        strings), create a buffer that is a gzip'd csv file, and then `store()`
-        that buffer.
+        Given a `course_id`, `filename`, and `rows` (any iterable of rows, each
+        row an iterable of strings), write a gzip'd csv file to S3.
+
+        Rows are compressed and uploaded as the parts of a multipart upload
+        while `rows` is being consumed, so only one part is ever held in
+        memory. S3 doesn't show the file until the upload is completed, and
+        the upload is cancelled if `rows` raises, so partial files are never
+        visible in `links_for()`.
 
         Even though we store it in gzip format, browsers will transparently
         download and decompress it. Filenames should end in `.csv`, not `.gz`.
         """
-        output_buffer = StringIO()
-        gzip_file = GzipFile(fileobj=output_buffer, mode="wb")
-        csv.writer(gzip_file).writerows(rows)
-        gzip_file.close()
+        key = self.key_for(course_id, filename)
+        multipart_upload = self.bucket.initiate_multipart_upload(
+            key.key,
+            headers={
+                "Content-Encoding": "gzip",
+                "Content-Type": "text/csv",
+            }
+        )
+
+        try:
+            upload_writer = MultipartUploadWriter(multipart_upload, self.PART_SIZE)
+            gzip_file = GzipFile(fileobj=upload_writer, mode="wb")
+            csv.writer(gzip_file).writerows(rows)
+            gzip_file.close()
+            upload_writer.close()
+        except Exception:
+            multipart_upload.cancel_upload()
+            raise
+
+        multipart_upload.complete_upload()
+
+    def read_rows(self, course_id, filename):
+        """
+        Yield the rows of a file previously written with `store_rows()`.
+        """
+        key = self.key_for(course_id, filename)
+        with tempfile.TemporaryFile() as temp_file:
+            key.get_contents_to_file(temp_file)
+            temp_file.seek(0)
+            for row in csv.reader(GzipFile(fileobj=temp_file, mode="rb")):
+                yield row
 
-        self.store(course_id, filename, output_buffer)
+    def delete(self, course_id, filename):
+        """
+        Delete the file named `filename` for `course_id`.
+        """
+        self.key_for(course_id, filename).delete()
 
     def links_for(self, course_id):
         """
@@ -346,7 +429,7 @@ class LocalFSReportStore(ReportStore):
             os.makedirs(root_path)
 
     @classmethod
-    def from_config(cls):
+    def from_config(cls, scratch=False):
         """
         Generate an instance of this object from Django settings. It assumes
         that there is a dict in settings named GRADES_DOWNLOAD and that it has
@@ -357,7 +440,10 @@ class LocalFSReportStore(ReportStore):
             STORAGE_TYPE : "localfs"
             ROOT_PATH : /tmp/edx/report-downloads/
         """
-        return cls(settings.GRADES_DOWNLOAD['ROOT_PATH'])
+        root_path = settings.GRADES_DOWNLOAD['ROOT_PATH']
+        if scratch:
+            root_path = os.path.join(root_path, cls.SCRATCH_DIR)
+        return cls(root_path)
 
     def path_to(self, course_id, filename):
         """Return the full path to a given file for a given course."""
@@ -373,19 +459,48 @@ class LocalFSReportStore(ReportStore):
         full_path = self.path_to(course_id, filename)
         directory = os.path.dirname(full_path)
         if not os.path.exists(directory):
-            os.mkdir(directory)
+            os.makedirs(directory)
 
         with open(full_path, "wb") as f:
             f.write(buff.getvalue())
 
     def store_rows(self, course_id, filename, rows):
         """
-        Given a course_id, filename, and rows (each row is an iterable of strings),
-        write this data out.
+        Given a course_id, filename, and rows (any iterable of rows, each row an
+        iterable of strings), write this data out.
+
+        Rows are written to a temporary file as they are produced, and the file
+        is only renamed into the course directory once it is complete.
+        """
+        full_path = self.path_to(course_id, filename)
+        directory = os.path.dirname(full_path)
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        # The temporary file lives outside of any course directory, so
+        # links_for() can never see it.
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.root_path)
+        try:
+            with os.fdopen(file_descriptor, "wb") as temp_file:
+                csv.writer(temp_file).writerows(rows)
+            os.rename(temp_path, full_path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def read_rows(self, course_id, filename):
+        """
+        Yield the rows of a file previously written with `store_rows()`.
+        """
+        with open(self.path_to(course_id, filename), "rb") as f:
+            for row in csv.reader(f):
+                yield row
+
+    def delete(self, course_id, filename):
+        """
+        Delete the file named `filename` for `course_id`.
         """
-        output_buffer = StringIO()
-        csv.writer(output_buffer).writerows(rows)
-        self.store(course_id, filename, output_buffer)
+        os.remove(self.path_to(course_id, filename))
 
     def links_for(self, course_id):
         """
@@ -31,6 +31,7 @@ from instructor_task.tasks_helper import (
     reset_attempts_module_state,
     delete_problem_module_state,
     push_grades_to_s3,
+    push_grade_report_shard,
 )
 from bulk_email.tasks import perform_delegate_email_batches
 
@@ -56,7 +57,8 @@ def rescore_problem(entry_id, xmodule_instance_args):
     """
     # Translators: This is a past-tense verb that is inserted into task progress messages as {action}.
     action_name = ugettext_noop('rescored')
-    update_fcn = partial(rescore_problem_module_state, xmodule_instance_args)
+    # Problem instances are shared between the students being rescored
+    update_fcn = partial(rescore_problem_module_state, xmodule_instance_args, problem_instances={})
 
     def filter_fcn(modules_to_update):
         """Filter that matches problems which are marked as being done"""
@@ -139,3 +141,14 @@ def calculate_grades_csv(entry_id, xmodule_instance_args):
     action_name = ugettext_noop('graded')
     task_fn = partial(push_grades_to_s3, xmodule_instance_args)
     return run_main_task(entry_id, task_fn, action_name)
+
+
+@task(routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY)  # pylint: disable=E1102
+def calculate_grades_csv_shard(entry_id, report_name, to_list, subtask_status_dict):
+    """
+    Grade a share of a course's students as part of a `calculate_grades_csv` task.
+
+    Queued by `calculate_grades_csv` for courses with many students. Progress
+    is recorded in the subtask status of the InstructorTask `entry_id`.
+    """
+    return push_grade_report_shard(entry_id, report_name, to_list, subtask_status_dict)
@@ -4,13 +4,16 @@ running state of a course.
 
 """
 import json
+import traceback
 import urllib
 from datetime import datetime
 from time import time
 
 from celery import Task, current_task
 from celery.utils.log import get_task_logger
-from celery.states import SUCCESS, FAILURE
+from celery.states import SUCCESS, FAILURE, READY_STATES
+from django.conf import settings
+from django.core.cache import cache
 from django.contrib.auth.models import User
 from django.db import transaction, reset_queries
 from dogapi import dog_stats_api
@@ -19,11 +22,19 @@ from pytz import UTC
 from xmodule.modulestore.django import modulestore
 from track.views import task_track
 
+from courseware.access import has_access
 from courseware.grades import iterate_grades_for
 from courseware.models import StudentModule
 from courseware.model_data import FieldDataCache
-from courseware.module_render import get_module_for_descriptor_internal
+from courseware.module_render import get_module_for_descriptor_internal, save_grade
 from instructor_task.models import ReportStore, InstructorTask, PROGRESS
+from instructor_task.subtasks import (
+    SUBTASK_LOCK_EXPIRE,
+    SubtaskStatus,
+    check_subtask_is_valid,
+    queue_subtasks_for_query,
+    update_subtask_status,
+)
 from student.models import CourseEnrollment
 
 # define different loggers for use within tasks and on client side
@@ -37,6 +48,9 @@ UPDATE_STATUS_SUCCEEDED = 'succeeded'
 UPDATE_STATUS_FAILED = 'failed'
 UPDATE_STATUS_SKIPPED = 'skipped'
 
+# minimum number of seconds between progress updates of a running task
+PROGRESS_UPDATE_INTERVAL = 1.0
+
 
 class BaseInstructorTask(Task):
     """
@@ -123,6 +137,13 @@ class BaseInstructorTask(Task):
             entry.save_now()
 
 
+class GradeReportError(Exception):
+    """
+    Error signaling that a grade report graded by subtasks couldn't be put together.
+    """
+    pass
+
+
 class UpdateProblemModuleStateError(Exception):
     """
     Error signaling a fatal condition while updating problem modules.
@@ -269,6 +290,7 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
 
     if filter_fcn is not None:
         modules_to_update = filter_fcn(modules_to_update)
+    modules_to_update = modules_to_update.select_related('student')
 
     # perform the main loop
     num_attempted = 0
@@ -292,7 +314,8 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
 
     task_progress = get_task_progress()
     _get_current_task().update_state(state=PROGRESS, meta=task_progress)
-    for module_to_update in modules_to_update:
+    last_update_time = time()
+    for module_to_update in modules_to_update.iterator():
         num_attempted += 1
         # There is no try here:  if there's an error, we let it throw, and the task will
         # be marked as FAILED, with a stack trace.
@@ -309,10 +332,14 @@ def perform_module_state_update(update_fcn, filter_fcn, _entry_id, course_id, ta
             else:
                 raise UpdateProblemModuleStateError("Unexpected update_status returned: {}".format(update_status))
 
-        # update task status:
-        task_progress = get_task_progress()
-        _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+        # update task status, but not so often that it slows the task down:
+        if time() - last_update_time >= PROGRESS_UPDATE_INTERVAL:
+            task_progress = get_task_progress()
+            _get_current_task().update_state(state=PROGRESS, meta=task_progress)
+            last_update_time = time()
 
+    task_progress = get_task_progress()
+    _get_current_task().update_state(state=PROGRESS, meta=task_progress)
     return task_progress
 
 
@@ -343,16 +370,21 @@ def _get_track_function_for_task(student, xmodule_instance_args=None, source_pag
 
 
 def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args=None,
-                                  grade_bucket_type=None):
+                                  grade_bucket_type=None, student_modules=None):
     """
     Fetches a StudentModule instance for a given `course_id`, `student` object, and `module_descriptor`.
 
     `xmodule_instance_args` is used to provide information for creating a track function and an XQueue callback.
     These are passed, along with `grade_bucket_type`, to get_module_for_descriptor_internal, which sidesteps
     the need for a Request object when instantiating an xmodule instance.
+
+    If `student_modules` is given, it is used as the student's state for the module instead
+    of being read from the database.
     """
     # reconstitute the problem's corresponding XModule:
-    field_data_cache = FieldDataCache.cache_for_descriptor_descendents(course_id, student, module_descriptor)
+    field_data_cache = FieldDataCache.cache_for_descriptor_descendents(
+        course_id, student, module_descriptor, student_modules=student_modules
+    )
 
     # get request-related tracking information from args passthrough, and supplement with task-specific
     # information:
@@ -377,12 +409,59 @@ def _get_module_instance_for_task(course_id, student, module_descriptor, xmodule
                                               grade_bucket_type=grade_bucket_type)
 
 
+def _can_share_problem_instance(instance):
+    """
+    Returns True if the problem `instance` built for one student can be used to
+    rescore other students' answers (see `rescore_problem_module_state`).
+    """
+    return (
+        hasattr(instance, 'rescore_state') and
+        # Problems can use the student's anonymous id in their scripts (including
+        # the ones they include from other files), and psychometrics are recorded
+        # for the student the module was built for.
+        'anonymous_student_id' not in instance.lcp.context['script_code'] and
+        not hasattr(instance.runtime, 'psychometrics_handler')
+    )
+
+
+def _rescore_shared_problem_instance(instance, xmodule_instance_args, module_descriptor, student_module):
+    """
+    Rescores `student_module` using the problem `instance` that was built for
+    another student, saving the student's new problem state and grade the way
+    a grade published by the problem itself is saved.
+
+    Returns the result of the rescore, like `rescore_problem()` does, or None
+    if the student doesn't have access to the problem.
+    """
+    student = student_module.student
+    course_id = student_module.course_id
+    if not has_access(student, 'load', module_descriptor, course_id):
+        return None
+
+    state = json.loads(student_module.state)
+    track_function = _get_track_function_for_task(student, xmodule_instance_args)
+    result, problem_state, score = instance.rescore_state(state, track_function)
+    if result['success'] in ('correct', 'incorrect'):
+        state.update(problem_state)
+        student_module.state = json.dumps(state)
+        save_grade(student_module, {'value': score['score'], 'max_value': score['total']}, course_id,
+                   grade_bucket_type='rescore')
+    return result
+
+
 @transaction.autocommit
-def rescore_problem_module_state(xmodule_instance_args, module_descriptor, student_module):
+def rescore_problem_module_state(xmodule_instance_args, module_descriptor, student_module, problem_instances=None):
     '''
     Takes an XModule descriptor and a corresponding StudentModule object, and
     performs rescoring on the student's problem submission.
 
+    If a `problem_instances` dict is passed in, it is used to share the work of
+    building the problem between calls: the problem instance built for a student
+    is kept, keyed by its random seed, and the answers of later students with the
+    same seed are rescored by loading their state into it. This saves parsing and
+    processing the problem again for every student, which is most of the cost of
+    rescoring a problem for a whole course.
+
     Throws exceptions if the rescoring is fatal and should be aborted if in a loop.
     In particular, raises UpdateProblemModuleStateError if module fails to instantiate,
     or if the module doesn't support rescoring.
@@ -394,9 +473,29 @@ def rescore_problem_module_state(xmodule_instance_args, module_descriptor, stude
     course_id = student_module.course_id
     student = student_module.student
     usage_key = student_module.module_state_key
-    instance = _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args, grade_bucket_type='rescore')
 
-    if instance is None:
+    seed = json.loads(student_module.state).get('seed') if student_module.state else None
+    shared_instance = problem_instances.get(seed) if problem_instances is not None else None
+    if shared_instance is not None:
+        result = _rescore_shared_problem_instance(shared_instance, xmodule_instance_args, module_descriptor, student_module)
+    else:
+        # Reuse the StudentModule we already have, rather than querying for it again
+        instance = _get_module_instance_for_task(course_id, student, module_descriptor, xmodule_instance_args,
+                                                 grade_bucket_type='rescore', student_modules=[student_module])
+        if instance is not None and not hasattr(instance, 'rescore_problem'):
+            # This should also not happen, since it should be already checked in the caller,
+            # but check here to be sure.
+            msg = "Specified problem does not support rescoring."
+            raise UpdateProblemModuleStateError(msg)
+        if instance is not None:
+            result = instance.rescore_problem()
+            instance.save()
+            if problem_instances is not None and _can_share_problem_instance(instance):
+                problem_instances[instance.seed] = instance
+        else:
+            result = None
+
+    if result is None:
         # Either permissions just changed, or someone is trying to be clever
         # and load something they shouldn't have access to.
         msg = "No module {loc} for student {student}--access denied?".format(loc=usage_key,
@@ -404,14 +503,6 @@ def rescore_problem_module_state(xmodule_instance_args, module_descriptor, stude
         TASK_LOG.debug(msg)
         raise UpdateProblemModuleStateError(msg)
 
-    if not hasattr(instance, 'rescore_problem'):
-        # This should also not happen, since it should be already checked in the caller,
-        # but check here to be sure.
-        msg = "Specified problem does not support rescoring."
-        raise UpdateProblemModuleStateError(msg)
-
-    result = instance.rescore_problem()
-    instance.save()
     if 'success' not in result:
         # don't consider these fatal, but false means that the individual call didn't complete:
         TASK_LOG.warning(u"error processing rescore call for course {course}, problem {loc} and student {student}: "
@@ -469,62 +560,31 @@ def delete_problem_module_state(xmodule_instance_args, _module_descriptor, stude
     return UPDATE_STATUS_SUCCEEDED
 
 
-def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input, action_name):
+def _grade_report_rows(course_id, students, counts, err_rows, update_task_progress=None):
     """
-    For a given `course_id`, generate a grades CSV file for all students that
-    are enrolled, and store using a `ReportStore`. Once created, the files can
-    be accessed by instantiating another `ReportStore` (via
-    `ReportStore.from_config()`) and calling `link_for()` on it. Writes are
-    buffered, so we'll never write part of a CSV file to S3 -- i.e. any files
-    that are visible in ReportStore will be complete ones.
+    Grade each of `students` in turn, yielding the rows of their grade report.
 
-    As we start to add more CSV downloads, it will probably be worthwhile to
-    make a more general CSVDoc class instead of building out the rows like we
-    do here.
+    The first row yielded is the header. `counts` is a dict whose 'attempted',
+    'succeeded' and 'failed' values are updated as students are graded, and a
+    row for each student that couldn't be graded is appended to `err_rows`.
+    If provided, `update_task_progress` is called periodically while grading.
     """
-    start_time = datetime.now(UTC)
     status_interval = 100
-
-    enrolled_students = CourseEnrollment.users_enrolled_in(course_id)
-    num_total = enrolled_students.count()
-    num_attempted = 0
-    num_succeeded = 0
-    num_failed = 0
-    curr_step = "Calculating Grades"
-
-    def update_task_progress():
-        """Return a dict containing info about current task"""
-        current_time = datetime.now(UTC)
-        progress = {
-            'action_name': action_name,
-            'attempted': num_attempted,
-            'succeeded': num_succeeded,
-            'failed': num_failed,
-            'total': num_total,
-            'duration_ms': int((current_time - start_time).total_seconds() * 1000),
-            'step': curr_step,
-        }
-        _get_current_task().update_state(state=PROGRESS, meta=progress)
-
-        return progress
-
-    # Loop over all our students and build our CSV lists in memory
     header = None
-    rows = []
-    err_rows = [["id", "username", "error_msg"]]
-    for student, gradeset, err_msg in iterate_grades_for(course_id, enrolled_students):
+    batch_size = settings.GRADES_DOWNLOAD_BATCH_SIZE
+    for student, gradeset, err_msg in iterate_grades_for(course_id, students, batch_size=batch_size):
         # Periodically update task status (this is a cache write)
-        if num_attempted % status_interval == 0:
+        if update_task_progress is not None and counts['attempted'] % status_interval == 0:
             update_task_progress()
-        num_attempted += 1
+        counts['attempted'] += 1
 
         if gradeset:
             # We were able to successfully grade this student for this course.
-            num_succeeded += 1
+            counts['succeeded'] += 1
             if not header:
                 # Encode the header row in utf-8 encoding in case there are unicode characters
                 header = [section['label'].encode('utf-8') for section in gradeset[u'section_breakdown']]
-                rows.append(["id", "email", "username", "grade"] + header)
+                yield ["id", "email", "username", "grade"] + header
 
             percents = {
                 section['label']: section.get('percent', 0.0)
@@ -539,35 +599,279 @@ def push_grades_to_s3(_xmodule_instance_args, _entry_id, course_id, _task_input,
             # possible for a student to have a 0.0 show up in their row but
             # still have 100% for the course.
             row_percents = [percents.get(label, 0.0) for label in header]
-            rows.append([student.id, student.email, student.username, gradeset['percent']] + row_percents)
+            yield [student.id, student.email, student.username, gradeset['percent']] + row_percents
         else:
             # An empty gradeset means we failed to grade a student.
-            num_failed += 1
+            counts['failed'] += 1
             err_rows.append([student.id, student.username, err_msg])
 
-    # By this point, we've got the rows we're going to stuff into our CSV files.
-    curr_step = "Uploading CSVs"
-    update_task_progress()
 
-    # Generate parts of the file name
+def _grade_report_name(course_id, start_time):
+    """
+    Return the base name (without extension) of the grade report for
+    `course_id` that was started at `start_time`.
+    """
     timestamp_str = start_time.strftime("%Y-%m-%d-%H%M")
     course_id_prefix = urllib.quote(course_id.to_deprecated_string().replace("/", "_"))
+    return u"{}_grade_report_{}".format(course_id_prefix, timestamp_str)
+
 
-    # Perform the actual upload
+def push_grades_to_s3(_xmodule_instance_args, entry_id, course_id, _task_input, action_name):
+    """
+    For a given `course_id`, generate a grades CSV file for all students that
+    are enrolled, and store using a `ReportStore`. Once created, the files can
+    be accessed by instantiating another `ReportStore` (via
+    `ReportStore.from_config()`) and calling `link_for()` on it.
+
+    Rows are handed to the `ReportStore` as students are graded, so the report
+    is written out while grading is still in progress and never has to be held
+    in memory. The `ReportStore` only makes files visible once they are
+    complete, so we'll never show part of a CSV file.
+
+    Courses with more than `settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK`
+    enrolled students are instead graded in parallel: the students are split
+    among `calculate_grades_csv_shard` subtasks, each of which writes its part
+    of the report to scratch storage, and the last of them to finish merges
+    the parts into the final report. In that case this task only queues the
+    subtasks, and its progress is tracked through the InstructorTask's
+    subtask status.
+
+    As we start to add more CSV downloads, it will probably be worthwhile to
+    make a more general CSVDoc class instead of building out the rows like we
+    do here.
+    """
+    start_time = datetime.now(UTC)
+    report_name = _grade_report_name(course_id, start_time)
+
+    enrolled_students = CourseEnrollment.users_enrolled_in(course_id)
+    total_num_students = enrolled_students.count()
+    if total_num_students > settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK:
+        return _delegate_grade_report_shards(entry_id, enrolled_students, report_name, action_name)
+
+    # Counts are kept in a dict so that the row generator can update them
+    counts = {
+        'total': total_num_students,
+        'attempted': 0,
+        'succeeded': 0,
+        'failed': 0,
+        'step': "Calculating Grades",
+    }
+
+    def update_task_progress():
+        """Return a dict containing info about current task"""
+        current_time = datetime.now(UTC)
+        progress = {
+            'action_name': action_name,
+            'attempted': counts['attempted'],
+            'succeeded': counts['succeeded'],
+            'failed': counts['failed'],
+            'total': counts['total'],
+            'duration_ms': int((current_time - start_time).total_seconds() * 1000),
+            'step': counts['step'],
+        }
+        _get_current_task().update_state(state=PROGRESS, meta=progress)
+
+        return progress
+
+    # Students that couldn't be graded are rare, so their rows are collected
+    # in memory and written out at the end.
+    err_rows = [["id", "username", "error_msg"]]
+
+    # Grade students and write out their rows as we go
     report_store = ReportStore.from_config()
     report_store.store_rows(
         course_id,
-        u"{}_grade_report_{}.csv".format(course_id_prefix, timestamp_str),
-        rows
+        u"{}.csv".format(report_name),
+        _grade_report_rows(course_id, enrolled_students, counts, err_rows, update_task_progress)
     )
 
+    # By this point the grade report is stored, and all we have left are the errors.
+    counts['step'] = "Uploading CSVs"
+    update_task_progress()
+
     # If there are any error rows (don't count the header), write them out as well
     if len(err_rows) > 1:
-        report_store.store_rows(
-            course_id,
-            u"{}_grade_report_{}_err.csv".format(course_id_prefix, timestamp_str),
-            err_rows
-        )
+        report_store.store_rows(course_id, u"{}_err.csv".format(report_name), err_rows)
 
     # One last update before we close out...
     return update_task_progress()
+
+
+def _grade_report_shard_prefixes(entry_id, report_name):
+    """
+    Return the filename prefixes of the grade and error shards written for
+    the InstructorTask `entry_id`.
+    """
+    return (
+        u"{}_{}_shard_".format(report_name, entry_id),
+        u"{}_{}_err_shard_".format(report_name, entry_id),
+    )
+
+
+def _delegate_grade_report_shards(entry_id, enrolled_students, report_name, action_name):
+    """
+    Queue `calculate_grades_csv_shard` subtasks that each grade a share of
+    `enrolled_students`. Returns the task progress of the InstructorTask.
+    """
+    # Imported here to avoid a circular import: the subtask is a Celery task
+    # that in turn uses the helpers in this module.
+    from instructor_task.tasks import calculate_grades_csv_shard
+
+    entry = InstructorTask.objects.get(pk=entry_id)
+
+    def _create_grades_shard_subtask(to_list, initial_subtask_status):
+        """Creates a subtask to grade a given list of students."""
+        return calculate_grades_csv_shard.subtask(
+            (
+                entry_id,
+                report_name,
+                to_list,
+                initial_subtask_status.to_dict(),
+            ),
+            task_id=initial_subtask_status.task_id,
+            routing_key=settings.GRADES_DOWNLOAD_ROUTING_KEY,
+        )
+
+    TASK_LOG.info(u"Task %s: Preparing to queue subtasks for grade report %s", entry.task_id, report_name)
+    return queue_subtasks_for_query(
+        entry,
+        action_name,
+        _create_grades_shard_subtask,
+        enrolled_students,
+        [],
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_QUERY,
+        settings.GRADES_DOWNLOAD_STUDENTS_PER_TASK,
+    )
+
+
+def push_grade_report_shard(entry_id, report_name, to_list, subtask_status_dict):
+    """
+    Grade the students in `to_list` (dicts containing each student's 'pk'),
+    and store their rows of the grade report named `report_name` in scratch
+    storage. Once every subtask of the InstructorTask `entry_id` is done, the
+    shards are merged into the final report.
+
+    Returns the subtask's final status, as a dict.
+    """
+    subtask_status = SubtaskStatus.from_dict(subtask_status_dict)
+    current_task_id = subtask_status.task_id
+
+    # Make sure this subtask still belongs to the entry and hasn't already
+    # been run, e.g. because the parent task was requeued.
+    check_subtask_is_valid(entry_id, current_task_id, subtask_status)
+
+    course_id = InstructorTask.objects.get(pk=entry_id).course_id
+    shard_prefix, err_shard_prefix = _grade_report_shard_prefixes(entry_id, report_name)
+    # Shards are named after their first student's id, so that sorting the
+    # names puts the merged rows in student order.
+    first_pk = to_list[0]['pk']
+
+    try:
+        students = User.objects.filter(pk__in=[item['pk'] for item in to_list]).order_by('pk')
+        counts = {'attempted': 0, 'succeeded': 0, 'failed': 0}
+        err_rows = [["id", "username", "error_msg"]]
+        scratch_store = ReportStore.from_config(scratch=True)
+        scratch_store.store_rows(
+            course_id,
+            u"{}{:010d}.csv".format(shard_prefix, first_pk),
+            _grade_report_rows(course_id, students, counts, err_rows)
+        )
+        if len(err_rows) > 1:
+            scratch_store.store_rows(course_id, u"{}{:010d}.csv".format(err_shard_prefix, first_pk), err_rows)
+    except Exception:
+        # Since we don't know how far grading got, count all students in
+        # this shard as having failed.
+        TASK_LOG.exception(u"Grade report subtask %s for %s failed unexpectedly!", current_task_id, report_name)
+        subtask_status.increment(failed=len(to_list), state=FAILURE)
+        update_subtask_status(entry_id, current_task_id, subtask_status, complete_parent=False)
+        _merge_grade_report_shards(entry_id, course_id, report_name)
+        raise
+
+    # The InstructorTask is only marked as done once the shards are merged
+    subtask_status.increment(succeeded=counts['succeeded'], failed=counts['failed'], state=SUCCESS)
+    update_subtask_status(entry_id, current_task_id, subtask_status, complete_parent=False)
+    _merge_grade_report_shards(entry_id, course_id, report_name)
+    return subtask_status.to_dict()
+
+
+def _merge_grade_report_shards(entry_id, course_id, report_name):
+    """
+    If all of the subtasks of the InstructorTask `entry_id` are done, combine
+    their shards into the final grade report and error report, delete the
+    shards, and mark the InstructorTask as done: SUCCESS if the report was
+    stored, or FAILURE if a subtask failed or the shards couldn't be merged.
+
+    Every subtask calls this when it finishes, and a cache lock makes sure
+    only one of them does the merging. Several of them can see all of the
+    subtasks done, so once one of them has the lock, the others find the
+    InstructorTask already done and leave the stored report alone.
+    """
+    subtask_dict = json.loads(InstructorTask.objects.get(pk=entry_id).subtasks)
+    if subtask_dict['succeeded'] + subtask_dict['failed'] < subtask_dict['total']:
+        # Other subtasks are still grading.
+        return
+    lock_key = u"grade-report-merge-{}".format(entry_id)
+    if not cache.add(lock_key, "true", SUBTASK_LOCK_EXPIRE):
+        # Another subtask finished at the same time and is merging.
+        return
+    if InstructorTask.objects.get(pk=entry_id).task_state in READY_STATES:
+        # Another subtask has already merged the shards.
+        cache.delete(lock_key)
+        return
+
+    shard_prefix, err_shard_prefix = _grade_report_shard_prefixes(entry_id, report_name)
+    shard_names = []
+    err_shard_names = []
+    try:
+        scratch_store = ReportStore.from_config(scratch=True)
+        scratch_names = [name for name, _url in scratch_store.links_for(course_id)]
+        shard_names = sorted(name for name in scratch_names if name.startswith(shard_prefix))
+        err_shard_names = sorted(name for name in scratch_names if name.startswith(err_shard_prefix))
+
+        if subtask_dict['failed']:
+            # Without all of its shards the report would silently leave students out.
+            raise GradeReportError(
+                u"Grading failed for {} of the {} groups of students, so no grade report was stored.".format(
+                    subtask_dict['failed'], subtask_dict['total']
+                )
+            )
+        if not shard_names:
+            # Storing the report now would overwrite any report stored from these shards with an empty one.
+            raise GradeReportError(u"The graded groups of students could not be found, so no grade report was stored.")
+
+        def merged_rows(names):
+            """
+            Yield the rows of the shards in `names`, keeping only the header of
+            the first shard that has one.
+            """
+            header_written = False
+            for name in names:
+                rows = scratch_store.read_rows(course_id, name)
+                header = next(rows, None)
+                if header is not None and not header_written:
+                    header_written = True
+                    yield header
+                for row in rows:
+                    yield row
+
+        report_store = ReportStore.from_config()
+        report_store.store_rows(course_id, u"{}.csv".format(report_name), merged_rows(shard_names))
+        if err_shard_names:
+            report_store.store_rows(course_id, u"{}_err.csv".format(report_name), merged_rows(err_shard_names))
+    except Exception as exc:  # pylint: disable=broad-except
+        TASK_LOG.exception(u"Grade report %s for instructor task %s could not be stored", report_name, entry_id)
+        entry = InstructorTask.objects.get(pk=entry_id)
+        entry.task_output = InstructorTask.create_output_for_failure(exc, traceback.format_exc())
+        entry.task_state = FAILURE
+        entry.save_now()
+    else:
+        entry = InstructorTask.objects.get(pk=entry_id)
+        entry.task_state = SUCCESS
+        entry.save_now()
+    finally:
+        for name in shard_names + err_shard_names:
+            try:
+                scratch_store.delete(course_id, name)
+            except Exception:  # pylint: disable=broad-except
+                TASK_LOG.exception(u"Could not delete grade report shard %s", name)
+        cache.delete(lock_key)
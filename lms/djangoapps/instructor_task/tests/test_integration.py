@@ -19,6 +19,7 @@ from capa.tests.response_xml_factory import (CodeResponseXMLFactory,
 from xmodule.modulestore.tests.factories import ItemFactory
 
 from courseware.model_data import StudentModule
+from courseware.module_render import get_module_for_descriptor_internal, save_grade
 
 from instructor_task.api import (submit_rescore_problem_for_all_students,
                                  submit_rescore_problem_for_student,
@@ -193,6 +194,71 @@ class TestRescoringTask(TestIntegrationTask):
         self.check_state('u3', descriptor, 1, 2, 1)
         self.check_state('u4', descriptor, 2, 2, 1)
 
+    def test_rescoring_builds_problem_once(self):
+        """Students with the same seed are rescored with a single problem instance"""
+        problem_url_name = 'H1P1'
+        self.define_option_problem(problem_url_name)
+        location = InstructorTaskModuleTestCase.problem_location(problem_url_name)
+        descriptor = self.module_store.get_item(location)
+        self.submit_student_answer('u1', problem_url_name, [OPTION_1, OPTION_1])
+        self.submit_student_answer('u2', problem_url_name, [OPTION_1, OPTION_2])
+        self.submit_student_answer('u3', problem_url_name, [OPTION_2, OPTION_2])
+
+        self.redefine_option_problem(problem_url_name)
+        with patch(
+            'instructor_task.tasks_helper.get_module_for_descriptor_internal', wraps=get_module_for_descriptor_internal
+        ) as mock_get_module:
+            with patch('instructor_task.tasks_helper.save_grade', wraps=save_grade) as mock_save_grade:
+                self.submit_rescore_all_student_answers('instructor', problem_url_name)
+        self.assertEqual(mock_get_module.call_count, 1)
+        # The other students' grades are saved like grades published by the problem
+        self.assertEqual(mock_save_grade.call_count, 2)
+
+        self.check_state('u1', descriptor, 0, 2, 1)
+        self.check_state('u2', descriptor, 1, 2, 1)
+        self.check_state('u3', descriptor, 2, 2, 1)
+
+    def define_student_specific_problem(self, problem_url_name, redefine=False):
+        """
+        Defines a custom response problem whose script uses the student's anonymous id. Answers
+        are only correct if they are the student's anonymous id, or once redefined, if they aren't.
+        """
+        script = textwrap.dedent("""
+                def check_func(expect, answer_given):
+                    return {'ok': (answer_given %s anonymous_student_id), 'msg': ''}
+            """ % ('!=' if redefine else '=='))
+        factory = CustomResponseXMLFactory()
+        problem_xml = factory.build_xml(script=script, cfn="check_func", expect="42", num_responses=1)
+        if redefine:
+            descriptor = self.module_store.get_item(InstructorTaskModuleTestCase.problem_location(problem_url_name))
+            descriptor.data = problem_xml
+            self.module_store.update_item(descriptor, '**replace_user**')
+        else:
+            ItemFactory.create(parent_location=self.problem_section.location,
+                               category="problem",
+                               display_name=str(problem_url_name),
+                               data=problem_xml)
+
+    def test_rescoring_student_specific_problem(self):
+        """Problems whose scripts use the student's anonymous id are built for each student"""
+        problem_url_name = 'H1P1'
+        self.define_student_specific_problem(problem_url_name)
+        location = InstructorTaskModuleTestCase.problem_location(problem_url_name)
+        descriptor = self.module_store.get_item(location)
+        userlist = ['u1', 'u2', 'u3']
+        for username in userlist:
+            self.submit_student_answer(username, problem_url_name, ["wrong", "wrong"])
+            self.check_state(username, descriptor, 0, 1, 1)
+
+        self.define_student_specific_problem(problem_url_name, redefine=True)
+        with patch(
+            'instructor_task.tasks_helper.get_module_for_descriptor_internal', wraps=get_module_for_descriptor_internal
+        ) as mock_get_module:
+            self.submit_rescore_all_student_answers('instructor', problem_url_name)
+        self.assertEqual(mock_get_module.call_count, len(userlist))
+        for username in userlist:
+            self.check_state(username, descriptor, 1, 1, 1)
+
     def test_rescoring_failure(self):
         """Simulate a failure in rescoring a problem"""
         problem_url_name = 'H1P1'
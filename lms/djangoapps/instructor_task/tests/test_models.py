@@ -0,0 +1,99 @@
+"""
+Unit tests for the ReportStore classes in instructor_task.models.
+"""
+import csv
+import os
+import shutil
+from gzip import GzipFile
+from StringIO import StringIO
+from tempfile import mkdtemp
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import Mock
+
+from instructor_task.models import LocalFSReportStore, MultipartUploadWriter, ReportStore
+from xmodule.modulestore.locations import SlashSeparatedCourseKey
+
+
+class TestLocalFSReportStore(TestCase):
+    """Tests for streaming rows into a LocalFSReportStore."""
+
+    def setUp(self):
+        self.root_path = mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root_path)
+        self.report_store = LocalFSReportStore(self.root_path)
+        self.course_id = SlashSeparatedCourseKey("edX", "report", "2014")
+
+    def test_store_rows_from_generator(self):
+        rows = (["row", str(num)] for num in xrange(1000))
+        self.report_store.store_rows(self.course_id, "report.csv", rows)
+
+        with open(self.report_store.path_to(self.course_id, "report.csv")) as report_file:
+            stored_rows = list(csv.reader(report_file))
+        self.assertEqual(stored_rows, [["row", str(num)] for num in xrange(1000)])
+        self.assertEqual([name for name, _ in self.report_store.links_for(self.course_id)], ["report.csv"])
+
+    def test_incomplete_report_not_visible(self):
+        def failing_rows():
+            """Yield a row, then fail the way a grading error would."""
+            yield ["header"]
+            raise ValueError("grading failed")
+
+        with self.assertRaises(ValueError):
+            self.report_store.store_rows(self.course_id, "report.csv", failing_rows())
+
+        self.assertEqual(self.report_store.links_for(self.course_id), [])
+        # The temporary file was cleaned up too
+        self.assertEqual(
+            os.listdir(self.root_path),
+            [os.path.basename(os.path.dirname(self.report_store.path_to(self.course_id, "report.csv")))]
+        )
+
+    def test_read_rows_and_delete(self):
+        rows = [["id", "grade"], ["1", "0.5"]]
+        self.report_store.store_rows(self.course_id, "shard.csv", rows)
+        self.assertEqual(list(self.report_store.read_rows(self.course_id, "shard.csv")), rows)
+
+        self.report_store.delete(self.course_id, "shard.csv")
+        self.assertEqual(self.report_store.links_for(self.course_id), [])
+
+    def test_scratch_files_not_listed(self):
+        with override_settings(GRADES_DOWNLOAD={'STORAGE_TYPE': 'localfs', 'ROOT_PATH': self.root_path}):
+            report_store = ReportStore.from_config()
+            scratch_store = ReportStore.from_config(scratch=True)
+        scratch_store.store_rows(self.course_id, "shard.csv", [["row"]])
+
+        self.assertEqual(report_store.links_for(self.course_id), [])
+        self.assertEqual([name for name, _ in scratch_store.links_for(self.course_id)], ["shard.csv"])
+
+
+class TestMultipartUploadWriter(TestCase):
+    """Tests for splitting streamed report data into multipart upload parts."""
+
+    def setUp(self):
+        self.parts = []
+        self.multipart_upload = Mock()
+        self.multipart_upload.upload_part_from_file.side_effect = (
+            lambda part_file, part_num: self.parts.append((part_num, part_file.read()))
+        )
+
+    def test_parts(self):
+        writer = MultipartUploadWriter(self.multipart_upload, part_size=10)
+        writer.write("a" * 6)
+        self.assertEqual(self.parts, [])
+        writer.write("b" * 6)
+        writer.write("c" * 3)
+        writer.close()
+        self.assertEqual(self.parts, [(1, "aaaaaabbbbbb"), (2, "ccc")])
+
+    def test_gzip_round_trip(self):
+        writer = MultipartUploadWriter(self.multipart_upload, part_size=64)
+        gzip_file = GzipFile(fileobj=writer, mode="wb")
+        csv.writer(gzip_file).writerows(["row", str(num)] for num in xrange(1000))
+        gzip_file.close()
+        writer.close()
+
+        self.assertGreater(len(self.parts), 1)
+        data = GzipFile(fileobj=StringIO("".join(part for _, part in self.parts))).read()
+        self.assertEqual(list(csv.reader(StringIO(data))), [["row", str(num)] for num in xrange(1000)])
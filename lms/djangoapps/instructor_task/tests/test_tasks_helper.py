@@ -0,0 +1,155 @@
+"""
+Unit tests for grading a grade report in subtasks, in instructor_task.tasks_helper.
+"""
+import json
+import shutil
+from tempfile import mkdtemp
+from uuid import uuid4
+
+from celery.states import SUCCESS, FAILURE
+from django.core.cache import cache
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from instructor_task.models import InstructorTask, ReportStore, PROGRESS
+from instructor_task.subtasks import SubtaskStatus, initialize_subtask_info
+from instructor_task.tasks_helper import push_grade_report_shard, _merge_grade_report_shards
+from instructor_task.tests.factories import InstructorTaskFactory
+from student.tests.factories import UserFactory
+
+
+class TestGradeReportShards(TestCase):
+    """Tests for storing grade report shards and merging them into the report."""
+
+    def setUp(self):
+        root_path = mkdtemp()
+        self.addCleanup(shutil.rmtree, root_path)
+        settings_override = override_settings(GRADES_DOWNLOAD={'STORAGE_TYPE': 'localfs', 'ROOT_PATH': root_path})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.students = [UserFactory.create(username='student{}'.format(num)) for num in xrange(4)]
+        # Usernames of the students that can't be graded, or whose grading raises an exception
+        self.ungradable = set()
+        self.crashing = set()
+        patcher = patch('instructor_task.tasks_helper.iterate_grades_for', side_effect=self.fake_grades)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.entry = InstructorTaskFactory.create(task_type='grade_course', task_id=str(uuid4()))
+        self.course_id = self.entry.course_id
+        # Two subtasks, grading the first two and last two students
+        self.shards = [
+            (str(uuid4()), [{'pk': student.pk} for student in self.students[:2]]),
+            (str(uuid4()), [{'pk': student.pk} for student in self.students[2:]]),
+        ]
+        initialize_subtask_info(self.entry, 'graded', len(self.students), [task_id for task_id, _ in self.shards])
+
+    def fake_grades(self, _course_id, students, batch_size=None):  # pylint: disable=unused-argument
+        """Stands in for `iterate_grades_for`, giving every student a 50% grade."""
+        for student in students:
+            if student.username in self.crashing:
+                raise ValueError("Grading crashed")
+            elif student.username in self.ungradable:
+                yield student, {}, "Cannot grade student"
+            else:
+                yield student, {'percent': 0.5, 'section_breakdown': [{'label': u'HW 01', 'percent': 0.5}]}, ""
+
+    def push_shard(self, shard_num):
+        """Run the subtask for one of self.shards."""
+        task_id, to_list = self.shards[shard_num]
+        return push_grade_report_shard(self.entry.id, "report", to_list, SubtaskStatus.create(task_id).to_dict())
+
+    def task_state(self):
+        """The current state of the InstructorTask."""
+        return InstructorTask.objects.get(pk=self.entry.id).task_state
+
+    def report_rows(self, name):
+        """The rows of the stored report `name`."""
+        return list(ReportStore.from_config().read_rows(self.course_id, name))
+
+    def assert_no_shards_left(self):
+        """Check that the scratch shards have all been deleted."""
+        self.assertEqual(ReportStore.from_config(scratch=True).links_for(self.course_id), [])
+
+    def test_merge(self):
+        # Shards finishing out of order are still merged in student order
+        self.push_shard(1)
+        self.assertEqual(self.task_state(), PROGRESS)
+        self.assertEqual(ReportStore.from_config().links_for(self.course_id), [])
+
+        self.push_shard(0)
+        self.assertEqual(self.task_state(), SUCCESS)
+        self.assertEqual(
+            self.report_rows("report.csv"),
+            [["id", "email", "username", "grade", "HW 01"]] + [
+                [str(student.id), student.email, student.username, "0.5", "0.5"] for student in self.students
+            ]
+        )
+        self.assertEqual([name for name, _ in ReportStore.from_config().links_for(self.course_id)], ["report.csv"])
+        self.assert_no_shards_left()
+
+    def test_merge_errors(self):
+        self.ungradable = {'student0', 'student3'}
+        self.push_shard(0)
+        self.push_shard(1)
+
+        self.assertEqual(self.task_state(), SUCCESS)
+        self.assertEqual(len(self.report_rows("report.csv")), 3)
+        self.assertEqual(
+            self.report_rows("report_err.csv"),
+            [["id", "username", "error_msg"]] + [
+                [str(student.id), student.username, "Cannot grade student"]
+                for student in (self.students[0], self.students[3])
+            ]
+        )
+        self.assert_no_shards_left()
+
+    def test_failed_shard_not_merged(self):
+        self.crashing = {'student1'}
+        with self.assertRaises(ValueError):
+            self.push_shard(0)
+        self.push_shard(1)
+
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, FAILURE)
+        self.assertEqual(json.loads(entry.task_output)['exception'], 'GradeReportError')
+        self.assertEqual(ReportStore.from_config().links_for(self.course_id), [])
+        self.assert_no_shards_left()
+
+    def test_merge_failure(self):
+        self.push_shard(0)
+        with patch('instructor_task.models.LocalFSReportStore.read_rows', side_effect=IOError("Unreadable shard")):
+            self.push_shard(1)
+
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, FAILURE)
+        self.assertEqual(json.loads(entry.task_output)['message'], "Unreadable shard")
+        self.assertEqual(ReportStore.from_config().links_for(self.course_id), [])
+        self.assert_no_shards_left()
+        # The merge lock was released
+        self.assertIsNone(cache.get(u"grade-report-merge-{}".format(self.entry.id)))
+
+    def test_merge_twice(self):
+        self.push_shard(0)
+        self.push_shard(1)
+        report = self.report_rows("report.csv")
+
+        # Another subtask which saw every subtask done takes the lock after the first merge
+        _merge_grade_report_shards(self.entry.id, self.course_id, "report")
+        self.assertEqual(self.task_state(), SUCCESS)
+        self.assertEqual(self.report_rows("report.csv"), report)
+
+    def test_no_shards(self):
+        self.push_shard(0)
+        self.push_shard(1)
+        report = self.report_rows("report.csv")
+
+        # Even if the task doesn't look done, a merge without shards doesn't store an empty report
+        InstructorTask.objects.filter(pk=self.entry.id).update(task_state=PROGRESS)
+        _merge_grade_report_shards(self.entry.id, self.course_id, "report")
+        entry = InstructorTask.objects.get(pk=self.entry.id)
+        self.assertEqual(entry.task_state, FAILURE)
+        self.assertEqual(json.loads(entry.task_output)['exception'], 'GradeReportError')
+        self.assertEqual(self.report_rows("report.csv"), report)
@@ -246,6 +246,16 @@ for name, value in ENV_TOKENS.get("CODE_JAIL", {}).items():
         CODE_JAIL[name] = value
 
 COURSES_WITH_UNSAFE_CODE = ENV_TOKENS.get("COURSES_WITH_UNSAFE_CODE", [])
+SAFE_EXEC_LOCAL_CACHE_SIZE = ENV_TOKENS.get("SAFE_EXEC_LOCAL_CACHE_SIZE", SAFE_EXEC_LOCAL_CACHE_SIZE)
+XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES = ENV_TOKENS.get("XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES", XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES)
+XBLOCK_FRAGMENT_CACHE_TIMEOUT = ENV_TOKENS.get("XBLOCK_FRAGMENT_CACHE_TIMEOUT", XBLOCK_FRAGMENT_CACHE_TIMEOUT)
+STUDENT_MODULE_HISTORY_QUEUE.update(ENV_TOKENS.get("STUDENT_MODULE_HISTORY_QUEUE", {}))
+STUDENT_MODULE_HISTORY_SAMPLE_RATE = ENV_TOKENS.get(
+    "STUDENT_MODULE_HISTORY_SAMPLE_RATE", STUDENT_MODULE_HISTORY_SAMPLE_RATE
+)
+STUDENT_MODULE_HISTORY_SKIP_UNCHANGED = ENV_TOKENS.get(
+    "STUDENT_MODULE_HISTORY_SKIP_UNCHANGED", STUDENT_MODULE_HISTORY_SKIP_UNCHANGED
+)
 
 # Event Tracking
 if "TRACKING_IGNORE_URL_PATTERNS" in ENV_TOKENS:
@@ -368,6 +378,9 @@ VERIFY_STUDENT = AUTH_TOKENS.get("VERIFY_STUDENT", VERIFY_STUDENT)
 GRADES_DOWNLOAD_ROUTING_KEY = HIGH_MEM_QUEUE
 
 GRADES_DOWNLOAD = ENV_TOKENS.get("GRADES_DOWNLOAD", GRADES_DOWNLOAD)
+GRADES_DOWNLOAD_BATCH_SIZE = ENV_TOKENS.get("GRADES_DOWNLOAD_BATCH_SIZE", GRADES_DOWNLOAD_BATCH_SIZE)
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = ENV_TOKENS.get("GRADES_DOWNLOAD_STUDENTS_PER_TASK", GRADES_DOWNLOAD_STUDENTS_PER_TASK)
+GRADES_DOWNLOAD_STUDENTS_PER_QUERY = ENV_TOKENS.get("GRADES_DOWNLOAD_STUDENTS_PER_QUERY", GRADES_DOWNLOAD_STUDENTS_PER_QUERY)
 
 ##### ACCOUNT LOCKOUT DEFAULT PARAMETERS #####
 MAX_FAILED_LOGIN_ATTEMPTS_ALLOWED = ENV_TOKENS.get("MAX_FAILED_LOGIN_ATTEMPTS_ALLOWED", 5)
@@ -213,6 +213,29 @@ FEATURES = {
     # whether to use password policy enforcement or not
     'ENFORCE_PASSWORD_POLICY': False,
 
+    # Persist each student's per-section scores and only regrade the sections
+    # whose problems or student state changed since they were last graded.
+    'ENABLE_PERSISTENT_GRADE_CACHE': False,
+
+    # Cache the rendered student_view of the block types in
+    # XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES, whose output doesn't depend on student state.
+    'ENABLE_XBLOCK_FRAGMENT_CACHE': False,
+
+    # Keep per-answer counts for the answer distribution report in the database,
+    # updating them from the StudentModules changed since the last report.
+    'ENABLE_INCREMENTAL_ANSWER_DISTRIBUTION': False,
+
+    # Keep per-module grade histograms up to date as StudentModules are saved, and
+    # use them for the staff debug info and the class dashboard. Run the
+    # rebuild_grade_histograms management command for each course when turning this on.
+    'ENABLE_GRADE_HISTOGRAM_TABLE': False,
+
+    # Write StudentModuleHistory entries in batches from a background thread,
+    # instead of during the request that saves the StudentModule. Entries are
+    # queued once the request's transaction commits, and entries still waiting
+    # to be written when a process dies are lost.
+    'ENABLE_ASYNC_STUDENT_MODULE_HISTORY': False,
+
     # Give course staff unrestricted access to grade downloads (if set to False,
     # only edX superusers can perform the downloads)
     'ALLOW_COURSE_STAFF_GRADE_DOWNLOADS': False,
@@ -413,6 +436,9 @@ TRACKING_BACKENDS = {
     }
 }
 
+# Run on each event once before it's sent to the TRACKING_BACKENDS
+TRACKING_PROCESSORS = []
+
 # We're already logging events, and we don't want to capture user
 # names/passwords.  Heartbeat events are likely not interesting.
 TRACKING_IGNORE_URL_PATTERNS = [r'^/event', r'^/login', r'^/heartbeat']
@@ -487,6 +513,23 @@ XBLOCK_MIXINS = (LmsBlockMixin, InheritanceMixin, XModuleMixin)
 # Allow any XBlock in the LMS
 XBLOCK_SELECT_FUNCTION = prefer_xmodules
 
+# The block types whose rendered student_view is cached when
+# FEATURES['ENABLE_XBLOCK_FRAGMENT_CACHE'] is set, and for how many seconds
+XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES = ('html',)
+XBLOCK_FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Options of the queue (see track.backends.queued.QueuedBackend) that writes
+# StudentModuleHistory entries when FEATURES['ENABLE_ASYNC_STUDENT_MODULE_HISTORY'] is set
+STUDENT_MODULE_HISTORY_QUEUE = {
+    'batch_size': 100,
+    'flush_interval': 1.0,
+    'max_queue_size': 10000,
+}
+# Fraction of the problem StudentModule saves that are kept in StudentModuleHistory
+STUDENT_MODULE_HISTORY_SAMPLE_RATE = 1.0
+# Leave saves that don't change a StudentModule's state or grade out of its history
+STUDENT_MODULE_HISTORY_SKIP_UNCHANGED = False
+
 #################### Python sandbox ############################################
 
 CODE_JAIL = {
@@ -512,6 +555,10 @@ CODE_JAIL = {
 #   ]
 COURSES_WITH_UNSAFE_CODE = []
 
+# How many results of running problems' Python code each process keeps in
+# memory, in front of the shared cache.
+SAFE_EXEC_LOCAL_CACHE_SIZE = 1000
+
 ############################### DJANGO BUILT-INS ###############################
 # Change DEBUG/TEMPLATE_DEBUG in your environment settings files, not here
 DEBUG = False
@@ -784,6 +831,9 @@ MIDDLEWARE_CLASSES = (
     # Detects user-requested locale from 'accept-language' header in http request
     'django.middleware.locale.LocaleMiddleware',
 
+    # Queues StudentModuleHistory entries once the request's transaction is committed,
+    # so it must come before TransactionMiddleware
+    'courseware.middleware.StudentModuleHistoryMiddleware',
     'django.middleware.transaction.TransactionMiddleware',
     # 'debug_toolbar.middleware.DebugToolbarMiddleware',
 
@@ -1328,6 +1378,15 @@ GRADES_DOWNLOAD = {
     'ROOT_PATH': '/tmp/edx-s3/grades',
 }
 
+# Number of students whose courseware state is loaded together when
+# generating grade reports
+GRADES_DOWNLOAD_BATCH_SIZE = 100
+
+# Courses with more enrolled students than this are graded in parallel, by
+# subtasks that each grade at most this many students.
+GRADES_DOWNLOAD_STUDENTS_PER_TASK = 1000
+GRADES_DOWNLOAD_STUDENTS_PER_QUERY = 10000
+
 ######################## PROGRESS SUCCESS BUTTON ##############################
 # The following fields are available in the URL: {course_id} {student_id}
 PROGRESS_SUCCESS_BUTTON_URL = 'http://<domain>/<path>/{course_id}'
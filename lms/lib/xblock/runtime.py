@@ -2,11 +2,16 @@
 Module implementing `xblock.runtime.Runtime` functionality for the LMS
 """
 
+import hashlib
+import json
 import re
 
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 from django.conf import settings
+from django.utils.translation import get_language
 from user_api import user_service
+from xblock.fields import Scope
 from xmodule.modulestore.django import modulestore
 from xmodule.x_module import ModuleSystem
 from xmodule.partitions.partitions_service import PartitionService
@@ -181,11 +186,74 @@ class UserTagsService(object):
                                            self.runtime.course_id, key, value)
 
 
+class FragmentCache(object):
+    """
+    A cache of the student_view fragments of the block types in
+    settings.XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES, whose output doesn't depend on student state.
+
+    Fragments are keyed by the block's usage id, a hash of all of its content and settings
+    field values (inherited ones included), and the language. Changing a block in Studio and
+    publishing it thus changes its key, so nothing needs to be invalidated.
+    """
+    # Blocks whose fields contain this are rendered with the student's anonymous id (see HtmlModule)
+    USER_ID_PLACEHOLDER = '%%USER_ID%%'
+
+    def __init__(self, key_prefix):
+        """
+        key_prefix: identifies everything other than the block which goes into its fragment
+            (e.g., which wrappers the runtime applies)
+        """
+        self.key_prefix = key_prefix
+
+    def _key(self, block):
+        """
+        Return the cache key for the block's student_view, or None if it mustn't be cached
+        """
+        if block.scope_ids.block_type not in settings.XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES:
+            return None
+
+        field_values = json.dumps(
+            dict(
+                (name, field.read_json(block))
+                for name, field in block.fields.iteritems()
+                if field.scope in (Scope.content, Scope.settings)
+            ),
+            sort_keys=True,
+            default=unicode,
+        )
+        if self.USER_ID_PLACEHOLDER in field_values:
+            return None
+
+        key = hashlib.md5()
+        for part in (self.key_prefix, unicode(block.scope_ids.usage_id), field_values, get_language() or ''):
+            key.update(part.encode('utf-8') if isinstance(part, unicode) else part)
+            key.update('\0')
+        return 'xblock_fragment.{}'.format(key.hexdigest())
+
+    def render(self, block, render):
+        """
+        Return the block's cached student_view fragment, or call render and cache what it returns
+        """
+        key = self._key(block)
+        if key is None:
+            return render()
+
+        fragment = cache.get(key)
+        if fragment is None:
+            fragment = render()
+            cache.set(key, fragment, settings.XBLOCK_FRAGMENT_CACHE_TIMEOUT)
+        return fragment
+
+
 class LmsModuleSystem(LmsHandlerUrls, ModuleSystem):  # pylint: disable=abstract-method
     """
     ModuleSystem specialized to the LMS
     """
-    def __init__(self, **kwargs):
+    def __init__(self, fragment_cache=None, **kwargs):
+        """
+        fragment_cache: a FragmentCache for the student_view of blocks rendered by this runtime,
+            or None to always render them
+        """
         services = kwargs.setdefault('services', {})
         services['user_tags'] = UserTagsService(self)
         services['partitions'] = LmsPartitionService(
@@ -194,3 +262,15 @@ class LmsModuleSystem(LmsHandlerUrls, ModuleSystem):  # pylint: disable=abstract
             track_function=kwargs.get('track_function', None),
         )
         super(LmsModuleSystem, self).__init__(**kwargs)
+        self.fragment_cache = fragment_cache
+
+    def render(self, block, view_name, context=None):
+        """
+        See :meth:`xblock.runtime.Runtime.render`. The student_view is looked up in
+        self.fragment_cache first, if there is one.
+        """
+        if self.fragment_cache is None or view_name != 'student_view':
+            return super(LmsModuleSystem, self).render(block, view_name, context)
+        return self.fragment_cache.render(
+            block, lambda: super(LmsModuleSystem, self).render(block, view_name, context)
+        )
@@ -4,12 +4,15 @@ Tests of the LMS XBlock Runtime and associated utilities
 
 from django.contrib.auth.models import User
 from django.conf import settings
+from django.core.cache import cache
+from django.test.utils import override_settings
 from ddt import ddt, data
 from mock import Mock
 from unittest import TestCase
 from urlparse import urlparse
 from xmodule.modulestore.locations import SlashSeparatedCourseKey
-from lms.lib.xblock.runtime import quote_slashes, unquote_slashes, LmsModuleSystem
+from xblock.fields import Scope
+from lms.lib.xblock.runtime import quote_slashes, unquote_slashes, FragmentCache, LmsModuleSystem
 
 TEST_STRINGS = [
     '',
@@ -151,3 +154,41 @@ class TestUserServiceAPI(TestCase):
         # Try to get tag in wrong scope
         with self.assertRaises(ValueError):
             self.runtime.service(self.mock_block, 'user_tags').get_tag('fake_scope', self.key)
+
+
+@override_settings(XBLOCK_FRAGMENT_CACHE_BLOCK_TYPES=('html',))
+class TestFragmentCache(TestCase):
+    """Test caching rendered student_view fragments"""
+
+    def setUp(self):
+        cache.clear()
+        self.fragment_cache = FragmentCache('prefix')
+        self.render = Mock(return_value='<p>rendered</p>')
+
+    def _block(self, data, block_type='html', usage_id='i4x://org/course/html/intro'):
+        """Return a mock block with a content field set to data"""
+        block = Mock()
+        block.scope_ids.block_type = block_type
+        block.scope_ids.usage_id = usage_id
+        field = Mock(scope=Scope.content)
+        field.read_json.return_value = data
+        block.fields = {'data': field}
+        return block
+
+    def test_cached(self):
+        self.fragment_cache.render(self._block('<p>hi</p>'), self.render)
+        self.assertEqual(self.fragment_cache.render(self._block('<p>hi</p>'), self.render), '<p>rendered</p>')
+        self.assertEqual(self.render.call_count, 1)
+
+    def test_changed_content(self):
+        self.fragment_cache.render(self._block('<p>hi</p>'), self.render)
+        self.fragment_cache.render(self._block('<p>bye</p>'), self.render)
+        self.fragment_cache.render(self._block('<p>hi</p>', usage_id='i4x://org/course/html/outro'), self.render)
+        self.assertEqual(self.render.call_count, 3)
+
+    def test_not_cached(self):
+        self.fragment_cache.render(self._block('<p>%%USER_ID%%</p>'), self.render)
+        self.fragment_cache.render(self._block('<p>%%USER_ID%%</p>'), self.render)
+        self.fragment_cache.render(self._block('<p>hi</p>', block_type='problem'), self.render)
+        self.fragment_cache.render(self._block('<p>hi</p>', block_type='problem'), self.render)
+        self.assertEqual(self.render.call_count, 4)